@@ -54,6 +54,42 @@ DEFAULT_CONFIG = {
             },
         },
     },
+    "storage": {
+        "backend": "jsonl",
+        "segment_size": 10000,
+        "durability": "group",
+        "group_commit": {
+            "window_ms": 5,
+            "max_batch": 256,
+        },
+        "cache": {
+            "max_messages": 200000,
+            "max_bytes": 268435456,
+            "pin_seconds": 300,
+            "client_messages": 20000,
+        },
+        "compaction": {
+            "interval_seconds": 60,
+            "min_garbage_bytes": 65536,
+            "garbage_ratio": 0.25,
+        },
+        "users": {
+            "compact_after": 1000,
+        },
+        "warmup": {
+            "channels": [],
+            "threads": False,
+            "workers": 4,
+            "page_size": 100,
+            "wait": False,
+        },
+        "archive": {
+            "after_messages": 50000,
+            "after_days": 90,
+            "codec": "zlib",
+            "block_bytes": 65536,
+        },
+    },
     "websocket": {
         "host": "127.0.0.1",
         "port": 5613,
@@ -55,6 +55,7 @@ AUDIT_CATEGORIES: dict[str, str] = {
     "webhook_create": "server_management",
     "webhook_update": "server_management",
     "webhook_delete": "server_management",
+    "history_import": "server_management",
     "webhook_regenerate": "server_management",
     "plugins_reload": "server_management",
 }
@@ -12,3 +12,4 @@ from . import push
 from . import modlog
 from . import shared
 from . import unreads
+from . import pings
@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from config_store import get_config_value
+
+from . import message_archive
+from .storage import MessageStore
+
+DEFAULT_MAX_MESSAGES = 200000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_PIN_SECONDS = 300
+DEFAULT_COMPACT_MIN_GARBAGE = 64 * 1024
+DEFAULT_COMPACT_GARBAGE_RATIO = 0.25
+DEFAULT_ARCHIVE_AFTER_MESSAGES = 50000
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+
+_lock = threading.RLock()
+# (kind, name) -> {"log": MessageStore, "evict": callable}, least recently used first.
+_entries: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+_recheck = False
+
+
+def _budget() -> Tuple[int, int, float]:
+    return (
+        get_config_value("storage", "cache", "max_messages", default=DEFAULT_MAX_MESSAGES),
+        get_config_value("storage", "cache", "max_bytes", default=DEFAULT_MAX_BYTES),
+        get_config_value("storage", "cache", "pin_seconds", default=DEFAULT_PIN_SECONDS),
+    )
+
+
+def _mark_recheck() -> None:
+    global _recheck
+    _recheck = True
+
+
+def _usage() -> Tuple[int, int]:
+    messages = 0
+    size = 0
+    for entry in _entries.values():
+        m, b = entry["log"].resident()
+        messages += m
+        size += b
+    return messages, size
+
+
+def register(kind: str, name: str, log: MessageStore, evict: Callable[[], None]) -> None:
+    """Track a freshly opened log; ``evict`` drops it from its owner's cache."""
+    key = (kind, name)
+    with _lock:
+        _entries[key] = {"log": log, "evict": evict}
+        _entries.move_to_end(key)
+        log.on_grow = _mark_recheck
+    enforce(exclude=key)
+
+
+def touch(kind: str, name: str) -> None:
+    """Mark a log as most recently used, enforcing the budget if segments were loaded since."""
+    key = (kind, name)
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+    if _recheck:
+        enforce(exclude=key)
+
+
+def forget(kind: str, name: str) -> None:
+    with _lock:
+        _entries.pop((kind, name), None)
+
+
+def forget_kind(kind: str) -> None:
+    with _lock:
+        for key in [k for k in _entries if k[0] == kind]:
+            del _entries[key]
+
+
+def enforce(exclude: Optional[Tuple[str, str]] = None) -> None:
+    """Bring resident messages under budget, coldest logs first.
+
+    Sealed segments of cold logs are unloaded before whole logs are evicted, and a
+    log whose tail was written within ``pin_seconds`` is never evicted. Logs that are
+    busy in another thread, and ``exclude`` (the log about to be used), are skipped.
+    """
+    global _recheck
+    with _lock:
+        _recheck = False
+        max_messages, max_bytes, pin_seconds = _budget()
+        messages, size = _usage()
+        if messages <= max_messages and size <= max_bytes:
+            return
+
+        now = time.monotonic()
+        for key in list(_entries):
+            if messages <= max_messages and size <= max_bytes:
+                break
+            if key == exclude:
+                continue
+            entry = _entries[key]
+            log = entry["log"]
+            if not log.lock.acquire(blocking=False):
+                continue
+            try:
+                before_m, before_b = log.resident()
+                log.trim()
+                after_m, after_b = log.resident()
+                messages -= before_m - after_m
+                size -= before_b - after_b
+                if messages <= max_messages and size <= max_bytes:
+                    break
+                if now - log.last_write < pin_seconds:
+                    continue
+                log.save_search()
+                entry["evict"]()
+                del _entries[key]
+                messages -= after_m
+                size -= after_b
+            finally:
+                log.lock.release()
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        messages, size = _usage()
+        return {"logs": len(_entries), "messages": messages, "bytes": size}
+
+
+def compact_logs() -> int:
+    """Compact every open log carrying enough tombstoned/overlaid bytes; return files rewritten."""
+    min_garbage = get_config_value("storage", "compaction", "min_garbage_bytes", default=DEFAULT_COMPACT_MIN_GARBAGE)
+    garbage_ratio = get_config_value("storage", "compaction", "garbage_ratio", default=DEFAULT_COMPACT_GARBAGE_RATIO)
+    with _lock:
+        logs = [entry["log"] for entry in _entries.values()]
+    return sum(log.compact(min_garbage, garbage_ratio) for log in logs)
+
+
+def archive_logs() -> int:
+    """Move the cold segments of every open log into compressed archives; return how many."""
+    keep_messages = get_config_value("storage", "archive", "after_messages", default=DEFAULT_ARCHIVE_AFTER_MESSAGES)
+    after_days = get_config_value("storage", "archive", "after_days", default=DEFAULT_ARCHIVE_AFTER_DAYS)
+    codec = get_config_value("storage", "archive", "codec", default=message_archive.DEFAULT_CODEC)
+    block_bytes = get_config_value("storage", "archive", "block_bytes", default=message_archive.DEFAULT_BLOCK_BYTES)
+    if codec not in message_archive.CODECS:
+        codec = message_archive.DEFAULT_CODEC
+    with _lock:
+        logs = [entry["log"] for entry in _entries.values()]
+    return sum(log.archive(keep_messages, after_days * 86400, codec, block_bytes) for log in logs)
+
+
+def save_search_indexes() -> int:
+    """Persist the changed full-text indexes of every open log; return files written."""
+    with _lock:
+        logs = [entry["log"] for entry in _entries.values()]
+    return sum(log.save_search() for log in logs)
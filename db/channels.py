@@ -2,25 +2,15 @@ import copy
 import json
 import os
 import threading
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from . import users
+from . import cache_manager, io_executor, storage, users
 from .shared import convert_messages_to_user_format
-from .storage_utils import (
-    find_line_number_grep,
-    count_lines_wc,
-    read_lines_range,
-    get_messages_around_from_file,
-    build_id_index,
-    atomic_write_json,
-)
 
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 channels_db_dir = os.path.join(_MODULE_DIR, "channels")
 channels_index = os.path.join(_MODULE_DIR, "channels.json")
 
-MESSAGE_PADDING_SIZE = 512
-
 DEFAULT_PERMISSIONS = {
     "view": ["owner"],
     "send": ["owner"],
@@ -102,7 +92,7 @@ def _load_channels_index() -> List[dict]:
 
 def _save_channels_index(channels: List[dict]) -> None:
     global _channels_cache, _channels_loaded
-    atomic_write_json(channels_index, channels)
+    io_executor.write_json(channels_index, channels, lock=_global_lock, op="channels")
     _channels_cache = channels
     _channels_loaded = True
     _invalidate_permission_cache()
@@ -114,191 +104,35 @@ def _get_channels_cache() -> List[dict]:
     return _channels_cache
 
 
-_msg_cache: Dict[str, dict] = {}
-
-
-def _load_channel_into_cache(channel_name):
-    channel_file = os.path.join(channels_db_dir, channel_name + ".json")
-    messages = []
-    offsets = []
-    lengths = []
-
-    try:
-        with open(channel_file, "rb") as f:
-            raw = f.read()
-    except FileNotFoundError:
-        _msg_cache[channel_name] = {
-            "messages": [],
-            "id_to_idx": {},
-            "offsets": [],
-            "lengths": [],
-        }
-        return _msg_cache[channel_name]
-
-    if not raw.strip():
-        _msg_cache[channel_name] = {
-            "messages": [],
-            "id_to_idx": {},
-            "offsets": [],
-            "lengths": [],
-        }
-        return _msg_cache[channel_name]
-
-    stripped = raw.lstrip()
-    if stripped.startswith(b"["):
-        try:
-            messages = json.loads(raw.decode("utf-8"))
-        except json.JSONDecodeError:
-            messages = []
-        entry = {
-            "messages": messages,
-            "id_to_idx": build_id_index(messages),
-            "offsets": None,
-            "lengths": None,
-        }
-        _msg_cache[channel_name] = entry
-        _full_rewrite(channel_name)
-        return _msg_cache[channel_name]
-
-    pos = 0
-    for line_bytes in raw.split(b"\n"):
-        content_bytes = line_bytes.rstrip(b"\r")
-        line_str = content_bytes.decode("utf-8").strip()
-        if line_str:
-            try:
-                msg = json.loads(line_str)
-                messages.append(msg)
-                offsets.append(pos)
-                lengths.append(len(content_bytes))
-            except json.JSONDecodeError:
-                pass
-        pos += len(line_bytes) + 1
-
-    _msg_cache[channel_name] = {
-        "messages": messages,
-        "id_to_idx": build_id_index(messages),
-        "offsets": offsets,
-        "lengths": lengths,
-    }
-    return _msg_cache[channel_name]
-
-
-def _get_channel_cache(channel_name):
-    if channel_name not in _msg_cache:
-        _load_channel_into_cache(channel_name)
-    return _msg_cache[channel_name]
-
+_msg_cache: Dict[str, storage.MessageStore] = {}
 
-def _full_rewrite(channel_name):
-    cache = _msg_cache.get(channel_name)
-    if cache is None:
-        return
 
-    messages = cache["messages"]
-    os.makedirs(channels_db_dir, exist_ok=True)
-    channel_file = os.path.join(channels_db_dir, channel_name + ".json")
-    tmp = channel_file + ".tmp"
-
-    lines = [
-        json.dumps(msg, separators=(",", ":"), ensure_ascii=False) for msg in messages
-    ]
-    encoded_lines = [line.encode("utf-8") for line in lines]
-    content_bytes = b"\n".join(encoded_lines)
-
-    with open(tmp, "wb") as f:
-        f.write(content_bytes)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, channel_file)
-
-    offsets = []
-    lengths = []
-    pos = 0
-    for lb in encoded_lines:
-        offsets.append(pos)
-        lengths.append(len(lb))
-        pos += len(lb) + 1
-
-    cache["offsets"] = offsets
-    cache["lengths"] = lengths
-
-
-def _rebuild_offsets(channel_name):
-    cache = _msg_cache.get(channel_name)
-    if cache is None:
-        return
-
-    channel_file = os.path.join(channels_db_dir, channel_name + ".json")
-    offsets = []
-    lengths = []
-    try:
-        with open(channel_file, "rb") as f:
-            raw = f.read()
-    except OSError:
-        return
-
-    pos = 0
-    for line_bytes in raw.split(b"\n"):
-        content_bytes = line_bytes.rstrip(b"\r")
-        if content_bytes.strip():
-            offsets.append(pos)
-            lengths.append(len(content_bytes))
-        pos += len(line_bytes) + 1
-
-    cache["offsets"] = offsets
-    cache["lengths"] = lengths
-
-
-def _patch_line_in_place(channel_name, idx, new_serialised):
-    cache = _msg_cache.get(channel_name)
-    if cache is None or cache["offsets"] is None:
-        return False
-
-    offsets = cache["offsets"]
-    lengths = cache["lengths"]
+def _channel_file(channel_name: str) -> str:
+    return os.path.join(channels_db_dir, channel_name + ".json")
 
-    if idx >= len(offsets):
-        return False
-
-    new_bytes = new_serialised.encode("utf-8")
-    orig_len = lengths[idx]
-
-    if len(new_bytes) > orig_len:
-        return False
 
-    padding = orig_len - len(new_bytes)
-    if padding > 0:
-        new_bytes = new_bytes + b" " * padding
+def _load_channel_into_cache(channel_name):
+    log = storage.open_log("channel", channel_name, _channel_file(channel_name), lock=_get_channel_lock(channel_name))
+    _msg_cache[channel_name] = log
+    cache_manager.register("channel", channel_name, log, lambda: _evict_channel(channel_name, log))
+    return log
 
-    channel_file = os.path.join(channels_db_dir, channel_name + ".json")
-    try:
-        with open(channel_file, "r+b") as f:
-            f.seek(offsets[idx])
-            f.write(new_bytes)
-            f.flush()
-            os.fsync(f.fileno())
-        return True
-    except OSError:
-        return False
 
+def _evict_channel(channel_name, log):
+    if _msg_cache.get(channel_name) is log:
+        del _msg_cache[channel_name]
 
-def _read_channel_file(channel_name):
-    return list(_get_channel_cache(channel_name)["messages"])
 
-
-def _write_channel_file(channel_name, messages):
-    with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        old_messages = cache["messages"]
-        old_id_to_idx = cache["id_to_idx"]
-        cache["messages"] = messages
-        cache["id_to_idx"] = build_id_index(messages)
-        try:
-            _full_rewrite(channel_name)
-        except Exception:
-            cache["messages"] = old_messages
-            cache["id_to_idx"] = old_id_to_idx
-            raise
+def _get_channel_cache(channel_name) -> storage.MessageStore:
+    log = _msg_cache.get(channel_name)
+    if log is None:
+        with _get_channel_lock(channel_name):
+            log = _msg_cache.get(channel_name)
+            if log is None:
+                return _load_channel_into_cache(channel_name)
+    log.recover()
+    cache_manager.touch("channel", channel_name)
+    return log
 
 
 def _ensure_storage():
@@ -342,132 +176,63 @@ def get_channel(channel_name):
 
 def get_channel_messages(channel_name, start, limit):
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        channel_data = cache["messages"]
-
-        if not channel_data:
-            return []
-
         if not limit:
             limit = 100
         if limit > 200:
             limit = 200
-
-        if isinstance(start, int):
-            if start < 0:
-                start = 0
-            end = len(channel_data) - start
-            begin = max(0, end - limit)
-        else:
-            idx = cache["id_to_idx"].get(start)
-            if idx is None:
-                return []
-            end = idx
-            begin = max(0, end - limit)
-
-        channel_data_len = len(channel_data)
-        if begin > channel_data_len:
-            return []
-        end = min(end, channel_data_len)
-        begin = max(begin, 0)
-        end = max(end, 0)
-
-        if begin == end:
-            return []
-
-        return list(channel_data[begin:end])
+        return _get_channel_cache(channel_name).page(start, limit)
 
 
 def get_all_channel_messages(channel_name):
     """Return all messages for a channel without the 200-message limit cap."""
-    with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        channel_data = cache["messages"]
-        if not channel_data:
-            return []
-        return [msg.copy() for msg in channel_data]
+    return list(_get_channel_cache(channel_name).iter_messages())
+
+
+def iter_channel_messages(channel_name: str, after_seq: int = 0) -> Iterator[dict]:
+    """Yield a channel's messages oldest first, without loading the whole history
+    into memory; with ``after_seq`` only those with a higher sequence number."""
+    return _get_channel_cache(channel_name).iter_messages(after_seq=after_seq)
 
 
 def get_channel_messages_around(
     channel_name: str, message_id: str, above: int = 50, below: int = 50
 ) -> Tuple[Optional[List[dict]], Optional[int], Optional[int]]:
-    channel_file = os.path.join(channels_db_dir, channel_name + ".json")
-    return get_messages_around_from_file(channel_file, message_id, above, below)
+    with _get_channel_lock(channel_name):
+        log = _msg_cache.get(channel_name)
+        if log is None:
+            return storage.read_around("channel", channel_name, _channel_file(channel_name), message_id, above, below)
+        cache_manager.touch("channel", channel_name)
+        return log.around(message_id, above, below)
+
+
+def get_channel_messages_before(channel_name: str, timestamp: float, limit: int = 50) -> List[dict]:
+    """Return up to ``limit`` messages sent before ``timestamp``, oldest first."""
+    with _get_channel_lock(channel_name):
+        return _get_channel_cache(channel_name).before(timestamp, max(1, min(limit, 200)))
 
 
-def save_channel_message(channel_name, message, sync: bool = True):
+def get_channel_messages_after(channel_name: str, timestamp: float, limit: int = 50) -> List[dict]:
+    """Return up to ``limit`` messages sent at or after ``timestamp``, oldest first."""
+    with _get_channel_lock(channel_name):
+        return _get_channel_cache(channel_name).after(timestamp, max(1, min(limit, 200)))
+
+
+def save_channel_message(channel_name, message, sync=None):
     """Save a message to a channel.
 
     Args:
         channel_name: Name of the channel
         message: Message dict to save
-        sync: If True, fsync to disk (slower but safer). If False, rely on OS buffering (faster).
-    """
-    channel_file = os.path.join(channels_db_dir, channel_name + ".json")
-    os.makedirs(channels_db_dir, exist_ok=True)
+        sync: Durability policy. "fsync" (or True) syncs this write before returning,
+            "group" batches it with other writes into one fsync a few milliseconds later,
+            "buffered" (or False) relies on OS buffering. None uses storage.durability.
 
+    Returns:
+        A concurrent.futures.Future that resolves to True once the message is durable
+        under that policy. Async callers can await it with asyncio.wrap_future.
+    """
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-
-        serialised = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
-        serialised_bytes = serialised.encode("utf-8")
-        padded_bytes = serialised_bytes + b" " * MESSAGE_PADDING_SIZE
-
-        try:
-            with open(channel_file, "rb") as f:
-                first_byte = f.read(1)
-        except FileNotFoundError:
-            first_byte = None
-
-        if first_byte == b"[":
-            messages.append(message)
-            cache["id_to_idx"][message["id"]] = len(messages) - 1
-            try:
-                _full_rewrite(channel_name)
-            except Exception:
-                messages.pop()
-                cache["id_to_idx"].pop(message["id"], None)
-                raise
-        elif first_byte is not None:
-            new_offset = None
-            if cache["offsets"] is not None:
-                if messages:
-                    new_offset = cache["offsets"][-1] + cache["lengths"][-1] + 1
-                else:
-                    new_offset = 0
-
-            prefix = b"\n" if messages else b""
-            with open(channel_file, "ab") as f:
-                f.write(prefix + padded_bytes)
-                if sync:
-                    f.flush()
-                    os.fsync(f.fileno())
-
-            idx = len(messages)
-            messages.append(message)
-            cache["id_to_idx"][message["id"]] = idx
-            if cache["offsets"] is not None and new_offset is not None:
-                cache["offsets"].append(new_offset)
-                cache["lengths"].append(len(padded_bytes))
-            elif cache["offsets"] is None:
-                _rebuild_offsets(channel_name)
-        else:
-            tmp = channel_file + ".tmp"
-            with open(tmp, "wb") as f:
-                f.write(padded_bytes)
-                if sync:
-                    f.flush()
-                    os.fsync(f.fileno())
-            os.replace(tmp, channel_file)
-
-            messages.append(message)
-            cache["id_to_idx"][message["id"]] = 0
-            if cache["offsets"] is not None:
-                cache["offsets"] = [0]
-                cache["lengths"] = [len(padded_bytes)]
-
-        return True
+        return _get_channel_cache(channel_name).append(message, sync=sync)
 
 
 def get_all_channels():
@@ -576,191 +341,117 @@ def delete_channel(channel_name):
 
         _save_channels_index(channels)
 
-        channel_file = os.path.join(channels_db_dir, channel_name + ".json")
-        if os.path.exists(channel_file):
-            os.remove(channel_file)
-
-        if channel_name in _msg_cache:
-            del _msg_cache[channel_name]
+        with _get_channel_lock(channel_name):
+            _get_channel_cache(channel_name).destroy()
+            _msg_cache.pop(channel_name, None)
+            cache_manager.forget("channel", channel_name)
 
         return True
 
 
 def edit_channel_message(channel_name, message_id, new_content, embeds=None):
-    with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-        idx = cache["id_to_idx"].get(message_id)
-
-        if idx is None:
-            return False
-
-        messages[idx] = messages[idx].copy()
-        messages[idx]["content"] = new_content
-        messages[idx]["edited"] = True
+    def mutate(msg):
+        msg["content"] = new_content
+        msg["edited"] = True
         if embeds is not None:
-            messages[idx]["embeds"] = embeds
-
-        serialised = json.dumps(
-            messages[idx], separators=(",", ":"), ensure_ascii=False
-        )
-
-        if not _patch_line_in_place(channel_name, idx, serialised):
-            _full_rewrite(channel_name)
-
+            msg["embeds"] = embeds
         return True
 
-
-def delete_channel_message(channel_name, message_id):
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-        idx = cache["id_to_idx"].get(message_id)
-
-        if idx is None:
-            return False
+        return _get_channel_cache(channel_name).update(message_id, mutate)
 
-        messages.pop(idx)
-        cache["id_to_idx"] = build_id_index(messages)
-        _full_rewrite(channel_name)
 
-        return True
+def delete_channel_message(channel_name, message_id):
+    with _get_channel_lock(channel_name):
+        return _get_channel_cache(channel_name).delete(message_id)
 
 
 def get_message_by_id(channel_name, message_id):
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        idx = cache["id_to_idx"].get(message_id)
-        if idx is None:
-            return None
-        return cache["messages"][idx].copy()
+        return _get_channel_cache(channel_name).get(message_id)
 
 
 def add_reaction_to_message(channel_name, message_id, emoji, user_id):
-    with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-        idx = cache["id_to_idx"].get(message_id)
-
-        if idx is None:
+    def mutate(msg):
+        reactions = {k: list(v) for k, v in msg.get("reactions", {}).items()}
+        if user_id in reactions.get(emoji, []):
             return False
-
-        msg = messages[idx] = messages[idx].copy()
-        if "reactions" not in msg:
-            msg["reactions"] = {}
-
-        if emoji not in msg["reactions"]:
-            msg["reactions"][emoji] = []
-
-        if user_id in msg["reactions"][emoji]:
-            return False
-
-        msg["reactions"][emoji].append(user_id)
-
-        serialised = json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
-        if not _patch_line_in_place(channel_name, idx, serialised):
-            _full_rewrite(channel_name)
-
+        reactions.setdefault(emoji, []).append(user_id)
+        msg["reactions"] = reactions
         return True
 
-
-def remove_reaction_from_message(channel_name, message_id, emoji, user_id):
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-        idx = cache["id_to_idx"].get(message_id)
+        return _get_channel_cache(channel_name).update(message_id, mutate)
 
-        if idx is None:
-            return False
 
-        msg = messages[idx] = messages[idx].copy()
-        if "reactions" not in msg or emoji not in msg["reactions"]:
+def remove_reaction_from_message(channel_name, message_id, emoji, user_id):
+    def mutate(msg):
+        if user_id not in msg.get("reactions", {}).get(emoji, []):
             return False
+        reactions = {k: list(v) for k, v in msg["reactions"].items()}
+        reactions[emoji].remove(user_id)
+        if not reactions[emoji]:
+            del reactions[emoji]
+        if reactions:
+            msg["reactions"] = reactions
+        else:
+            del msg["reactions"]
+        return True
 
-        if user_id in msg["reactions"][emoji]:
-            msg["reactions"][emoji].remove(user_id)
-            if not msg["reactions"][emoji]:
-                del msg["reactions"][emoji]
-            if not msg["reactions"]:
-                del msg["reactions"]
-
-            serialised = json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
-            if not _patch_line_in_place(channel_name, idx, serialised):
-                _full_rewrite(channel_name)
-
-            return True
-
-        return False
-
-
-def pin_channel_message(channel_name, message_id):
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-        idx = cache["id_to_idx"].get(message_id)
-
-        if idx is None:
-            return False
-
-        messages[idx] = messages[idx].copy()
-        messages[idx]["pinned"] = True
+        return _get_channel_cache(channel_name).update(message_id, mutate)
 
-        serialised = json.dumps(
-            messages[idx], separators=(",", ":"), ensure_ascii=False
-        )
-        if not _patch_line_in_place(channel_name, idx, serialised):
-            _full_rewrite(channel_name)
 
+def _set_pinned(channel_name, message_id, pinned):
+    def mutate(msg):
+        msg["pinned"] = pinned
         return True
 
-
-def unpin_channel_message(channel_name, message_id):
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-        idx = cache["id_to_idx"].get(message_id)
+        return _get_channel_cache(channel_name).update(message_id, mutate)
 
-        if idx is None:
-            return False
 
-        messages[idx] = messages[idx].copy()
-        messages[idx]["pinned"] = False
+def pin_channel_message(channel_name, message_id):
+    return _set_pinned(channel_name, message_id, True)
 
-        serialised = json.dumps(
-            messages[idx], separators=(",", ":"), ensure_ascii=False
-        )
-        if not _patch_line_in_place(channel_name, idx, serialised):
-            _full_rewrite(channel_name)
 
-        return True
+def unpin_channel_message(channel_name, message_id):
+    return _set_pinned(channel_name, message_id, False)
 
 
 def get_pinned_messages(channel_name):
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        return [msg.copy() for msg in reversed(cache["messages"]) if msg.get("pinned")]
+        return _get_channel_cache(channel_name).pinned_messages()
 
 
 def reload_channels():
     global _channels_loaded, _msg_cache
+    # The cache is ahead of the file until queued writes land.
+    io_executor.flush(channels_index)
     _channels_loaded = False
     _msg_cache = {}
+    cache_manager.forget_kind("channel")
     return _get_channels_cache()
 
 
 def get_channel_message_count(channel_name):
+    return _get_channel_cache(channel_name).count()
+
+
+def get_channel_message_seq(channel_name, message_id):
+    """Return the sequence number of a message, or None if it is not in the channel."""
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        return len(cache["messages"])
+        return _get_channel_cache(channel_name).seq_of(message_id)
 
 
-def get_channel_message(channel_name, message_id):
+def count_channel_messages_after(channel_name, seq):
+    """Return how many messages in the channel were sent after sequence number ``seq``."""
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        idx = cache["id_to_idx"].get(message_id)
-        if idx is None:
-            return None
-        return cache["messages"][idx].copy()
+        return _get_channel_cache(channel_name).count_after(seq)
+
+
+def get_channel_message(channel_name, message_id):
+    return get_message_by_id(channel_name, message_id)
 
 
 def can_user_react(channel_name, user_roles):
@@ -843,32 +534,20 @@ def can_user_pin(channel_name, user_roles):
     return False
 
 
-def search_channel_messages(channel_name, query, limit=50):
+def search_channel_messages(channel_name, query, limit=50, before=None):
+    """Return messages matching ``query``, newest first.
+
+    Bare words match as prefixes and quoted phrases match exactly; ``before`` is a
+    message id to continue from (results older than it).
+    """
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-        results = []
-        query_lower = query.lower()
-        for msg in reversed(messages):
-            content = msg.get("content", "")
-            if query_lower in content.lower():
-                results.append(msg.copy())
-                if len(results) >= limit:
-                    break
-        return results
-
-
-def get_message_replies(channel_name, message_id, limit=50):
+        return _get_channel_cache(channel_name).search(query, limit, before)
+
+
+def get_message_replies(channel_name, message_id, limit=50, after=None):
+    """Return replies to a message, oldest first, continuing after reply id ``after``."""
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-        replies = []
-        for msg in messages:
-            if msg.get("reply_to", {}).get("id") == message_id:
-                replies.append(msg.copy())
-                if len(replies) >= limit:
-                    break
-        return replies
+        return _get_channel_cache(channel_name).replies(message_id, limit, after)
 
 
 def add_reaction(channel_name, message_id, emoji, user_id):
@@ -892,12 +571,5 @@ def set_channel_permissions(channel_name, permissions):
 
 def purge_messages(channel_name, count=None):
     with _get_channel_lock(channel_name):
-        cache = _get_channel_cache(channel_name)
-        messages = cache["messages"]
-        if count is None:
-            messages.clear()
-        else:
-            del messages[:count]
-        cache["id_to_idx"] = build_id_index(messages)
-        _full_rewrite(channel_name)
+        _get_channel_cache(channel_name).purge(count)
         return True
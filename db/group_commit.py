@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple, Union
+
+from config_store import get_config_value
+from logger import Logger
+
+DURABILITY_FSYNC = "fsync"
+DURABILITY_GROUP = "group"
+DURABILITY_BUFFERED = "buffered"
+DURABILITY_POLICIES = (DURABILITY_FSYNC, DURABILITY_GROUP, DURABILITY_BUFFERED)
+
+DEFAULT_WINDOW_MS = 5
+DEFAULT_MAX_BATCH = 256
+
+# _io_lock is always taken before _cond; holding it means no batch is half-written.
+_io_lock = threading.Lock()
+_cond = threading.Condition()
+_pending: Dict[str, List[Tuple[bytes, Future]]] = {}
+_pending_count = 0
+_writer: Optional[threading.Thread] = None
+
+
+def resolve_durability(sync: Union[bool, str, None]) -> str:
+    """Map the ``sync`` argument of the save functions to a durability policy.
+
+    True and False keep their old meaning (fsync every write / rely on OS buffering);
+    None uses ``storage.durability`` from the config.
+    """
+    if sync is True:
+        return DURABILITY_FSYNC
+    if sync is False:
+        return DURABILITY_BUFFERED
+    if sync is None:
+        sync = get_config_value("storage", "durability", default=DURABILITY_GROUP)
+    return sync if sync in DURABILITY_POLICIES else DURABILITY_GROUP
+
+
+def done(result=True) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def submit(path: str, data: bytes) -> Future:
+    """Queue ``data`` to be appended to ``path``; the future resolves once it is fsynced."""
+    global _pending_count
+    future = Future()
+    with _cond:
+        _ensure_writer()
+        _pending.setdefault(path, []).append((data, future))
+        _pending_count += 1
+        _cond.notify()
+    return future
+
+
+def flush(path: Optional[str] = None) -> None:
+    """Write out queued appends now, for one file or for all of them.
+
+    Anything that reads, rewrites, renames or patches a file with queued appends must
+    flush it first so that those bytes land before its own change.
+    """
+    global _pending, _pending_count
+    with _io_lock:
+        with _cond:
+            if path is None:
+                batch, _pending = _pending, {}
+            else:
+                items = _pending.pop(path, None)
+                batch = {path: items} if items else {}
+            _pending_count -= sum(len(items) for items in batch.values())
+        _write_batch(batch)
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        _writer = threading.Thread(target=_writer_loop, name="group-commit", daemon=True)
+        _writer.start()
+
+
+def _write_batch(batch: Dict[str, List[Tuple[bytes, Future]]]) -> None:
+    for path, items in batch.items():
+        try:
+            with open(path, "ab") as f:
+                f.write(b"".join(data for data, _ in items))
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            Logger.error(f"Group commit to {path} failed: {e}")
+            for _, future in items:
+                future.set_exception(e)
+            continue
+        for _, future in items:
+            future.set_result(True)
+
+
+def _writer_loop() -> None:
+    global _pending, _pending_count
+    while True:
+        with _cond:
+            while not _pending:
+                _cond.wait()
+        window = get_config_value("storage", "group_commit", "window_ms", default=DEFAULT_WINDOW_MS) / 1000
+        max_batch = get_config_value("storage", "group_commit", "max_batch", default=DEFAULT_MAX_BATCH)
+        deadline = time.monotonic() + window
+        with _cond:
+            while _pending_count < max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                _cond.wait(remaining)
+        with _io_lock:
+            with _cond:
+                batch, _pending = _pending, {}
+                _pending_count = 0
+            _write_batch(batch)
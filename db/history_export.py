@@ -0,0 +1,193 @@
+import gzip
+import json
+import lzma
+import time
+from itertools import islice
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, Tuple
+
+from . import channels, threads
+
+FORMAT_VERSION = 1
+HEADER_KEY = "_export"
+COMPRESSIONS = ("none", "gzip", "xz")
+DEFAULT_BATCH_SIZE = 500
+
+
+def compression_for(path: str) -> str:
+    """Pick the compression of an export file from its name (.gz, .xz, else none)."""
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".xz"):
+        return "xz"
+    return "none"
+
+
+def open_export(path: str, mode: str = "rb", compression: Optional[str] = None) -> BinaryIO:
+    """Open an export file for reading ("rb"), writing ("wb") or resuming ("ab").
+
+    Compressed files are streams of independent members, so appending to one on
+    resume produces a file that still reads back as a whole.
+    """
+    compression = compression or compression_for(path)
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "xz":
+        return lzma.open(path, mode)
+    return open(path, mode)
+
+
+def history_exists(kind: str, name: str) -> bool:
+    if kind == "thread":
+        return threads.get_thread(name) is not None
+    return channels.get_channel(name) is not None
+
+
+def iter_history(kind: str, name: str, after_seq: int = 0) -> Iterator[dict]:
+    """Yield a channel's or thread's messages oldest first, one stored file at a time.
+
+    Memory use is bounded by the size of a segment, not of the history. With
+    ``after_seq`` the history is resumed after that sequence number.
+    """
+    if kind == "thread":
+        return threads.iter_thread_messages(name, after_seq)
+    return channels.iter_channel_messages(name, after_seq)
+
+
+def _seq_of(kind: str, name: str, message_id: str):
+    if kind == "thread":
+        return threads.get_thread_message_seq(name, message_id)
+    return channels.get_channel_message_seq(name, message_id)
+
+
+def _append(kind: str, name: str, message: dict, sync=None):
+    if kind == "thread":
+        return threads.save_thread_message(name, message, sync=sync)
+    return channels.save_channel_message(name, message, sync=sync)
+
+
+def _pace(started: float, count: int, max_rate: float) -> None:
+    """Sleep so that ``count`` messages since ``started`` stay under ``max_rate`` per second.
+
+    Even without a rate limit the thread yields between batches, so a transfer
+    running next to the server never holds a history's lock for long stretches.
+    """
+    delay = started + count / max_rate - time.monotonic() if max_rate > 0 else 0
+    time.sleep(max(delay, 0))
+
+
+def read_page(kind: str, name: str, after_seq: int = 0, limit: int = DEFAULT_BATCH_SIZE) -> Tuple[list, int, bool]:
+    """Return (messages, cursor, done): up to ``limit`` messages after ``after_seq``.
+
+    ``cursor`` is the sequence number to pass as ``after_seq`` for the next page, and
+    ``done`` tells whether the history has been read to its end.
+    """
+    messages = list(islice(iter_history(kind, name, after_seq), limit + 1))
+    done = len(messages) <= limit
+    messages = messages[:limit]
+    cursor = messages[-1].get("seq", after_seq) if messages else after_seq
+    return messages, cursor, done
+
+
+def export_history(
+    kind: str,
+    name: str,
+    out: BinaryIO,
+    after_seq: int = 0,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_rate: float = 0,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[int, int]:
+    """Write a history to ``out`` as NDJSON, one message per line; return (messages, cursor).
+
+    A fresh export (``after_seq`` 0) starts with a header line keyed ``_export``.
+    After each batch is written ``on_batch(exported, cursor)`` is called, where
+    ``cursor`` is the sequence number to resume after. ``max_rate`` caps messages per
+    second so an export can run against a live server.
+    """
+    if not after_seq:
+        header = {"version": FORMAT_VERSION, "kind": kind, "name": name, "exported_at": time.time()}
+        out.write(json.dumps({HEADER_KEY: header}).encode("utf-8") + b"\n")
+
+    exported = 0
+    cursor = after_seq
+    started = time.monotonic()
+    messages = iter_history(kind, name, after_seq)
+    while True:
+        batch = list(islice(messages, max(1, batch_size)))
+        if not batch:
+            break
+        out.write(b"".join(
+            json.dumps(msg, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+            for msg in batch
+        ))
+        out.flush()
+        exported += len(batch)
+        cursor = batch[-1].get("seq", cursor)
+        if on_batch is not None:
+            on_batch(exported, cursor)
+        _pace(started, exported, max_rate)
+    return exported, cursor
+
+
+def read_export(stream: BinaryIO) -> Iterator[dict]:
+    """Yield the messages of an NDJSON export, skipping header lines."""
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e}")
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {number} is not a message object")
+        if HEADER_KEY in record:
+            continue
+        yield record
+
+
+def import_history(
+    kind: str,
+    name: str,
+    messages: Iterable[dict],
+    after_seq: int = 0,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_rate: float = 0,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[int, int]:
+    """Append exported messages to a history in order; return (messages, cursor).
+
+    Messages keep their ids and contents and get new sequence numbers in the target.
+    A message whose id the target already holds is skipped, so importing the same
+    messages twice (a retried batch, or one without source sequence numbers) adds
+    them once. ``cursor`` is the source sequence number of the last message read;
+    messages at or below ``after_seq`` are skipped, which resumes an interrupted
+    import. Each batch is durable before ``on_batch(imported, cursor)`` reports it.
+    """
+    imported = 0
+    cursor = after_seq
+    started = time.monotonic()
+    messages = iter(messages)
+    while True:
+        batch = list(islice(messages, max(1, batch_size)))
+        if not batch:
+            break
+        pending = None
+        for message in batch:
+            if not isinstance(message.get("id"), str):
+                raise ValueError("Every imported message needs a string id")
+            source_seq = message.pop("seq", None)
+            if isinstance(source_seq, int) and source_seq <= after_seq:
+                continue
+            if isinstance(source_seq, int):
+                cursor = source_seq
+            if _seq_of(kind, name, message["id"]) is not None:
+                continue
+            pending = _append(kind, name, message, sync="group")
+            imported += 1
+        if pending is not None:
+            pending.result()
+        if on_batch is not None:
+            on_batch(imported, cursor)
+        _pace(started, imported, max_rate)
+    return imported, cursor
@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from logger import Logger
+
+# _io_lock is always taken before _cond; holding it means no write is half-done.
+_io_lock = threading.Lock()
+_cond = threading.Condition()
+# path -> pending write, oldest first. A newer write to a queued path replaces its
+# data, so a burst of updates to one document costs a single write.
+_pending: "OrderedDict[str, dict]" = OrderedDict()
+_writer: Optional[threading.Thread] = None
+_stats: Dict[str, dict] = {}
+
+
+def write_json(path: str, data, lock=None, op: Optional[str] = None, indent: int = 2) -> Future:
+    """Queue ``data`` to be written to ``path`` as JSON by the storage writer thread.
+
+    The file is replaced atomically and fsynced, as ``atomic_write_json`` does, but
+    the caller does not wait for it; the returned future resolves once the write is
+    on disk. ``data`` is serialised when it is written, holding ``lock`` (the lock
+    guarding it in the owning module), so callers pass their live cache rather than
+    a copy. ``op`` names the operation in ``stats`` (the file name by default).
+    """
+    future = Future()
+    with _cond:
+        _ensure_writer()
+        entry = _pending.get(path)
+        if entry is None:
+            _pending[path] = {
+                "data": data,
+                "lock": lock,
+                "op": op or os.path.basename(path),
+                "indent": indent,
+                "futures": [future],
+                "queued": time.monotonic(),
+            }
+        else:
+            entry["data"] = data
+            entry["lock"] = lock
+            entry["futures"].append(future)
+            _op_stats(entry["op"])["coalesced"] += 1
+        _cond.notify()
+    return future
+
+
+def flush(path: Optional[str] = None) -> None:
+    """Write out queued writes now, for one file or for all of them.
+
+    Used at shutdown so nothing queued is lost. The caller must not hold a lock that
+    was passed to ``write_json``, since the writer may be waiting for it.
+    """
+    with _io_lock:
+        with _cond:
+            if path is None:
+                batch = list(_pending.items())
+                _pending.clear()
+            else:
+                entry = _pending.pop(path, None)
+                batch = [(path, entry)] if entry is not None else []
+        for item_path, entry in batch:
+            _write(item_path, entry)
+
+
+def pending() -> int:
+    with _cond:
+        return len(_pending)
+
+
+def stats() -> Dict[str, dict]:
+    """Per-operation counts and latencies (milliseconds) of the writes done so far.
+
+    ``queue`` is the time a write waited between being queued and starting, which is
+    where a backlog shows up; ``write`` is the time spent serialising and fsyncing.
+    """
+    with _cond:
+        result = {}
+        for op, s in _stats.items():
+            writes = s["writes"] or 1
+            result[op] = {
+                "writes": s["writes"],
+                "coalesced": s["coalesced"],
+                "errors": s["errors"],
+                "queue_ms_avg": round(s["queue_ms"] / writes, 3),
+                "queue_ms_max": round(s["queue_ms_max"], 3),
+                "write_ms_avg": round(s["write_ms"] / writes, 3),
+                "write_ms_max": round(s["write_ms_max"], 3),
+            }
+        return result
+
+
+def _op_stats(op: str) -> dict:
+    s = _stats.get(op)
+    if s is None:
+        s = _stats[op] = {
+            "writes": 0, "coalesced": 0, "errors": 0,
+            "queue_ms": 0.0, "queue_ms_max": 0.0, "write_ms": 0.0, "write_ms_max": 0.0,
+        }
+    return s
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        _writer = threading.Thread(target=_writer_loop, name="storage-io", daemon=True)
+        _writer.start()
+
+
+def _write(path: str, entry: dict) -> None:
+    started = time.monotonic()
+    error = None
+    try:
+        if entry["lock"] is not None:
+            with entry["lock"]:
+                payload = json.dumps(entry["data"], indent=entry["indent"])
+        else:
+            payload = json.dumps(entry["data"], indent=entry["indent"])
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except Exception as e:
+        error = e
+        Logger.error(f"Storage write to {path} failed: {e}")
+    finished = time.monotonic()
+
+    with _cond:
+        s = _op_stats(entry["op"])
+        queue_ms = (started - entry["queued"]) * 1000
+        write_ms = (finished - started) * 1000
+        s["writes"] += 1
+        s["errors"] += error is not None
+        s["queue_ms"] += queue_ms
+        s["queue_ms_max"] = max(s["queue_ms_max"], queue_ms)
+        s["write_ms"] += write_ms
+        s["write_ms_max"] = max(s["write_ms_max"], write_ms)
+
+    futures: List[Future] = entry["futures"]
+    for future in futures:
+        if error is None:
+            future.set_result(True)
+        else:
+            future.set_exception(error)
+
+
+def _writer_loop() -> None:
+    while True:
+        with _cond:
+            while not _pending:
+                _cond.wait()
+        with _io_lock:
+            with _cond:
+                if not _pending:
+                    continue
+                path, entry = _pending.popitem(last=False)
+            _write(path, entry)
@@ -0,0 +1,185 @@
+import bisect
+import json
+import lzma
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+SUFFIX = ".jsonz"
+_MAGIC = b"OCAZ"
+_VERSION = 1
+CODECS = ("zlib", "lzma")
+DEFAULT_CODEC = "zlib"
+DEFAULT_BLOCK_BYTES = 64 * 1024
+# magic, version, codec number
+_HEADER = struct.Struct("<4sHH")
+# footer offset, footer length, magic
+_TRAILER = struct.Struct("<QI4s")
+_CODEC_NUMBERS = {name: i + 1 for i, name in enumerate(CODECS)}
+_CODEC_NAMES = {number: name for name, number in _CODEC_NUMBERS.items()}
+
+_TABLE_CACHE_SIZE = 32
+_tables_lock = threading.Lock()
+# path -> (signature, table), most recently used last.
+_tables: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def is_archive(path: Optional[str]) -> bool:
+    return bool(path) and path.endswith(SUFFIX)
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == "lzma":
+        return lzma.compress(data, preset=6)
+    return zlib.compress(data, 6)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    try:
+        if codec == "lzma":
+            return lzma.decompress(data)
+        return zlib.decompress(data)
+    except (lzma.LZMAError, zlib.error) as e:
+        raise ValueError(f"Corrupt archive block: {e}")
+
+
+def write(path: str, data: bytes, ids: List, offsets: List[int], lengths: List[int], seqs: List,
+          codec: str = DEFAULT_CODEC, block_bytes: int = DEFAULT_BLOCK_BYTES) -> int:
+    """Write a JSONL history file's contents as a compressed archive; return its size.
+
+    ``data`` is the file as ``_encode_lines`` lays it out, with the line table of its
+    messages. It is cut at line boundaries into blocks of about ``block_bytes`` that
+    are compressed independently, so a read decompresses only the blocks it touches.
+    The block table and line table are stored in a compressed footer, making the
+    archive self-describing: it needs no sidecar index.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown archive codec: {codec}")
+    block_bytes = max(1, int(block_bytes))
+    starts = [0] if data else []
+    for offset in offsets:
+        if offset - starts[-1] >= block_bytes:
+            starts.append(offset)
+
+    blocks = []
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, _CODEC_NUMBERS[codec]))
+        pos = _HEADER.size
+        for i, start in enumerate(starts):
+            end = starts[i + 1] if i + 1 < len(starts) else len(data)
+            stored = _compress(codec, data[start:end])
+            f.write(stored)
+            blocks.append([start, pos, len(stored)])
+            pos += len(stored)
+        footer = _compress(codec, json.dumps(
+            {
+                "size": len(data), "blocks": blocks,
+                "ids": ids, "offsets": offsets, "lengths": lengths, "seqs": seqs,
+            },
+            separators=(",", ":"), ensure_ascii=False,
+        ).encode("utf-8"))
+        f.write(footer)
+        f.write(_TRAILER.pack(pos, len(footer), _MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp, path)
+    forget(path)
+    return size
+
+
+def forget(path: str) -> None:
+    with _tables_lock:
+        _tables.pop(path, None)
+
+
+def _signature(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _table(path: str) -> dict:
+    """Return an archive's footer (codec, logical size, block and line tables)."""
+    signature = _signature(path)
+    with _tables_lock:
+        cached = _tables.get(path)
+        if cached is not None and cached[0] == signature:
+            _tables.move_to_end(path)
+            return cached[1]
+
+    with open(path, "rb") as f:
+        magic, version, codec_number = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC or version != _VERSION or codec_number not in _CODEC_NAMES:
+            raise ValueError(f"{path} is not a message archive")
+        f.seek(-_TRAILER.size, os.SEEK_END)
+        footer_offset, footer_length, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is truncated")
+        f.seek(footer_offset)
+        codec = _CODEC_NAMES[codec_number]
+        table = json.loads(_decompress(codec, f.read(footer_length)))
+    table["codec"] = codec
+    table["starts"] = [block[0] for block in table["blocks"]]
+
+    with _tables_lock:
+        _tables[path] = (signature, table)
+        _tables.move_to_end(path)
+        while len(_tables) > _TABLE_CACHE_SIZE:
+            _tables.popitem(last=False)
+    return table
+
+
+def read_table(path: str) -> Tuple[List[str], List[int], List[int], List[Optional[int]], int]:
+    """Return (ids, offsets, lengths, seqs, size) of the JSONL stored in an archive.
+
+    Offsets and size refer to the uncompressed lines, as they would be in the plain file.
+    """
+    table = _table(path)
+    return list(table["ids"]), list(table["offsets"]), list(table["lengths"]), list(table["seqs"]), table["size"]
+
+
+def _read_blocks(f, table: dict, first: int, last: int) -> bytes:
+    parts = []
+    for _, stored_offset, stored_length in table["blocks"][first:last + 1]:
+        f.seek(stored_offset)
+        parts.append(_decompress(table["codec"], f.read(stored_length)))
+    return b"".join(parts)
+
+
+def read_range(path: str, start: int, stop: int) -> bytes:
+    """Return bytes [start, stop) of the uncompressed JSONL, decompressing only the
+    blocks that hold them."""
+    table = _table(path)
+    starts = table["starts"]
+    if start >= stop or not starts:
+        return b""
+    first = max(0, bisect.bisect_right(starts, start) - 1)
+    last = max(first, bisect.bisect_right(starts, stop - 1) - 1)
+    with open(path, "rb") as f:
+        data = _read_blocks(f, table, first, last)
+    base = starts[first]
+    return data[start - base:stop - base]
+
+
+def read_all(path: str) -> bytes:
+    table = _table(path)
+    if not table["blocks"]:
+        return b""
+    with open(path, "rb") as f:
+        return _read_blocks(f, table, 0, len(table["blocks"]) - 1)
+
+
+def contains(path: str, needle: bytes) -> bool:
+    """Return whether any line of an archive contains ``needle``, decompressing one
+    block at a time and stopping at the first hit."""
+    table = _table(path)
+    with open(path, "rb") as f:
+        for i in range(len(table["blocks"])):
+            if needle in _read_blocks(f, table, i, i):
+                return True
+    return False
+
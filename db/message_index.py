@@ -0,0 +1,131 @@
+import mmap
+import os
+import struct
+from typing import List, Optional, Tuple
+
+SUFFIX = ".idx"
+_MAGIC = b"OCIX"
+_VERSION = 2
+# magic, version, inode of the history file, bytes of it covered, entry count, dead bytes
+_HEADER = struct.Struct("<4sH2xQQIQ")
+# byte offset, sequence number (0 when the message has none), line length, id length,
+# id: 72 bytes per entry. Version 1 entries had no sequence number and took 64.
+_ENTRY = struct.Struct("<QQIB51s")
+ID_MAX_BYTES = 51
+
+
+def index_path(path: str) -> str:
+    return path + SUFFIX
+
+
+def _encode_entry(message_id, offset: int, length: int, seq) -> Optional[bytes]:
+    if not isinstance(message_id, str):
+        return None
+    raw = message_id.encode("utf-8")
+    if len(raw) > ID_MAX_BYTES:
+        return None
+    return _ENTRY.pack(offset, seq if isinstance(seq, int) else 0, length, len(raw), raw)
+
+
+def remove(path: str) -> None:
+    try:
+        os.remove(index_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def rename(src: str, dst: str) -> None:
+    try:
+        os.replace(index_path(src), index_path(dst))
+    except FileNotFoundError:
+        pass
+
+
+def write(path: str, ids: List, offsets: List[int], lengths: List[int], size: int, garbage: int,
+          seqs: Optional[List] = None) -> bool:
+    """Write the sidecar index for ``path`` from scratch.
+
+    Returns False (leaving no index behind) when a message has no id, or an id too
+    long for an entry; such files are simply parsed in full when opened.
+    """
+    entries = []
+    for message_id, offset, length, seq in zip(ids, offsets, lengths, seqs or [None] * len(ids)):
+        entry = _encode_entry(message_id, offset, length, seq)
+        if entry is None:
+            remove(path)
+            return False
+        entries.append(entry)
+    try:
+        inode = os.stat(path).st_ino
+    except FileNotFoundError:
+        remove(path)
+        return False
+
+    # The index is only a cache validated against the history file, so no fsync.
+    tmp = index_path(path) + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, inode, size, len(entries), garbage))
+        f.write(b"".join(entries))
+    os.replace(tmp, index_path(path))
+    return True
+
+
+def extend(path: str, count: int, message_id, offset: int, length: int, size: int, seq=None) -> bool:
+    """Append one entry to an index currently holding ``count`` entries."""
+    entry = _encode_entry(message_id, offset, length, seq)
+    if entry is None:
+        return False
+    try:
+        with open(index_path(path), "r+b") as f:
+            magic, version, inode, _, indexed_count, garbage = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION or indexed_count != count:
+                return False
+            f.seek(_HEADER.size + count * _ENTRY.size)
+            f.write(entry)
+            f.seek(0)
+            f.write(_HEADER.pack(magic, version, inode, size, count + 1, garbage))
+        return True
+    except (OSError, struct.error):
+        return False
+
+
+def read(path: str) -> Optional[Tuple[List[str], List[int], List[int], List[Optional[int]], int, int]]:
+    """Return (ids, offsets, lengths, seqs, indexed size, dead bytes) from a valid index.
+
+    The index is valid when it belongs to the same inode as the history file and
+    covers no more bytes than the file holds; any bytes past the indexed size are
+    records appended since, which the caller parses itself.
+    """
+    try:
+        st = os.stat(path)
+        with open(index_path(path), "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    with mm:
+        if len(mm) < _HEADER.size:
+            return None
+        magic, version, inode, indexed_size, count, garbage = _HEADER.unpack_from(mm, 0)
+        end = _HEADER.size + count * _ENTRY.size
+        if magic != _MAGIC or version != _VERSION or inode != st.st_ino:
+            return None
+        if indexed_size > st.st_size or len(mm) < end:
+            return None
+
+        ids = []
+        offsets = []
+        lengths = []
+        seqs = []
+        view = memoryview(mm)[_HEADER.size:end]
+        try:
+            for offset, seq, length, id_len, raw in _ENTRY.iter_unpack(view):
+                ids.append(raw[:id_len].decode("utf-8"))
+                offsets.append(offset)
+                lengths.append(length)
+                seqs.append(seq or None)
+        except UnicodeDecodeError:
+            return None
+        finally:
+            view.release()
+    return ids, offsets, lengths, seqs, indexed_size, garbage
@@ -0,0 +1,1455 @@
+import bisect
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+from . import group_commit, message_archive, message_index, search_index, snowflake
+from .message_record import MessageRecord, compact
+from .storage_utils import atomic_write_json
+
+from logger import Logger
+
+DEFAULT_SEGMENT_SIZE = 10000
+MANIFEST_NAME = "manifest.json"
+_SEGMENT_KEYS = ("file", "count", "first_id", "last_id", "first_seq", "last_seq", "size", "garbage",
+                 "min_id_time", "max_id_time", "legacy_ids")
+TOMBSTONE_KEY = "_tombstone"
+
+
+def store_dir_for(path: str) -> str:
+    """Directory holding the sealed segments and manifest for a tail file."""
+    return os.path.splitext(path)[0] + ".d"
+
+
+def _serialise(message) -> bytes:
+    if isinstance(message, MessageRecord):
+        message = message.to_dict()
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _tombstone(message_id) -> bytes:
+    return _serialise({TOMBSTONE_KEY: message_id})
+
+
+def _reply_parent(message):
+    reply_to = message.get("reply_to")
+    return reply_to.get("id") if isinstance(reply_to, dict) else None
+
+
+def _apply_records(raw: bytes, base: int, entries: list, positions: dict) -> int:
+    """Apply the JSONL records in ``raw`` (found at byte ``base`` of the file) to
+    ``entries``, a list of [message, offset, length, id, seq] with ``positions``
+    mapping id -> entry index.
+
+    A line repeating an earlier message id is an overlay and replaces that message;
+    a tombstone line removes it. Returns the bytes taken up by superseded records.
+    """
+    garbage = 0
+    pos = base
+    for line_bytes in raw.split(b"\n"):
+        content_bytes = line_bytes.rstrip(b"\r")
+        line_str = content_bytes.decode("utf-8").strip()
+        line_pos = pos
+        pos += len(line_bytes) + 1
+        if not line_str:
+            continue
+        try:
+            record = json.loads(line_str)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(record, dict):
+            continue
+
+        if TOMBSTONE_KEY in record:
+            at = positions.pop(record[TOMBSTONE_KEY], None)
+            if at is not None:
+                garbage += entries[at][2] + 1
+                entries[at] = None
+            garbage += len(content_bytes) + 1
+            continue
+
+        message_id = record.get("id")
+        at = positions.get(message_id) if message_id is not None else None
+        if at is not None:
+            garbage += entries[at][2] + 1
+            entries[at] = [record, line_pos, len(content_bytes), message_id, record.get("seq")]
+        else:
+            if message_id is not None:
+                positions[message_id] = len(entries)
+            entries.append([record, line_pos, len(content_bytes), message_id, record.get("seq")])
+    return garbage
+
+
+def _id_span(ids) -> dict:
+    """Return the creation times of the oldest and newest snowflake ids among ``ids``
+    and whether any other ids are present, for ruling out a file without reading it."""
+    times = [snowflake.timestamp_of(message_id) for message_id in ids if message_id is not None]
+    known = [t for t in times if t is not None]
+    return {
+        "min_id_time": min(known, default=None),
+        "max_id_time": max(known, default=None),
+        "legacy_ids": len(known) < len(times),
+    }
+
+
+def _read_jsonl(path: str) -> Tuple[List[dict], List[int], List[int], int, int]:
+    """Parse a JSONL message file into messages plus per-line byte offsets/lengths
+    and the number of bytes taken up by tombstoned or overlaid records."""
+    try:
+        if message_archive.is_archive(path):
+            raw = message_archive.read_all(path)
+        else:
+            with open(path, "rb") as f:
+                raw = f.read()
+    except FileNotFoundError:
+        return [], [], [], 0, 0
+
+    stripped = raw.lstrip()
+    if stripped.startswith(b"["):
+        try:
+            messages = json.loads(raw.decode("utf-8"))
+        except json.JSONDecodeError:
+            messages = []
+        return messages, None, None, len(raw), 0
+
+    entries = []
+    garbage = _apply_records(raw, 0, entries, {})
+    live = [entry for entry in entries if entry is not None]
+    return (
+        [entry[0] for entry in live],
+        [entry[1] for entry in live],
+        [entry[2] for entry in live],
+        len(raw),
+        garbage,
+    )
+
+
+def _scan_file(path: str) -> dict:
+    """Load a history file's line table, through its sidecar index when that is valid.
+
+    With a valid index no message is parsed except records appended after the indexed
+    size; messages are returned as None placeholders to be read on demand. Otherwise
+    the whole file is parsed and the index is rebuilt for next time. Archives carry
+    their line table themselves and are never appended to.
+    """
+    if message_archive.is_archive(path):
+        try:
+            ids, offsets, lengths, seqs, size = message_archive.read_table(path)
+        except FileNotFoundError:
+            ids, offsets, lengths, seqs, size = [], [], [], [], 0
+        return {
+            "messages": [None] * len(ids), "ids": ids, "seqs": seqs, "offsets": offsets, "lengths": lengths,
+            "size": size, "garbage": 0, "indexed_size": None,
+        }
+
+    indexed = message_index.read(path)
+    if indexed is None:
+        messages, offsets, lengths, size, garbage = _read_jsonl(path)
+        ids = [msg.get("id") for msg in messages]
+        seqs = [msg.get("seq") for msg in messages]
+        indexed_size = None
+        if offsets is not None and os.path.exists(path):
+            if message_index.write(path, ids, offsets, lengths, size, garbage, seqs):
+                indexed_size = size
+        return {
+            "messages": messages, "ids": ids, "seqs": seqs, "offsets": offsets, "lengths": lengths,
+            "size": size, "garbage": garbage, "indexed_size": indexed_size,
+        }
+
+    ids, offsets, lengths, seqs, indexed_size, garbage = indexed
+    with open(path, "rb") as f:
+        f.seek(indexed_size)
+        raw = f.read()
+    size = indexed_size + len(raw)
+    if not raw:
+        return {
+            "messages": [None] * len(ids), "ids": ids, "seqs": seqs, "offsets": offsets, "lengths": lengths,
+            "size": size, "garbage": garbage, "indexed_size": indexed_size,
+        }
+
+    entries = [
+        [None, offset, length, message_id, seq]
+        for message_id, offset, length, seq in zip(ids, offsets, lengths, seqs)
+    ]
+    positions = {message_id: i for i, message_id in enumerate(ids)}
+    garbage += _apply_records(raw, indexed_size, entries, positions)
+    live = [entry for entry in entries if entry is not None]
+    result = {
+        "messages": [entry[0] for entry in live],
+        "ids": [entry[3] for entry in live],
+        "seqs": [entry[4] for entry in live],
+        "offsets": [entry[1] for entry in live],
+        "lengths": [entry[2] for entry in live],
+        "size": size,
+        "garbage": garbage,
+        "indexed_size": None,
+    }
+    if message_index.write(path, result["ids"], result["offsets"], result["lengths"], size, garbage, result["seqs"]):
+        result["indexed_size"] = size
+    return result
+
+
+def _map_file(path: str) -> Optional[mmap.mmap]:
+    """Memory-map a file read-only, or return None when it is empty."""
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_lines(path: str, offsets: List[int], lengths: List[int], begin: int, end: int) -> List[dict]:
+    """Read and parse lines [begin, end) of a file using its offset table.
+
+    Plain files are memory-mapped and each line is sliced out of the mapping, so only
+    the pages holding the requested lines are read. Overlays live after the lines
+    they replace, so a page's lines can be far apart; they are still read one by one.
+    """
+    if begin >= end:
+        return []
+    if message_archive.is_archive(path):
+        # Archives hold no overlays: their lines are contiguous.
+        start = offsets[begin]
+        data = message_archive.read_range(path, start, offsets[end - 1] + lengths[end - 1])
+        return [
+            json.loads(data[offsets[i] - start:offsets[i] - start + lengths[i]])
+            for i in range(begin, end)
+        ]
+
+    mapped = _map_file(path)
+    if mapped is None:
+        raise ValueError(f"{path} is empty")
+    with mapped:
+        return [json.loads(mapped[offsets[i]:offsets[i] + lengths[i]]) for i in range(begin, end)]
+
+
+def _encode_lines(messages: List[dict]) -> Tuple[bytes, List[int], List[int], int]:
+    encoded_lines = [_serialise(msg) for msg in messages]
+    offsets = []
+    lengths = []
+    pos = 0
+    for lb in encoded_lines:
+        offsets.append(pos)
+        lengths.append(len(lb))
+        pos += len(lb) + 1
+    return b"\n".join(encoded_lines), offsets, lengths, max(pos - 1, 0)
+
+
+def _write_file(path: str, data: bytes, tmp: Optional[str] = None) -> None:
+    tmp = tmp or path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _segment_file_name(number: int, suffix: str = ".jsonl") -> str:
+    return f"{number:06d}{suffix}"
+
+
+def _segment_number(name: str) -> int:
+    return int(name.split(".")[0])
+
+
+def _remove_file(path: str) -> None:
+    """Remove a history file together with its sidecar indexes."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    message_index.remove(path)
+    search_index.remove(path)
+    message_archive.forget(path)
+
+
+def _load_manifest(store_dir: str) -> dict:
+    try:
+        with open(os.path.join(store_dir, MANIFEST_NAME), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _manifest_segments(store_dir: str) -> List[dict]:
+    return [s for s in _load_manifest(store_dir).get("segments", []) if s.get("file")]
+
+
+class MessageLog:
+    """Message history for one channel or thread, stored as sealed segments plus a tail.
+
+    The tail is the original ``<name>.json``/``<name>.jsonl`` file; once it holds
+    ``segment_size`` messages it is moved into ``<name>.d/`` as a numbered segment
+    and recorded in ``<name>.d/manifest.json``. Only the tail is parsed when the log
+    is opened; older segments are loaded the first time a read reaches them.
+    Segments that have gone cold are compressed by ``archive`` into block-indexed
+    ``<n>.jsonz`` files (see ``message_archive``), which reads decompress a block at
+    a time.
+
+    Every file has a binary sidecar index (see ``message_index``), so opening a file
+    reads only its line table; message lines are parsed when a read reaches them.
+
+    Lines are written unpadded and never modified: deletes append a tombstone and
+    edits (content, reactions, pins) append an overlay, a new copy of the message, to
+    the file holding it. Overlays are merged when a file is loaded, and the dead bytes
+    are tracked per file and reclaimed later by ``compact``.
+
+    Each file can also carry a full-text index (see ``search_index``), built the
+    first time ``search`` reaches it and kept current by every write after that,
+    and an in-memory reply index built the same way by ``replies``. The ids of pinned
+    messages are kept in the manifest, so listing pins never scans the history.
+    The manifest also records the span of snowflake ids in each segment, so looking
+    up an id loads only the segments whose span covers it.
+    """
+
+    def __init__(self, path: str, lock=None, segment_size: Optional[int] = None):
+        self.path = path
+        self.store_dir = store_dir_for(path)
+        self.lock = lock if lock is not None else threading.RLock()
+        self.segment_size = max(1, int(segment_size or DEFAULT_SEGMENT_SIZE))
+        self.chunks: List[dict] = []
+        self._starts: List[int] = []
+        self.total = 0
+        self.last_write = 0.0
+        self.on_grow: Optional[Callable[[], None]] = None
+        # Ids of pinned messages in pin order; None until known for a pre-existing log.
+        self.pinned: Optional[List[str]] = None
+        # Sequence number of the newest message ever appended (deleted or not).
+        self.head_seq = 0
+        # Set by the group-commit writer when a queued append failed: the tail in
+        # memory then holds messages whose bytes never reached disk (see recover).
+        self._append_failed = False
+        with self.lock:
+            self._open()
+
+    # -- layout ----------------------------------------------------------
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.store_dir, MANIFEST_NAME)
+
+    def _read_manifest(self) -> List[dict]:
+        segments = _manifest_segments(self.store_dir)
+
+        if os.path.isdir(self.store_dir):
+            known = {s["file"] for s in segments}
+            numbers = {_segment_number(name) for name in known}
+            for name in sorted(os.listdir(self.store_dir)):
+                if not name.endswith((".jsonl", message_archive.SUFFIX)) or name in known:
+                    continue
+                if _segment_number(name) in numbers:
+                    # The old copy of a segment whose archiving or thawing was interrupted.
+                    _remove_file(os.path.join(self.store_dir, name))
+                    continue
+                messages = _read_jsonl(os.path.join(self.store_dir, name))[0]
+                segments.append(self._segment_entry(name, messages))
+            segments.sort(key=lambda s: s["file"])
+        return segments
+
+    def _save_manifest(self) -> None:
+        os.makedirs(self.store_dir, exist_ok=True)
+        manifest = {
+            "version": 1,
+            "segment_size": self.segment_size,
+            "segments": [
+                {k: chunk[k] for k in _SEGMENT_KEYS}
+                for chunk in self.chunks[:-1]
+            ],
+            "head_seq": self.head_seq,
+        }
+        if self.pinned is not None:
+            manifest["pinned"] = self.pinned
+        atomic_write_json(self._manifest_path(), manifest)
+
+    @staticmethod
+    def _segment_entry(name: str, messages: List[dict]) -> dict:
+        return {
+            **_id_span([msg.get("id") for msg in messages]),
+            "file": name,
+            "count": len(messages),
+            "first_id": messages[0].get("id") if messages else None,
+            "last_id": messages[-1].get("id") if messages else None,
+            "first_seq": messages[0].get("seq") if messages else None,
+            "last_seq": messages[-1].get("seq") if messages else None,
+            "size": 0,
+            "garbage": 0,
+        }
+
+    def _chunk_path(self, chunk: dict) -> str:
+        if chunk["file"] is None:
+            return self.path
+        return os.path.join(self.store_dir, chunk["file"])
+
+    def _next_segment_number(self) -> int:
+        numbers = [_segment_number(c["file"]) for c in self.chunks if c["file"]]
+        return max(numbers, default=0) + 1
+
+    def _reindex(self) -> None:
+        self._starts = []
+        total = 0
+        for chunk in self.chunks:
+            self._starts.append(total)
+            total += chunk["count"]
+        self.total = total
+
+    # -- loading ---------------------------------------------------------
+
+    def _open(self) -> None:
+        group_commit.flush(self.path)
+        segments = self._read_manifest()
+        manifest = _load_manifest(self.store_dir)
+        pinned = manifest.get("pinned")
+        self.pinned = list(pinned) if isinstance(pinned, list) else None
+        self.head_seq = manifest.get("head_seq") or 0
+        self.chunks = [
+            {
+                "file": s["file"],
+                "count": s.get("count", 0),
+                "first_id": s.get("first_id"),
+                "last_id": s.get("last_id"),
+                "first_seq": s.get("first_seq"),
+                "last_seq": s.get("last_seq"),
+                "size": s.get("size", 0),
+                "garbage": s.get("garbage", 0),
+                # None in a manifest written before id spans were kept: unknown.
+                "min_id_time": s.get("min_id_time"),
+                "max_id_time": s.get("max_id_time"),
+                "legacy_ids": s.get("legacy_ids"),
+                "version": 0,
+                "messages": None,
+            }
+            for s in segments
+        ]
+
+        scanned = _scan_file(self.path)
+        tail = self._make_chunk(None, **scanned)
+        self.chunks.append(tail)
+        last_sealed = self.chunks[-2]["last_id"] if len(self.chunks) > 1 else None
+        if last_sealed is not None and last_sealed in tail["id_to_idx"]:
+            # An interrupted split leaves already-sealed messages at the head of the tail.
+            self._materialize(tail, 0, tail["count"])
+            messages = tail["messages"][tail["id_to_idx"][last_sealed] + 1:]
+            tail.update(self._make_chunk(None, messages, None, None, tail["size"]))
+
+        if tail["offsets"] is None:
+            self._rewrite_chunk(tail)
+        if self.pinned is None and len(self.chunks) == 1 and not tail["count"]:
+            self.pinned = []
+        self._number_legacy_messages()
+
+        self._reindex()
+        if tail["count"] > self.segment_size:
+            self._split_tail()
+
+    def _number_legacy_messages(self) -> None:
+        """Give sequence numbers to messages stored before they existed.
+
+        Sealed segments without numbers get a range reserved in the manifest and are
+        numbered when first loaded; an unnumbered tail is numbered and rewritten now.
+        """
+        head = 0
+        reserved = False
+        for chunk in self.chunks[:-1]:
+            if chunk["first_seq"] is None and chunk["count"]:
+                chunk["first_seq"] = head + 1
+                chunk["last_seq"] = head + chunk["count"]
+                reserved = True
+            head = max(head, chunk["last_seq"] or 0)
+        tail = self.chunks[-1]
+        if None in tail["seqs"]:
+            self._number_chunk(tail, head + 1)
+        self.head_seq = max(self.head_seq, head, tail["last_seq"] or 0)
+        if reserved:
+            self._save_manifest()
+
+    def _number_chunk(self, chunk: dict, first_seq: int) -> None:
+        self._materialize(chunk, 0, chunk["count"])
+        for i, msg in enumerate(chunk["messages"]):
+            msg.seq = first_seq + i
+        self._rewrite_chunk(chunk)
+
+    def _make_chunk(self, name, messages, offsets, lengths, size, garbage=0, ids=None, seqs=None,
+                    indexed_size=None) -> dict:
+        messages = [compact(msg) for msg in messages]
+        if ids is None:
+            ids = [msg.get("id") for msg in messages]
+        if seqs is None:
+            seqs = [msg.get("seq") for msg in messages]
+        return {
+            **_id_span(ids),
+            "file": name,
+            "count": len(ids),
+            "first_id": ids[0] if ids else None,
+            "last_id": ids[-1] if ids else None,
+            "first_seq": seqs[0] if seqs else None,
+            "last_seq": seqs[-1] if seqs else None,
+            "messages": messages,
+            "ids": ids,
+            "seqs": seqs,
+            "id_to_idx": {message_id: i for i, message_id in enumerate(ids) if message_id is not None},
+            "offsets": offsets,
+            "lengths": lengths,
+            "size": size,
+            "garbage": garbage,
+            "indexed_size": indexed_size,
+            "version": 0,
+        }
+
+    def _load_chunk(self, chunk: dict) -> dict:
+        if chunk["messages"] is None:
+            version = chunk.get("version", 0) + 1
+            reserved_seq = chunk.get("first_seq")
+            chunk.update(self._make_chunk(chunk["file"], **_scan_file(self._chunk_path(chunk))))
+            chunk["version"] = version
+            if chunk["offsets"] is None:
+                self._rewrite_chunk(chunk)
+            if None in chunk["seqs"] and reserved_seq is not None:
+                self._number_chunk(chunk, reserved_seq)
+            if self.on_grow is not None:
+                self.on_grow()
+        return chunk
+
+    def _materialize(self, chunk: dict, begin: int, end: int) -> None:
+        """Parse the placeholder messages in [begin, end) of a loaded chunk from disk."""
+        messages = chunk["messages"]
+        missing = [i for i in range(begin, end) if messages[i] is None]
+        if not missing:
+            return
+        lo, hi = missing[0], missing[-1] + 1
+        self._settle(chunk)
+        path = self._chunk_path(chunk)
+        try:
+            loaded = _read_lines(path, chunk["offsets"], chunk["lengths"], lo, hi)
+        except (OSError, ValueError):
+            loaded = None
+        if loaded is None or any(msg.get("id") != chunk["ids"][lo + i] for i, msg in enumerate(loaded)):
+            # The index no longer matches the file; fall back to a full parse.
+            message_index.remove(path)
+            version = chunk["version"] + 1
+            chunk.update(self._make_chunk(chunk["file"], **_scan_file(path)))
+            chunk["version"] = version
+            return
+        for i in range(lo, hi):
+            if messages[i] is None:
+                messages[i] = compact(loaded[i - lo])
+
+    def resident(self) -> Tuple[int, int]:
+        """Return (messages, bytes) currently held in memory by loaded chunks."""
+        messages = 0
+        size = 0
+        for chunk in self.chunks:
+            if chunk["messages"] is not None:
+                messages += chunk["count"]
+                size += chunk["size"]
+        return messages, size
+
+    def trim(self) -> None:
+        """Drop every loaded sealed segment from memory; they reload on the next read."""
+        with self.lock:
+            for chunk in self.chunks[:-1]:
+                if chunk["messages"] is not None:
+                    self._save_search(chunk)
+                    chunk.update(
+                        messages=None, ids=None, seqs=None, id_to_idx=None, offsets=None, lengths=None,
+                        search=None, replies=None, reply_parents=None,
+                    )
+
+    def _split_tail(self) -> None:
+        """Move all but the newest partial segment of an oversized tail into segments."""
+        tail = self.chunks[-1]
+        self._materialize(tail, 0, tail["count"])
+        messages = tail["messages"]
+        keep = len(messages) % self.segment_size or self.segment_size
+        sealed = messages[:len(messages) - keep]
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        number = self._next_segment_number()
+        new_chunks = []
+        for begin in range(0, len(sealed), self.segment_size):
+            part = sealed[begin:begin + self.segment_size]
+            name = _segment_file_name(number)
+            number += 1
+            data, offsets, lengths, size = _encode_lines(part)
+            path = os.path.join(self.store_dir, name)
+            _write_file(path, data)
+            chunk = self._make_chunk(name, part, offsets, lengths, size)
+            if message_index.write(path, chunk["ids"], offsets, lengths, size, 0, chunk["seqs"]):
+                chunk["indexed_size"] = size
+            new_chunks.append(chunk)
+
+        self.chunks[-1:-1] = new_chunks
+        tail.update(self._make_chunk(None, messages[len(sealed):], None, None, 0))
+        self._save_manifest()
+        self._rewrite_chunk(tail)
+        self._reindex()
+
+    def _seal_tail(self) -> None:
+        tail = self.chunks[-1]
+        self._settle(tail)
+        if self._append_failed:
+            self._reload()
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+        name = _segment_file_name(self._next_segment_number())
+        segment_path = os.path.join(self.store_dir, name)
+        os.replace(self.path, segment_path)
+        message_index.rename(self.path, segment_path)
+        search_index.rename(self.path, segment_path)
+        tail["file"] = name
+        self._save_search(tail)
+        new_tail = self._make_chunk(None, [], [], [], 0)
+        new_tail["search"] = search_index.SearchIndex()
+        new_tail["replies"] = {}
+        new_tail["reply_parents"] = {}
+        self.chunks.append(new_tail)
+        self._save_manifest()
+        with open(self.path, "wb"):
+            pass
+        if message_index.write(self.path, [], [], [], 0, 0):
+            new_tail["indexed_size"] = 0
+        self._reindex()
+        if self.on_grow is not None:
+            self.on_grow()
+
+    # -- positions -------------------------------------------------------
+
+    def _locate(self, position: int) -> Tuple[dict, int]:
+        chunk_idx = bisect.bisect_right(self._starts, position) - 1
+        chunk = self._load_chunk(self.chunks[chunk_idx])
+        return chunk, position - self._starts[chunk_idx]
+
+    def _find(self, message_id) -> Tuple[Optional[int], Optional[int]]:
+        """Return (chunk index, local index) for a message id, loading segments newest first."""
+        if not message_id:
+            return None, None
+        sent = snowflake.timestamp_of(message_id)
+        for chunk_idx in range(len(self.chunks) - 1, -1, -1):
+            chunk = self.chunks[chunk_idx]
+            if chunk["messages"] is None:
+                if not self._chunk_may_hold(chunk, message_id, sent):
+                    continue
+                self._load_chunk(chunk)
+            idx = chunk["id_to_idx"].get(message_id)
+            if idx is not None:
+                return chunk_idx, idx
+        return None, None
+
+    def _chunk_may_hold(self, chunk: dict, message_id, sent: Optional[float]) -> bool:
+        """Rule out an unloaded segment as the home of a message from the id span kept
+        in the manifest; files are only searched for ids that are not snowflakes."""
+        if chunk.get("legacy_ids") is None:
+            return self._chunk_may_contain(chunk, message_id)
+        if sent is not None:
+            low, high = chunk["min_id_time"], chunk["max_id_time"]
+            return low is not None and low <= sent <= high
+        return chunk["legacy_ids"] and self._chunk_may_contain(chunk, message_id)
+
+    def _chunk_may_contain(self, chunk: dict, message_id) -> bool:
+        needle = json.dumps(message_id).encode("utf-8")
+        path = self._chunk_path(chunk)
+        try:
+            if message_archive.is_archive(path):
+                return message_archive.contains(path, needle)
+            mapped = _map_file(path)
+            if mapped is None:
+                return False
+            with mapped:
+                return mapped.find(needle) != -1
+        except (OSError, ValueError):
+            return False
+
+    def position(self, message_id) -> Optional[int]:
+        with self.lock:
+            chunk_idx, idx = self._find(message_id)
+            if chunk_idx is None:
+                return None
+            return self._starts[chunk_idx] + idx
+
+    def count(self) -> int:
+        return self.total
+
+    def seq_of(self, message_id) -> Optional[int]:
+        with self.lock:
+            chunk_idx, idx = self._find(message_id)
+            if chunk_idx is None:
+                return None
+            return self.chunks[chunk_idx]["seqs"][idx]
+
+    def count_after(self, seq: int) -> int:
+        """Return how many messages have a sequence number above ``seq``.
+
+        Sequence numbers grow with position, so segments entirely above ``seq`` are
+        counted from the manifest and only the segment straddling it is searched,
+        through its line table; no message is parsed.
+        """
+        with self.lock:
+            newer = 0
+            for chunk in reversed(self.chunks):
+                if not chunk["count"]:
+                    continue
+                if chunk["last_seq"] is not None and chunk["last_seq"] <= seq:
+                    break
+                if chunk["first_seq"] is not None and chunk["first_seq"] > seq:
+                    newer += chunk["count"]
+                    continue
+                self._load_chunk(chunk)
+                newer += chunk["count"] - bisect.bisect_right(chunk["seqs"], seq)
+                break
+            return newer
+
+    # -- reads -----------------------------------------------------------
+
+    def slice(self, begin: int, end: int) -> List[dict]:
+        with self.lock:
+            begin = max(begin, 0)
+            end = min(end, self.total)
+            result = []
+            while begin < end:
+                chunk, local = self._locate(begin)
+                take = min(end - begin, chunk["count"] - local)
+                self._materialize(chunk, local, local + take)
+                result.extend(msg.to_dict() for msg in chunk["messages"][local:local + take])
+                begin += take
+            return result
+
+    def page(self, start, limit: int) -> List[dict]:
+        """Return up to ``limit`` messages ending ``start`` messages from the newest,
+        or ending just before the message whose id is ``start``."""
+        with self.lock:
+            if isinstance(start, int):
+                end = self.total - max(start, 0)
+            else:
+                end = self.position(start)
+                if end is None:
+                    return []
+            return self.slice(max(0, end - limit), end)
+
+    def around(self, message_id, above: int = 50, below: int = 50) -> Tuple[Optional[List[dict]], Optional[int], Optional[int]]:
+        """Return messages surrounding ``message_id`` with their [start, end) positions."""
+        above = max(0, min(above, 200))
+        below = max(0, min(below, 200))
+        with self.lock:
+            target = self.position(message_id)
+            if target is None:
+                return None, None, None
+            start = max(0, target - below)
+            end = min(self.total, target + above + 1)
+            return self.slice(start, end), start, end
+
+    def _time_at(self, position: int) -> float:
+        """Return when the message at ``position`` was sent, from its id when that is a
+        snowflake and otherwise from the message itself."""
+        chunk, local = self._locate(position)
+        sent = snowflake.timestamp_of(chunk["ids"][local])
+        if sent is None:
+            self._materialize(chunk, local, local + 1)
+            sent = chunk["messages"][local].get("timestamp")
+        return sent if isinstance(sent, (int, float)) else 0
+
+    def position_at(self, timestamp: float) -> int:
+        """Return the position of the first message sent at or after ``timestamp``.
+
+        Messages are stored in the order they were sent, so this is a binary search
+        that reads one line per step.
+        """
+        with self.lock:
+            lo, hi = 0, self.total
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._time_at(mid) < timestamp:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+    def before(self, timestamp: float, limit: int) -> List[dict]:
+        """Return up to ``limit`` of the newest messages sent before ``timestamp``."""
+        with self.lock:
+            end = self.position_at(timestamp)
+            return self.slice(max(0, end - limit), end)
+
+    def after(self, timestamp: float, limit: int) -> List[dict]:
+        """Return up to ``limit`` of the oldest messages sent at or after ``timestamp``."""
+        with self.lock:
+            start = self.position_at(timestamp)
+            return self.slice(start, start + limit)
+
+    def get(self, message_id) -> Optional[dict]:
+        with self.lock:
+            chunk_idx, idx = self._find(message_id)
+            if chunk_idx is None:
+                return None
+            chunk = self.chunks[chunk_idx]
+            self._materialize(chunk, idx, idx + 1)
+            return chunk["messages"][idx].to_dict()
+
+    def iter_messages(self, reverse: bool = False, after_seq: int = 0) -> Iterator[dict]:
+        """Yield every message, one file at a time, holding the lock only while a file
+        is read. With ``after_seq`` only messages with a higher sequence number are
+        yielded, and files entirely at or below it are skipped without being read."""
+        order = range(len(self.chunks) - 1, -1, -1) if reverse else range(len(self.chunks))
+        for chunk_idx in order:
+            with self.lock:
+                if chunk_idx >= len(self.chunks):
+                    continue
+                chunk = self.chunks[chunk_idx]
+                if after_seq and chunk["last_seq"] is not None and chunk["last_seq"] <= after_seq:
+                    continue
+                if chunk["messages"] is None:
+                    # Full scans read cold segments without keeping them resident.
+                    messages = _read_jsonl(self._chunk_path(chunk))[0]
+                    if messages and chunk["first_seq"] is not None and "seq" not in messages[0]:
+                        # Not numbered yet: use the range reserved for the segment.
+                        for i, msg in enumerate(messages):
+                            msg["seq"] = chunk["first_seq"] + i
+                else:
+                    self._materialize(chunk, 0, chunk["count"])
+                    messages = [msg.to_dict() for msg in chunk["messages"]]
+                if after_seq:
+                    messages = [msg for msg in messages if (msg.get("seq") or 0) > after_seq]
+            yield from (reversed(messages) if reverse else messages)
+
+    def search(self, query: str, limit: int = 50, before=None) -> List[dict]:
+        """Return up to ``limit`` messages matching ``query``, newest first.
+
+        See ``search_index.parse_query`` for the query syntax. With ``before`` (a
+        message id) only older messages are returned, to page through the results.
+        Files are visited newest first and the walk stops once ``limit`` is reached,
+        so the cost follows the number of matches rather than the size of the log.
+        """
+        prefixes, phrases = search_index.parse_query(query)
+        if (not prefixes and not phrases) or limit <= 0:
+            return []
+        with self.lock:
+            last = len(self.chunks) - 1
+            cursor = None
+            if before is not None:
+                last, cursor = self._find(before)
+                if last is None:
+                    return []
+
+            results = []
+            for chunk_idx in range(last, -1, -1):
+                chunk = self.chunks[chunk_idx]
+                matched = self._search_index(chunk).match(prefixes, phrases)
+                id_to_idx = chunk["id_to_idx"]
+                hits = sorted((id_to_idx[i] for i in matched if i in id_to_idx), reverse=True)
+                if chunk_idx == last and cursor is not None:
+                    hits = [idx for idx in hits if idx < cursor]
+                for idx in hits[:limit - len(results)]:
+                    self._materialize(chunk, idx, idx + 1)
+                    results.append(chunk["messages"][idx].to_dict())
+                if len(results) >= limit:
+                    break
+            return results
+
+    def replies(self, message_id, limit: int = 50, after=None) -> List[dict]:
+        """Return up to ``limit`` messages replying to ``message_id``, oldest first.
+
+        With ``after`` (the id of a reply) only later replies are returned. Replies are
+        always newer than their parent, so only the files from the parent (or the
+        cursor) onwards are visited, and files that do not mention the parent at all
+        are skipped without being loaded.
+        """
+        if limit <= 0:
+            return []
+        with self.lock:
+            if after is not None:
+                first, cursor = self._find(after)
+                if first is None:
+                    return []
+            else:
+                first, cursor = self._find(message_id)
+                if first is None:
+                    # The parent may be gone while its replies remain.
+                    first = 0
+
+            results = []
+            for chunk_idx in range(first, len(self.chunks)):
+                chunk = self.chunks[chunk_idx]
+                if chunk.get("replies") is None and not self._chunk_may_contain(chunk, message_id):
+                    continue
+                children = self._reply_index(chunk).get(message_id, ())
+                id_to_idx = chunk["id_to_idx"]
+                for child in children:
+                    idx = id_to_idx[child]
+                    if after is not None and chunk_idx == first and idx <= cursor:
+                        continue
+                    self._materialize(chunk, idx, idx + 1)
+                    results.append(chunk["messages"][idx].to_dict())
+                    if len(results) >= limit:
+                        return results
+            return results
+
+    def pinned_messages(self) -> List[dict]:
+        """Return the pinned messages, newest first.
+
+        A log written before pins were tracked is scanned once to find them; after that
+        only the pinned messages themselves are read.
+        """
+        with self.lock:
+            if self.pinned is None:
+                self.pinned = [
+                    msg["id"] for msg in self.iter_messages()
+                    if msg.get("pinned") and msg.get("id") is not None
+                ]
+                self._save_manifest()
+
+            found = []
+            for message_id in self.pinned:
+                chunk_idx, idx = self._find(message_id)
+                if chunk_idx is None:
+                    continue
+                chunk = self.chunks[chunk_idx]
+                self._materialize(chunk, idx, idx + 1)
+                msg = chunk["messages"][idx]
+                if msg.get("pinned"):
+                    found.append((self._starts[chunk_idx] + idx, msg.to_dict()))
+            found.sort(key=lambda item: item[0], reverse=True)
+            return [msg for _, msg in found]
+
+    def _reply_index(self, chunk: dict) -> dict:
+        """Return a chunk's parent id -> reply ids map, building it on first use."""
+        if chunk.get("replies") is None:
+            self._load_chunk(chunk)
+            self._materialize(chunk, 0, chunk["count"])
+            replies = {}
+            parents = {}
+            for msg in chunk["messages"]:
+                parent = _reply_parent(msg)
+                child = msg.get("id")
+                if parent is not None and child is not None:
+                    replies.setdefault(parent, []).append(child)
+                    parents[child] = parent
+            chunk["replies"] = replies
+            chunk["reply_parents"] = parents
+        return chunk["replies"]
+
+    def _search_index(self, chunk: dict) -> search_index.SearchIndex:
+        """Return a chunk's full-text index, loading it from disk or building it."""
+        if chunk.get("search") is None:
+            self._load_chunk(chunk)
+            self._settle(chunk)
+            path = self._chunk_path(chunk)
+            index = search_index.SearchIndex.load(path)
+            if index is None:
+                self._materialize(chunk, 0, chunk["count"])
+                index = search_index.SearchIndex()
+                for msg in chunk["messages"]:
+                    index.add(msg.get("id"), msg.get("content"))
+                index.save(path)
+            chunk["search"] = index
+        return chunk["search"]
+
+    # -- writes ----------------------------------------------------------
+
+    def append(self, message: dict, sync: Union[bool, str, None] = None) -> Future:
+        """Append a message, returning a future that resolves once it is as durable as
+        ``sync`` asks for (see ``group_commit.resolve_durability``)."""
+        with self.lock:
+            tail = self.chunks[-1]
+            message["seq"] = self.head_seq + 1
+            line = _serialise(message)
+            durability = group_commit.resolve_durability(sync)
+            size_before = tail["size"]
+            offsets, future = self._append_records(tail, [line], durability)
+            future.add_done_callback(self._check_append)
+
+            self.head_seq = message["seq"]
+            if tail["indexed_size"] == size_before and message_index.extend(
+                self.path, tail["count"], message["id"], offsets[0], len(line), tail["size"], message["seq"]
+            ):
+                tail["indexed_size"] = tail["size"]
+            tail["messages"].append(compact(message))
+            if tail.get("search") is not None:
+                tail["search"].add(message["id"], message.get("content"))
+            parent = _reply_parent(message)
+            if parent is not None and tail.get("replies") is not None:
+                tail["replies"].setdefault(parent, []).append(message["id"])
+                tail["reply_parents"][message["id"]] = parent
+            tail["ids"].append(message["id"])
+            tail["seqs"].append(message["seq"])
+            tail["id_to_idx"][message["id"]] = tail["count"]
+            tail["offsets"].append(offsets[0])
+            tail["lengths"].append(len(line))
+            if not tail["count"]:
+                tail["first_id"] = message["id"]
+                tail["first_seq"] = message["seq"]
+            tail["last_id"] = message["id"]
+            tail["last_seq"] = message["seq"]
+            sent = snowflake.timestamp_of(message["id"])
+            if sent is None:
+                tail["legacy_ids"] = True
+            else:
+                tail["min_id_time"] = min(sent, tail["min_id_time"] if tail["min_id_time"] is not None else sent)
+                tail["max_id_time"] = max(sent, tail["max_id_time"] if tail["max_id_time"] is not None else sent)
+            tail["count"] += 1
+            self.total += 1
+            self.last_write = time.monotonic()
+            if message.get("pinned") and self.pinned is not None:
+                # Imported history can arrive already pinned.
+                self.pinned.append(message["id"])
+                self._save_manifest()
+
+            if tail["count"] >= self.segment_size:
+                self._seal_tail()
+            return future
+
+    def _check_append(self, future: Future) -> None:
+        # Runs on the group-commit writer, which must never wait for self.lock.
+        if future.exception() is not None:
+            self._append_failed = True
+
+    def recover(self) -> bool:
+        """Reload the log from disk if a queued append failed to be written.
+
+        Such a message was already in memory (and in the tail's sidecar index, at an
+        offset the file never reached) when its future failed. ``channels`` and
+        ``threads`` call this before handing the log out; returns True if it reloaded.
+        """
+        if not self._append_failed:
+            return False
+        with self.lock:
+            if not self._append_failed:
+                return False
+            self._reload()
+            return True
+
+    def _reload(self) -> None:
+        Logger.warning(f"Reloading {self.path} from disk after a failed append")
+        group_commit.flush(self.path)
+        self._append_failed = False
+        message_index.remove(self.path)
+        search_index.remove(self.path)
+        head_seq = self.head_seq
+        self.chunks = []
+        self._starts = []
+        self.total = 0
+        self.pinned = None
+        self._open()
+        # Never hand out the sequence number of a message a client may have seen.
+        self.head_seq = max(self.head_seq, head_seq)
+
+    def update(self, message_id, mutate: Callable[[dict], bool]) -> bool:
+        """Apply ``mutate`` to a copy of a message and persist it if it returns True.
+
+        The new version, with its ``rev`` bumped, is appended as an overlay and the
+        old line becomes garbage.
+        """
+        with self.lock:
+            chunk_idx, idx = self._find(message_id)
+            if chunk_idx is None:
+                return False
+            chunk = self.chunks[chunk_idx]
+            self._materialize(chunk, idx, idx + 1)
+            msg = chunk["messages"][idx].to_dict()
+            was_pinned = bool(msg.get("pinned"))
+            if not mutate(msg):
+                return False
+            msg["rev"] = msg.get("rev", 0) + 1
+            chunk["messages"][idx] = compact(msg)
+            if chunk.get("search") is not None:
+                chunk["search"].add(message_id, msg.get("content"))
+            overlay = _serialise(msg)
+            offset = self._append_records(chunk, [overlay])[0][0]
+            chunk["garbage"] += chunk["lengths"][idx] + 1
+            chunk["offsets"][idx] = offset
+            chunk["lengths"][idx] = len(overlay)
+            manifest_changed = chunk["file"] is not None
+            if self.pinned is not None and bool(msg.get("pinned")) != was_pinned:
+                if not was_pinned:
+                    self.pinned.append(message_id)
+                elif message_id in self.pinned:
+                    self.pinned.remove(message_id)
+                manifest_changed = True
+            if manifest_changed:
+                self._save_manifest()
+            return True
+
+    def delete(self, message_id) -> bool:
+        with self.lock:
+            chunk_idx, idx = self._find(message_id)
+            if chunk_idx is None:
+                return False
+            chunk = self.chunks[chunk_idx]
+            tombstone = _tombstone(message_id)
+            self._append_records(chunk, [tombstone])
+            chunk["garbage"] += chunk["lengths"][idx] + len(tombstone) + 2
+            # Deleting the newest message must not let its sequence number be reused.
+            was_head = chunk["seqs"][idx] == self.head_seq
+            self._drop_range(chunk, idx, idx + 1)
+            unpinned = self.pinned is not None and message_id in self.pinned
+            if unpinned:
+                self.pinned.remove(message_id)
+            if chunk["file"] is not None or unpinned or was_head:
+                self._save_manifest()
+            self._reindex()
+            return True
+
+    def purge(self, count: Optional[int] = None) -> None:
+        """Delete the oldest ``count`` messages, or every message when count is None."""
+        with self.lock:
+            remaining = self.total if count is None else max(0, min(count, self.total))
+            sealed_changed = bool(remaining) and remaining == self.total
+            purged = set()
+            while remaining and self.chunks[0]["count"] <= remaining and len(self.chunks) > 1:
+                chunk = self.chunks.pop(0)
+                remaining -= chunk["count"]
+                if self.pinned:
+                    ids = chunk["ids"] if chunk["messages"] is not None else _scan_file(self._chunk_path(chunk))["ids"]
+                    purged.update(ids)
+                _remove_file(self._chunk_path(chunk))
+                sealed_changed = True
+            if remaining:
+                chunk = self._load_chunk(self.chunks[0])
+                doomed = chunk["ids"][:remaining]
+                purged.update(doomed)
+                if all(message_id is not None for message_id in doomed):
+                    tombstones = [_tombstone(message_id) for message_id in doomed]
+                    self._append_records(chunk, tombstones)
+                    chunk["garbage"] += sum(chunk["lengths"][:remaining]) + sum(len(t) for t in tombstones) + 2 * remaining
+                    self._drop_range(chunk, 0, remaining)
+                else:
+                    self._materialize(chunk, 0, chunk["count"])
+                    for message_id in chunk["ids"][:remaining]:
+                        self._unindex(chunk, message_id)
+                    del chunk["messages"][:remaining]
+                    self._rewrite_chunk(chunk)
+                sealed_changed = sealed_changed or chunk["file"] is not None
+            if self.pinned and purged.intersection(self.pinned):
+                self.pinned = [message_id for message_id in self.pinned if message_id not in purged]
+                sealed_changed = True
+            if sealed_changed:
+                self._save_manifest()
+            self._reindex()
+
+    def destroy(self) -> None:
+        with self.lock:
+            group_commit.flush(self.path)
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            message_index.remove(self.path)
+            search_index.remove(self.path)
+            shutil.rmtree(self.store_dir, ignore_errors=True)
+            self.chunks = [self._make_chunk(None, [], [], [], 0)]
+            self.pinned = []
+            self.head_seq = 0
+            self._reindex()
+
+    # -- file maintenance ------------------------------------------------
+
+    def _rewrite_chunk(self, chunk: dict) -> None:
+        """Rewrite a chunk's file from its messages. An archived segment is written
+        back as plain JSONL, since archives are never modified."""
+        self._settle(chunk)
+        if chunk["offsets"] is not None:
+            self._materialize(chunk, 0, len(chunk["messages"]))
+        messages = chunk["messages"]
+        old_path = self._chunk_path(chunk)
+        if message_archive.is_archive(chunk["file"]):
+            chunk["file"] = _segment_file_name(_segment_number(chunk["file"]))
+        path = self._chunk_path(chunk)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data, offsets, lengths, size = _encode_lines(messages)
+        _write_file(path, data)
+        version = chunk["version"] + 1
+        chunk.update(self._make_chunk(chunk["file"], messages, offsets, lengths, size))
+        chunk["version"] = version
+        if message_index.write(path, chunk["ids"], offsets, lengths, size, 0, chunk["seqs"]):
+            chunk["indexed_size"] = size
+        if path != old_path:
+            self._save_manifest()
+            _remove_file(old_path)
+            self._save_search(chunk)
+
+    def _save_search(self, chunk: dict) -> bool:
+        index = chunk.get("search")
+        if index is None:
+            return False
+        self._settle(chunk)
+        return index.save(self._chunk_path(chunk))
+
+    def save_search(self) -> int:
+        """Persist the full-text indexes changed since they were last written."""
+        with self.lock:
+            return sum(self._save_search(chunk) for chunk in self.chunks)
+
+    def _settle(self, chunk: dict) -> None:
+        """Write out group-commit appends still queued for a chunk's file."""
+        if chunk["file"] is None:
+            group_commit.flush(self.path)
+
+    def _append_records(
+        self, chunk: dict, records: List[bytes], durability: str = group_commit.DURABILITY_FSYNC
+    ) -> Tuple[List[int], Future]:
+        """Append raw lines to a chunk's file; return the byte offset of each and a
+        future for their durability. An archived segment is thawed back to JSONL first."""
+        if message_archive.is_archive(chunk["file"]):
+            self._rewrite_chunk(chunk)
+        offsets = []
+        parts = []
+        pos = chunk["size"]
+        for record in records:
+            prefix = b"\n" if pos else b""
+            offsets.append(pos + len(prefix))
+            parts.append(prefix + record)
+            pos += len(prefix) + len(record)
+
+        path = self._chunk_path(chunk)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        chunk["size"] = pos
+        chunk["version"] += 1
+        if durability == group_commit.DURABILITY_GROUP:
+            return offsets, group_commit.submit(path, b"".join(parts))
+
+        self._settle(chunk)
+        with open(path, "ab") as f:
+            f.write(b"".join(parts))
+            if durability == group_commit.DURABILITY_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        return offsets, group_commit.done()
+
+    def _drop_range(self, chunk: dict, begin: int, end: int) -> None:
+        """Remove messages [begin, end) from a loaded chunk, shifting later indices in place."""
+        ids = chunk["ids"]
+        id_to_idx = chunk["id_to_idx"]
+        for message_id in ids[begin:end]:
+            id_to_idx.pop(message_id, None)
+            self._unindex(chunk, message_id)
+        del chunk["messages"][begin:end]
+        del ids[begin:end]
+        del chunk["seqs"][begin:end]
+        del chunk["offsets"][begin:end]
+        del chunk["lengths"][begin:end]
+        for i in range(begin, len(ids)):
+            if ids[i] is not None:
+                id_to_idx[ids[i]] = i
+        chunk["count"] = len(ids)
+        chunk["first_id"] = ids[0] if ids else None
+        chunk["last_id"] = ids[-1] if ids else None
+        chunk["first_seq"] = chunk["seqs"][0] if ids else None
+        chunk["last_seq"] = chunk["seqs"][-1] if ids else None
+
+    @staticmethod
+    def _unindex(chunk: dict, message_id) -> None:
+        """Remove a message that is leaving a chunk from the chunk's search and reply indexes."""
+        if chunk.get("search") is not None:
+            chunk["search"].remove(message_id)
+        parent = chunk["reply_parents"].pop(message_id, None) if chunk.get("reply_parents") is not None else None
+        if parent is not None:
+            children = chunk["replies"][parent]
+            children.remove(message_id)
+            if not children:
+                del chunk["replies"][parent]
+
+    def garbage(self) -> int:
+        return sum(chunk["garbage"] for chunk in self.chunks)
+
+    def compact(self, min_garbage: int = 0, garbage_ratio: float = 0.0) -> int:
+        """Rewrite files whose dead records pass both thresholds; return how many were rewritten.
+
+        The new file is written without holding the lock and swapped in only if the
+        file was not touched meanwhile, so writers are never blocked on the rewrite.
+        """
+        compacted = 0
+        for chunk in list(self.chunks):
+            with self.lock:
+                if not any(c is chunk for c in self.chunks):
+                    continue
+                if not chunk["garbage"] or chunk["garbage"] < min_garbage:
+                    continue
+                if chunk["garbage"] < garbage_ratio * chunk["size"]:
+                    continue
+                path = self._chunk_path(chunk)
+                version = chunk["version"]
+                messages = None
+                if chunk["messages"] is not None:
+                    self._materialize(chunk, 0, chunk["count"])
+                    messages = list(chunk["messages"])
+
+            if messages is None:
+                messages = _read_jsonl(path)[0]
+            data, offsets, lengths, size = _encode_lines(messages)
+            tmp = path + ".compact"
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            with self.lock:
+                current = any(c is chunk for c in self.chunks) and self._chunk_path(chunk) == path
+                if not current or chunk["version"] != version:
+                    os.remove(tmp)
+                    continue
+                self._settle(chunk)
+                os.replace(tmp, path)
+                indexed = message_index.write(
+                    path, [msg.get("id") for msg in messages], offsets, lengths, size, 0,
+                    [msg.get("seq") for msg in messages],
+                )
+                chunk["size"] = size
+                chunk["garbage"] = 0
+                chunk["version"] += 1
+                if chunk["messages"] is not None:
+                    chunk["offsets"] = offsets
+                    chunk["lengths"] = lengths
+                    chunk["indexed_size"] = size if indexed else None
+                if chunk["file"] is not None:
+                    self._save_manifest()
+            compacted += 1
+        return compacted
+
+    def _newest_timestamp(self, chunk: dict):
+        """Return the timestamp of a chunk's newest message, reading only that line."""
+        if "newest_timestamp" not in chunk:
+            if chunk["messages"] is not None:
+                self._materialize(chunk, chunk["count"] - 1, chunk["count"])
+                newest = chunk["messages"][-1]
+            else:
+                scan = _scan_file(self._chunk_path(chunk))
+                if scan["offsets"] is None or scan["messages"][-1] is not None:
+                    newest = scan["messages"][-1]
+                else:
+                    count = len(scan["ids"])
+                    newest = _read_lines(self._chunk_path(chunk), scan["offsets"], scan["lengths"], count - 1, count)[0]
+            chunk["newest_timestamp"] = newest.get("timestamp")
+        return chunk["newest_timestamp"]
+
+    def archive(self, keep_messages: int = 0, max_age: float = 0, codec: str = message_archive.DEFAULT_CODEC,
+                block_bytes: int = message_archive.DEFAULT_BLOCK_BYTES) -> int:
+        """Compress sealed segments that have gone cold into archives; return how many.
+
+        A segment is cold once ``keep_messages`` newer messages follow it, or once its
+        newest message is ``max_age`` seconds old (0 disables either rule). Archives
+        are read a block at a time (see ``message_archive``), so history in them stays
+        available to every read; a write to one turns it back into plain JSONL. As
+        with ``compact``, the archive is written without holding the lock.
+        """
+        if not keep_messages and not max_age:
+            return 0
+        archived = 0
+        now = time.time()
+        for chunk in list(self.chunks[:-1]):
+            with self.lock:
+                chunk_idx = next((i for i, c in enumerate(self.chunks) if c is chunk), None)
+                if chunk_idx is None or chunk_idx == len(self.chunks) - 1:
+                    continue
+                if message_archive.is_archive(chunk["file"]) or not chunk["count"]:
+                    continue
+                newer = self.total - self._starts[chunk_idx] - chunk["count"]
+                cold = bool(keep_messages) and newer >= keep_messages
+                if not cold and max_age:
+                    newest = self._newest_timestamp(chunk)
+                    cold = isinstance(newest, (int, float)) and now - newest >= max_age
+                if not cold:
+                    continue
+                path = self._chunk_path(chunk)
+                version = chunk["version"]
+                first_seq = chunk["first_seq"]
+                messages = None
+                if chunk["messages"] is not None:
+                    self._materialize(chunk, 0, chunk["count"])
+                    messages = list(chunk["messages"])
+
+            if messages is None:
+                messages = _read_jsonl(path)[0]
+                if messages and first_seq is not None and "seq" not in messages[0]:
+                    # Not numbered yet: use the range reserved for the segment.
+                    for i, msg in enumerate(messages):
+                        msg["seq"] = first_seq + i
+            data, offsets, lengths, size = _encode_lines(messages)
+            name = _segment_file_name(_segment_number(chunk["file"]), message_archive.SUFFIX)
+            target = os.path.join(self.store_dir, name)
+            message_archive.write(
+                target, data, [msg.get("id") for msg in messages], offsets, lengths,
+                [msg.get("seq") for msg in messages], codec, block_bytes,
+            )
+
+            with self.lock:
+                current = any(c is chunk for c in self.chunks) and self._chunk_path(chunk) == path
+                if not current or chunk["version"] != version:
+                    _remove_file(target)
+                    continue
+                chunk["file"] = name
+                chunk["size"] = size
+                chunk["garbage"] = 0
+                chunk["version"] += 1
+                if chunk["messages"] is not None:
+                    chunk["offsets"] = offsets
+                    chunk["lengths"] = lengths
+                    chunk["indexed_size"] = None
+                self._save_manifest()
+                _remove_file(path)
+                self._save_search(chunk)
+            archived += 1
+        return archived
+
+
+def read_around(path: str, message_id, above: int = 50, below: int = 50) -> Tuple[Optional[List[dict]], Optional[int], Optional[int]]:
+    """``MessageLog.around`` for a log that is not open.
+
+    Files are searched newest first through their sidecar indexes, and only the lines
+    inside the window are read, by seeking to their offsets. Positions of sealed
+    segments come from the manifest counts, and no cache is populated.
+    The caller must hold the log's lock.
+    """
+    above = max(0, min(above, 200))
+    below = max(0, min(below, 200))
+    group_commit.flush(path)
+
+    store_dir = store_dir_for(path)
+    segments = _manifest_segments(store_dir)
+    files = [os.path.join(store_dir, s["file"]) for s in segments] + [path]
+    counts = [s.get("count", 0) for s in segments]
+
+    scans = {}
+
+    def scan_of(file_idx: int) -> dict:
+        if file_idx not in scans:
+            scans[file_idx] = _scan_file(files[file_idx])
+        return scans[file_idx]
+
+    def lines(file_idx: int, begin: int, end: int) -> List[dict]:
+        scan = scan_of(file_idx)
+        begin = max(begin, 0)
+        end = min(end, len(scan["ids"]))
+        messages = scan["messages"]
+        if scan["offsets"] is not None and any(messages[i] is None for i in range(begin, end)):
+            loaded = _read_lines(files[file_idx], scan["offsets"], scan["lengths"], begin, end)
+            for i in range(begin, end):
+                if messages[i] is None:
+                    messages[i] = loaded[i - begin]
+        return messages[begin:end]
+
+    target_file = local = None
+    for file_idx in range(len(files) - 1, -1, -1):
+        if not os.path.exists(files[file_idx]):
+            continue
+        ids = scan_of(file_idx)["ids"]
+        if message_id in ids:
+            target_file, local = file_idx, ids.index(message_id)
+            break
+    if target_file is None:
+        return None, None, None
+
+    before = lines(target_file, local - below, local)
+    file_idx = target_file
+    while len(before) < below and file_idx > 0:
+        file_idx -= 1
+        count = len(scan_of(file_idx)["ids"])
+        before = lines(file_idx, count - (below - len(before)), count) + before
+
+    after = lines(target_file, local, local + above + 1)
+    file_idx = target_file
+    while len(after) < above + 1 and file_idx < len(files) - 1:
+        file_idx += 1
+        after.extend(lines(file_idx, 0, above + 1 - len(after)))
+
+    start = sum(counts[:target_file]) + local - len(before)
+    return before + after, start, start + len(before) + len(after)
@@ -0,0 +1,82 @@
+import sys
+
+_MISSING = object()
+_CORE_FIELDS = ("user", "content", "timestamp", "id", "seq")
+
+
+class MessageRecord:
+    """Compact cached form of a message.
+
+    The fields every message carries live in slots instead of a per-message dict,
+    and user ids (authors, reply targets and reactors) are interned so each distinct
+    user is stored once however many messages mention them. Anything else the
+    message carries (embeds, attachments, reactions, ...) is kept in ``extra``.
+    """
+
+    __slots__ = ("user", "content", "timestamp", "id", "seq", "extra")
+
+    def __init__(self, user=_MISSING, content=_MISSING, timestamp=_MISSING, id=_MISSING, seq=_MISSING, extra=None):
+        self.user = user
+        self.content = content
+        self.timestamp = timestamp
+        self.id = id
+        self.seq = seq
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, message: dict) -> "MessageRecord":
+        extra = None
+        for key, value in message.items():
+            if key not in _CORE_FIELDS:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        if extra is not None:
+            _intern_nested_users(extra)
+        user = message.get("user", _MISSING)
+        if isinstance(user, str):
+            user = sys.intern(user)
+        return cls(
+            user,
+            message.get("content", _MISSING),
+            message.get("timestamp", _MISSING),
+            message.get("id", _MISSING),
+            message.get("seq", _MISSING),
+            extra,
+        )
+
+    def get(self, key, default=None):
+        if key in _CORE_FIELDS:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def to_dict(self) -> dict:
+        message = {}
+        for key in _CORE_FIELDS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                message[key] = value
+        if self.extra:
+            message.update(self.extra)
+        return message
+
+
+def _intern_nested_users(extra: dict) -> None:
+    reply_to = extra.get("reply_to")
+    if isinstance(reply_to, dict) and isinstance(reply_to.get("user"), str):
+        reply_to["user"] = sys.intern(reply_to["user"])
+    reactions = extra.get("reactions")
+    if isinstance(reactions, dict):
+        for user_ids in reactions.values():
+            if isinstance(user_ids, list):
+                user_ids[:] = [sys.intern(u) if isinstance(u, str) else u for u in user_ids]
+
+
+def compact(message):
+    """Return the cached form of a parsed message (placeholders pass through)."""
+    if message is None or isinstance(message, MessageRecord):
+        return message
+    return MessageRecord.from_dict(message)
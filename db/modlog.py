@@ -8,6 +8,8 @@ from typing import Dict, List, Optional
 from logger import Logger
 from config_store import get_config_value
 
+from . import io_executor
+
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 _log_path = os.path.join(_MODULE_DIR, "modlog.json")
 
@@ -29,12 +31,7 @@ def _load() -> List[dict]:
 
 def _save(entries: List[dict]) -> None:
     global _log_cache, _loaded
-    tmp = _log_path + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(entries, f, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, _log_path)
+    io_executor.write_json(_log_path, entries, lock=_lock, op="modlog")
     _log_cache = entries
     _loaded = True
 
@@ -0,0 +1,165 @@
+import heapq
+from bisect import insort
+import json
+import os
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from . import group_commit
+from .storage_utils import atomic_write_json
+
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+_PINGS_DIR = os.path.join(_MODULE_DIR, "pings")
+_META_FILE = os.path.join(_PINGS_DIR, "meta.json")
+
+KIND_USER = "users"
+KIND_ROLE = "roles"
+
+_lock = threading.RLock()
+# (kind, name) -> references to the messages mentioning it, oldest first.
+_cache: Dict[Tuple[str, str], List[dict]] = {}
+_backfilled: Optional[bool] = None
+
+
+def _inbox_file(key: Tuple[str, str]) -> str:
+    kind, name = key
+    return os.path.join(_PINGS_DIR, kind, quote(name, safe="") + ".jsonl")
+
+
+def make_ref(message_id: str, timestamp, channel: str, thread_id: Optional[str] = None) -> dict:
+    ref = {"channel": channel, "id": message_id, "timestamp": timestamp}
+    if thread_id:
+        ref["thread_id"] = thread_id
+    return ref
+
+
+def _ref_time(ref: dict):
+    return ref.get("timestamp") or 0
+
+
+def _load_inbox(key: Tuple[str, str]) -> List[dict]:
+    refs = _cache.get(key)
+    if refs is not None:
+        return refs
+    refs = []
+    path = _inbox_file(key)
+    group_commit.flush(path)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    refs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    except FileNotFoundError:
+        pass
+    # Mentions added by an edit are appended with the message's original timestamp.
+    refs.sort(key=_ref_time)
+    _cache[key] = refs
+    return refs
+
+
+def _ensure_storage():
+    os.makedirs(os.path.join(_PINGS_DIR, KIND_USER), exist_ok=True)
+    os.makedirs(os.path.join(_PINGS_DIR, KIND_ROLE), exist_ok=True)
+
+
+_ensure_storage()
+
+
+def record(message_id: str, timestamp, channel: str, thread_id: Optional[str] = None,
+           user_ids: Iterable[str] = (), role_names: Iterable[str] = ()) -> None:
+    """Append a reference to a new message to the inbox of every user and role it mentions.
+
+    Each inbox is an append-only JSONL file, so recording a mention costs one short
+    append per mentioned user or role however large the history is. The appends are
+    queued on the group-commit writer rather than made while holding the lock. Role
+    mentions are stored once in the role's inbox rather than copied to every member.
+    """
+    ref = make_ref(message_id, timestamp, channel, thread_id)
+    data = (json.dumps(ref, separators=(",", ":"), ensure_ascii=False) + "\n").encode("utf-8")
+    keys = [(KIND_USER, u) for u in set(user_ids) if u] + [(KIND_ROLE, r) for r in set(role_names) if r]
+    with _lock:
+        for key in keys:
+            refs = _load_inbox(key)
+            if refs and _ref_time(ref) < _ref_time(refs[-1]):
+                insort(refs, ref, key=_ref_time)
+            else:
+                refs.append(ref)
+            group_commit.submit(_inbox_file(key), data)
+
+
+def _inboxes(user_id: str, role_names: Iterable[str]) -> List[List[dict]]:
+    # Shallow copies, so a merge in progress is not disturbed by record().
+    with _lock:
+        inboxes = [_load_inbox((KIND_USER, user_id))]
+        inboxes.extend(_load_inbox((KIND_ROLE, r)) for r in set(role_names or []))
+        return [list(refs) for refs in inboxes]
+
+
+def iter_refs(user_id: str, role_names: Iterable[str]) -> Iterator[dict]:
+    """Yield references to the messages mentioning a user or one of their roles, newest first.
+
+    The inboxes are merged lazily, without reading any message. A message
+    mentioning the user and one of their roles is yielded once.
+    """
+    merged = heapq.merge(
+        *(reversed(refs) for refs in _inboxes(user_id, role_names)),
+        key=_ref_time,
+        reverse=True,
+    )
+    seen = set()
+    for ref in merged:
+        if ref.get("id") in seen:
+            continue
+        seen.add(ref.get("id"))
+        yield ref
+
+
+def is_backfilled() -> bool:
+    global _backfilled
+    with _lock:
+        if _backfilled is None:
+            try:
+                with open(_META_FILE, "r") as f:
+                    _backfilled = bool(json.load(f).get("backfilled"))
+            except (FileNotFoundError, json.JSONDecodeError):
+                _backfilled = False
+        return _backfilled
+
+
+def backfill(entries: Iterable[Tuple[dict, Iterable[str], Iterable[str]]]) -> None:
+    """Seed the inboxes from existing history.
+
+    ``entries`` yields (ref, user ids, role names) for every message found. They are
+    merged with anything recorded meanwhile, so messages sent during the scan are
+    neither lost nor listed twice, and the inbox files are rewritten in time order.
+    """
+    global _backfilled
+    found: Dict[Tuple[str, str], List[dict]] = {}
+    for ref, user_ids, role_names in entries:
+        for u in set(user_ids):
+            if u:
+                found.setdefault((KIND_USER, u), []).append(ref)
+        for r in set(role_names):
+            if r:
+                found.setdefault((KIND_ROLE, r), []).append(ref)
+
+    with _lock:
+        for key, refs in found.items():
+            known = {ref.get("id") for ref in _load_inbox(key)}
+            merged = _load_inbox(key) + [ref for ref in refs if ref.get("id") not in known]
+            merged.sort(key=_ref_time)
+            path = _inbox_file(key)
+            group_commit.flush(path)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(ref, separators=(",", ":"), ensure_ascii=False) + "\n" for ref in merged)
+            os.replace(tmp, path)
+            _cache[key] = merged
+        atomic_write_json(_META_FILE, {"version": 1, "backfilled": True})
+        _backfilled = True
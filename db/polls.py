@@ -5,6 +5,8 @@ import time
 import uuid
 from typing import Dict, List, Optional, Tuple
 
+from . import io_executor
+
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 polls_file = os.path.join(_MODULE_DIR, "polls.json")
 poll_votes_file = os.path.join(_MODULE_DIR, "poll_votes.json")
@@ -34,21 +36,11 @@ def _load_polls():
 
 
 def _save_polls():
-    tmp = polls_file + ".tmp"
-    with open(tmp, 'w') as f:
-        json.dump(_polls_cache, f, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, polls_file)
+    io_executor.write_json(polls_file, _polls_cache, lock=_lock, op="polls")
 
 
 def _save_votes():
-    tmp = poll_votes_file + ".tmp"
-    with open(tmp, 'w') as f:
-        json.dump(_votes_cache, f, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, poll_votes_file)
+    io_executor.write_json(poll_votes_file, _votes_cache, lock=_lock, op="poll_votes")
 
 
 def _ensure_loaded():
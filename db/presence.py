@@ -0,0 +1,159 @@
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Dict, Optional
+
+from constants import ALLOWED_STATUSES
+
+from . import io_executor
+
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+presence_index = os.path.join(_MODULE_DIR, "presence.json")
+
+DEFAULT_STATUS = {"status": "online", "text": ""}
+MAX_STATUS_TEXT = 100
+
+# Volatile per-user state, kept out of users.json: chosen status, session
+# validator, when the user was last connected, and open connections. Everything
+# but the connection counts is snapshotted to presence.json by save().
+_lock = threading.Lock()
+_statuses: Dict[str, dict] = {}
+_validators: Dict[str, str] = {}
+_ids_by_validator: Dict[str, str] = {}
+_last_seen: Dict[str, float] = {}
+# username -> open connections; the server hands this dict out as
+# server_data["connected_usernames"].
+connected_usernames: Dict[str, int] = {}
+_dirty = False
+
+
+def _load() -> None:
+    global _dirty
+    try:
+        with open(presence_index, "r") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        data = {}
+    with _lock:
+        _statuses.clear()
+        _statuses.update(data.get("statuses", {}))
+        _validators.clear()
+        _validators.update(data.get("validators", {}))
+        _ids_by_validator.clear()
+        _ids_by_validator.update((validator, user_id) for user_id, validator in _validators.items())
+        _last_seen.clear()
+        _last_seen.update(data.get("last_seen", {}))
+        _dirty = False
+
+
+_load()
+
+
+def save() -> bool:
+    """Queue a snapshot of presence.json if anything changed since the last one.
+
+    Called by the server's periodic maintenance task and at shutdown; a crash loses
+    at most the changes since the last snapshot.
+    """
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return False
+        snapshot = {
+            "statuses": dict(_statuses),
+            "validators": dict(_validators),
+            "last_seen": dict(_last_seen),
+        }
+        _dirty = False
+    io_executor.write_json(presence_index, snapshot, op="presence")
+    return True
+
+
+def get_status(user_id: str) -> Optional[dict]:
+    """Return the status a user set, or None if they never set one."""
+    with _lock:
+        return _statuses.get(user_id)
+
+
+def set_status(user_id: str, status: str, text: Optional[str] = None) -> bool:
+    global _dirty
+    if status not in ALLOWED_STATUSES:
+        return False
+    if text is not None and len(text) > MAX_STATUS_TEXT:
+        return False
+    with _lock:
+        _statuses[user_id] = {"status": status, "text": text or ""}
+        _dirty = True
+    return True
+
+
+def generate_validator(user_id: str) -> str:
+    global _dirty
+    validator = secrets.token_urlsafe(32)
+    with _lock:
+        old = _validators.get(user_id)
+        if old is not None:
+            _ids_by_validator.pop(old, None)
+        _validators[user_id] = validator
+        _ids_by_validator[validator] = user_id
+        _dirty = True
+    return validator
+
+
+def get_validator(user_id: str) -> Optional[str]:
+    with _lock:
+        return _validators.get(user_id)
+
+
+def get_user_id_by_validator(validator_token: str) -> Optional[str]:
+    if not validator_token:
+        return None
+    with _lock:
+        return _ids_by_validator.get(validator_token)
+
+
+def connect(user_id: str, username: str) -> int:
+    """Count a new connection of a user; return how many they now have open."""
+    global _dirty
+    with _lock:
+        count = connected_usernames.get(username, 0) + 1
+        connected_usernames[username] = count
+        _last_seen[user_id] = time.time()
+        _dirty = True
+        return count
+
+
+def disconnect(user_id: str, username: str) -> int:
+    """Count a closed connection of a user; return how many they still have open."""
+    global _dirty
+    with _lock:
+        count = connected_usernames.get(username, 0) - 1
+        if count > 0:
+            connected_usernames[username] = count
+        else:
+            connected_usernames.pop(username, None)
+            count = 0
+        if user_id:
+            _last_seen[user_id] = time.time()
+            _dirty = True
+        return count
+
+
+def last_seen(user_id: str) -> Optional[float]:
+    """Return when a user last connected or disconnected (Unix time), if known."""
+    with _lock:
+        return _last_seen.get(user_id)
+
+
+def forget(user_id: str) -> None:
+    """Drop everything kept about a removed user."""
+    global _dirty
+    with _lock:
+        _statuses.pop(user_id, None)
+        validator = _validators.pop(user_id, None)
+        if validator is not None:
+            _ids_by_validator.pop(validator, None)
+        _last_seen.pop(user_id, None)
+        _dirty = True
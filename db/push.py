@@ -6,6 +6,8 @@ import hmac
 import time
 from typing import Optional
 
+from . import io_executor
+
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 _SUBS_FILE = os.path.join(_MODULE_DIR, "push_subscriptions.json")
 _FINGERPRINT_SECRET = os.environ.get("PUSH_FINGERPRINT_SECRET", "originchats-push-secret")
@@ -50,12 +52,7 @@ def _load() -> dict:
 
 def _save(data: dict) -> None:
     global _cache, _loaded
-    tmp = _SUBS_FILE + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(data, f, indent=4)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, _SUBS_FILE)
+    io_executor.write_json(_SUBS_FILE, data, lock=_lock, op="push_subscriptions", indent=4)
     _cache = data
     _loaded = True
 
@@ -6,6 +6,8 @@ import uuid
 
 from constants import PROTECTED_ROLES
 
+from . import io_executor
+
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 roles_index = os.path.join(_MODULE_DIR, "roles.json")
 
@@ -90,6 +92,8 @@ def _load_roles() -> dict:
 
 def reload_roles() -> dict:
     global _roles_loaded
+    # The cache is ahead of the file until queued writes land.
+    io_executor.flush(roles_index)
     _roles_loaded = False
     return _load_roles()
 
@@ -103,12 +107,7 @@ def get_user_color(user_roles: list) -> str | None:
 
 def _save_roles(roles_dict: dict) -> None:
     global _roles_cache, _roles_loaded
-    tmp = roles_index + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(roles_dict, f, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, roles_index)
+    io_executor.write_json(roles_index, roles_dict, lock=_lock, op="roles")
     _roles_cache = roles_dict
     _roles_loaded = True
 
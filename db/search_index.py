@@ -0,0 +1,194 @@
+import json
+import os
+import re
+import sys
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+SUFFIX = ".search"
+_VERSION = 1
+_TOKEN_RE = re.compile(r"\w+")
+_QUERY_RE = re.compile(r'"([^"]*)"?|(\S+)')
+
+
+def index_path(path: str) -> str:
+    return path + SUFFIX
+
+
+def tokenize(text) -> List[str]:
+    if not isinstance(text, str):
+        return []
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def parse_query(query: str) -> Tuple[List[str], List[List[str]]]:
+    """Split a search query into prefix terms and phrases.
+
+    A bare word matches any word starting with it; a quoted part (or a bare word that
+    tokenizes to several words, like ``e-mail``) must appear as those exact words in
+    that order. Every term has to match.
+    """
+    prefixes = []
+    phrases = []
+    for quoted, bare in _QUERY_RE.findall(query or ""):
+        tokens = tokenize(quoted or bare)
+        if not tokens:
+            continue
+        if bare and len(tokens) == 1:
+            prefixes.append(tokens[0])
+        else:
+            phrases.append(tokens)
+    return prefixes, phrases
+
+
+def _signature(path: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+
+def _contains_phrase(tokens: Tuple[str, ...], phrase: List[str]) -> bool:
+    width = len(phrase)
+    first = phrase[0]
+    for i in range(len(tokens) - width + 1):
+        if tokens[i] == first and list(tokens[i:i + width]) == phrase:
+            return True
+    return False
+
+
+def remove(path: str) -> None:
+    try:
+        os.remove(index_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def rename(src: str, dst: str) -> None:
+    try:
+        os.replace(index_path(src), index_path(dst))
+    except FileNotFoundError:
+        pass
+
+
+class SearchIndex:
+    """Inverted index over the message contents of one history file.
+
+    ``docs`` keeps each message's words in order (used for phrase checks and to
+    unindex it), ``postings`` maps a word to the ids of the messages containing it,
+    and a sorted word list serves prefix lookups.
+    """
+
+    def __init__(self):
+        self.docs: Dict[str, Tuple[str, ...]] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        self._words: List[str] = []
+        self.signature: Optional[List[int]] = None
+        self.dirty = False
+
+    def add(self, message_id, content) -> None:
+        """Index (or re-index, after an edit) the content of a message."""
+        if message_id is None:
+            return
+        tokens = tuple(sys.intern(token) for token in tokenize(content))
+        if self.docs.get(message_id) == tokens:
+            return
+        self.remove(message_id)
+        if tokens:
+            self.docs[message_id] = tokens
+            for token in set(tokens):
+                self._post(token, message_id)
+        self.dirty = True
+
+    def remove(self, message_id) -> None:
+        tokens = self.docs.pop(message_id, None)
+        if tokens is None:
+            return
+        for token in set(tokens):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.discard(message_id)
+            if not posting:
+                del self.postings[token]
+                del self._words[bisect_left(self._words, token)]
+        self.dirty = True
+
+    def _post(self, token: str, message_id: str) -> None:
+        posting = self.postings.get(token)
+        if posting is None:
+            posting = self.postings[token] = set()
+            insort(self._words, token)
+        posting.add(message_id)
+
+    def _prefixed(self, prefix: str) -> Set[str]:
+        matched = set()
+        words = self._words
+        for i in range(bisect_left(words, prefix), len(words)):
+            if not words[i].startswith(prefix):
+                break
+            matched |= self.postings[words[i]]
+        return matched
+
+    def match(self, prefixes: List[str], phrases: List[List[str]]) -> Set[str]:
+        """Return the ids of the messages matching every prefix term and phrase."""
+        candidates = [self._prefixed(prefix) for prefix in prefixes]
+        for phrase in phrases:
+            postings = [self.postings.get(token) for token in set(phrase)]
+            if any(posting is None for posting in postings):
+                return set()
+            candidates.append(set.intersection(*postings))
+        if not candidates:
+            return set()
+        candidates.sort(key=len)
+        matched = candidates[0].intersection(*candidates[1:])
+        for phrase in phrases:
+            if len(phrase) > 1:
+                matched = {i for i in matched if _contains_phrase(self.docs[i], phrase)}
+        return matched
+
+    def save(self, path: str) -> bool:
+        """Persist the index next to ``path`` if it changed since it was last written.
+
+        The index is stamped with the history file's inode, size and mtime, so any
+        change to the file that the index did not see invalidates it on load. Like the
+        line index it is only a cache, so it is not fsynced.
+        """
+        signature = _signature(path)
+        if signature is None or (not self.dirty and signature == self.signature):
+            return False
+        tmp = index_path(path) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": _VERSION, "signature": signature, "docs": self.docs},
+                f, separators=(",", ":"), ensure_ascii=False,
+            )
+        os.replace(tmp, index_path(path))
+        self.signature = signature
+        self.dirty = False
+        return True
+
+    @classmethod
+    def load(cls, path: str) -> Optional["SearchIndex"]:
+        """Return the persisted index for ``path``, or None if it is missing or stale."""
+        signature = _signature(path)
+        try:
+            with open(index_path(path), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != _VERSION:
+            return None
+        if signature is None or data.get("signature") != signature:
+            return None
+
+        index = cls()
+        for message_id, tokens in data.get("docs", {}).items():
+            tokens = tuple(sys.intern(token) for token in tokens)
+            index.docs[message_id] = tokens
+            for token in set(tokens):
+                index.postings.setdefault(token, set()).add(message_id)
+        index._words = sorted(index.postings)
+        index.signature = signature
+        return index
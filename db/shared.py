@@ -1,9 +1,30 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from config_store import get_config_value
+
 from . import users
-from typing import List
 
+DEFAULT_CLIENT_CACHE_SIZE = 20000
 
-def convert_messages_to_user_format(messages: List[dict]) -> List[dict]:
-    """Convert messages with user IDs to messages with usernames for sending to clients."""
+# (message id, seq, rev) -> the message as converted for clients. seq is unique
+# within a log, so a message deleted and imported again under the same id never
+# hits the entry of the old copy, whose rev may match. Converted messages embed
+# usernames, so the whole cache is dropped when users.names_version() moves.
+_lock = threading.Lock()
+_client_cache: "OrderedDict[Tuple[str, int, int], dict]" = OrderedDict()
+_cache_names_version = None
+
+
+def _cache_key(msg: dict):
+    message_id = msg.get("id")
+    if not isinstance(message_id, str):
+        return None
+    return message_id, msg.get("seq", 0), msg.get("rev", 0)
+
+
+def _convert(messages: List[dict]) -> List[dict]:
     user_ids_needed = set()
     for msg in messages:
         if "user" in msg:
@@ -42,3 +63,47 @@ def convert_messages_to_user_format(messages: List[dict]) -> List[dict]:
         converted.append(msg_copy)
 
     return converted
+
+
+def convert_messages_to_user_format(messages: List[dict]) -> List[dict]:
+    """Convert messages with user IDs to messages with usernames for sending to clients.
+
+    Converted messages are cached by id, ``seq`` and ``rev`` (up to
+    ``storage.cache.client_messages``), so a page read by many clients is converted
+    once. Each caller gets its own top-level copy and may add keys to it; nested
+    values are shared and must not be modified.
+    """
+    global _cache_names_version
+    max_size = get_config_value("storage", "cache", "client_messages", default=DEFAULT_CLIENT_CACHE_SIZE)
+    if max_size <= 0:
+        return _convert(messages)
+
+    names_version = users.names_version()
+    result: List[dict] = [None] * len(messages)  # type: ignore[list-item]
+    missing: Dict[int, tuple] = {}
+    with _lock:
+        if names_version != _cache_names_version:
+            _client_cache.clear()
+            _cache_names_version = names_version
+        for i, msg in enumerate(messages):
+            key = _cache_key(msg)
+            cached = _client_cache.get(key) if key is not None else None
+            if cached is None:
+                missing[i] = key
+            else:
+                _client_cache.move_to_end(key)
+                result[i] = cached.copy()
+
+    if missing:
+        converted = _convert([messages[i] for i in missing])
+        # A username that changed during the conversion makes it stale.
+        cacheable = users.names_version() == names_version
+        with _lock:
+            cacheable = cacheable and names_version == _cache_names_version
+            for (i, key), msg in zip(missing.items(), converted):
+                result[i] = msg
+                if cacheable and key is not None:
+                    _client_cache[key] = msg.copy()
+            while len(_client_cache) > max_size:
+                _client_cache.popitem(last=False)
+    return result
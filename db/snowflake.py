@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+from typing import Optional
+
+# Milliseconds since 2024-01-01T00:00:00Z | worker | per-millisecond sequence.
+EPOCH_MS = 1704067200000
+_WORKER_BITS = 10
+_SEQUENCE_BITS = 12
+_SEQUENCE_MASK = (1 << _SEQUENCE_BITS) - 1
+_TIME_SHIFT = _WORKER_BITS + _SEQUENCE_BITS
+_MAX_DIGITS = 20  # a 64-bit id
+
+_lock = threading.Lock()
+_worker = os.getpid() & ((1 << _WORKER_BITS) - 1)
+_last_ms = 0
+_sequence = 0
+
+
+def new_id() -> str:
+    """Return a new message id: a decimal snowflake that sorts by creation time.
+
+    Ids made in the same millisecond are told apart by a sequence number; if the
+    clock steps backwards the last timestamp is reused, so ids never go down.
+    """
+    global _last_ms, _sequence
+    with _lock:
+        now = max(int(time.time() * 1000) - EPOCH_MS, _last_ms)
+        if now == _last_ms:
+            _sequence = (_sequence + 1) & _SEQUENCE_MASK
+            if _sequence == 0:
+                now += 1
+        else:
+            _sequence = 0
+        _last_ms = now
+        return str((now << _TIME_SHIFT) | (_worker << _SEQUENCE_BITS) | _sequence)
+
+
+def timestamp_of(message_id) -> Optional[float]:
+    """Return the Unix time (seconds) a snowflake id was made, or None for other ids
+    such as the UUIDs of older messages."""
+    if not isinstance(message_id, str) or len(message_id) > _MAX_DIGITS:
+        return None
+    if not (message_id.isascii() and message_id.isdigit()):
+        return None
+    return ((int(message_id) >> _TIME_SHIFT) + EPOCH_MS) / 1000
@@ -0,0 +1,420 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from . import group_commit, search_index, snowflake
+from .message_log import _reply_parent
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    log TEXT PRIMARY KEY,
+    head_seq INTEGER NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    pk INTEGER PRIMARY KEY,
+    log TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    id TEXT,
+    user TEXT,
+    reply_to TEXT,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    content TEXT,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_log_seq ON messages (log, seq);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_log_id ON messages (log, id);
+CREATE INDEX IF NOT EXISTS messages_reply ON messages (log, reply_to, seq) WHERE reply_to IS NOT NULL;
+CREATE INDEX IF NOT EXISTS messages_user ON messages (log, user, seq);
+CREATE INDEX IF NOT EXISTS messages_pinned ON messages (log, seq) WHERE pinned;
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='pk', tokenize='unicode61 remove_diacritics 0'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.pk, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.pk, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.pk, old.content);
+    INSERT INTO messages_fts (rowid, content) VALUES (new.pk, new.content);
+END;
+"""
+
+_ITER_BATCH = 500
+
+# One connection per database file, shared by every log in it. sqlite3 connections
+# must not be used from two threads at once, so all access goes through _db_lock.
+_db_lock = threading.RLock()
+_connections: Dict[str, sqlite3.Connection] = {}
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Return the shared connection to ``path``, creating the schema on first use.
+
+    The database runs in WAL mode. Commits are fsynced when ``storage.durability``
+    is "fsync"; otherwise WAL's synchronous=NORMAL is used, which survives a crash of
+    the server but not of the machine, like the group and buffered policies.
+    """
+    with _db_lock:
+        conn = _connections.get(path)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            durable = group_commit.resolve_durability(None) == group_commit.DURABILITY_FSYNC
+            conn.execute(f"PRAGMA synchronous={'FULL' if durable else 'NORMAL'}")
+            conn.executescript(_SCHEMA)
+            _connections[path] = conn
+        return conn
+
+
+def close_all() -> None:
+    with _db_lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+def list_logs(path: str) -> List[str]:
+    conn = connect(path)
+    with _db_lock:
+        return [row[0] for row in conn.execute("SELECT log FROM logs ORDER BY log")]
+
+
+def _columns(message: dict) -> tuple:
+    content = message.get("content")
+    return (
+        message.get("id"),
+        message.get("user"),
+        _reply_parent(message),
+        1 if message.get("pinned") else 0,
+        content if isinstance(content, str) else None,
+        json.dumps(message, separators=(",", ":"), ensure_ascii=False),
+    )
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """Translate a search query (see ``search_index.parse_query``) into FTS5 syntax."""
+    prefixes, phrases = search_index.parse_query(query)
+    terms = [f'"{prefix}"*' for prefix in prefixes]
+    terms.extend('"' + " ".join(phrase) + '"' for phrase in phrases)
+    return " AND ".join(terms) or None
+
+
+class SqliteMessageLog:
+    """Message history for one channel or thread, stored in a shared SQLite database.
+
+    Implements the same interface as ``MessageLog``. Messages are rows keyed by
+    (log, seq), with indexes on message id, reply parent, author and pinned flag and
+    an FTS5 table for search, so every read is an indexed query and nothing is held
+    in memory between calls.
+    """
+
+    def __init__(self, db_path: str, key: str, lock=None):
+        self.db_path = db_path
+        self.key = key
+        self.lock = lock if lock is not None else threading.RLock()
+        self.last_write = 0.0
+        self.on_grow: Optional[Callable[[], None]] = None
+        self.conn = connect(db_path)
+        with _db_lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO logs (log) VALUES (?)", (key,))
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with _db_lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _messages(self, sql: str, params: tuple = ()) -> List[dict]:
+        return [json.loads(row[0]) for row in self._query(sql, params)]
+
+    @property
+    def head_seq(self) -> int:
+        return self._query("SELECT head_seq FROM logs WHERE log = ?", (self.key,))[0][0]
+
+    # -- positions -------------------------------------------------------
+
+    def count(self) -> int:
+        return self._query("SELECT count FROM logs WHERE log = ?", (self.key,))[0][0]
+
+    def seq_of(self, message_id) -> Optional[int]:
+        rows = self._query("SELECT seq FROM messages WHERE log = ? AND id = ?", (self.key, message_id))
+        return rows[0][0] if rows else None
+
+    def count_after(self, seq: int) -> int:
+        return self._query("SELECT COUNT(*) FROM messages WHERE log = ? AND seq > ?", (self.key, seq))[0][0]
+
+    def position(self, message_id) -> Optional[int]:
+        seq = self.seq_of(message_id)
+        if seq is None:
+            return None
+        return self._query("SELECT COUNT(*) FROM messages WHERE log = ? AND seq < ?", (self.key, seq))[0][0]
+
+    # -- reads -----------------------------------------------------------
+
+    def slice(self, begin: int, end: int) -> List[dict]:
+        begin = max(begin, 0)
+        if end <= begin:
+            return []
+        return self._messages(
+            "SELECT data FROM messages WHERE log = ? ORDER BY seq LIMIT ? OFFSET ?",
+            (self.key, end - begin, begin),
+        )
+
+    def page(self, start, limit: int) -> List[dict]:
+        """Return up to ``limit`` messages ending ``start`` messages from the newest,
+        or ending just before the message whose id is ``start``."""
+        if limit <= 0:
+            return []
+        if isinstance(start, int):
+            rows = self._messages(
+                "SELECT data FROM messages WHERE log = ? ORDER BY seq DESC LIMIT ? OFFSET ?",
+                (self.key, limit, max(start, 0)),
+            )
+        else:
+            seq = self.seq_of(start)
+            if seq is None:
+                return []
+            rows = self._messages(
+                "SELECT data FROM messages WHERE log = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (self.key, seq, limit),
+            )
+        rows.reverse()
+        return rows
+
+    def around(self, message_id, above: int = 50, below: int = 50) -> Tuple[Optional[List[dict]], Optional[int], Optional[int]]:
+        """Return messages surrounding ``message_id`` with their [start, end) positions."""
+        above = max(0, min(above, 200))
+        below = max(0, min(below, 200))
+        with self.lock:
+            seq = self.seq_of(message_id)
+            if seq is None:
+                return None, None, None
+            target = self.position(message_id)
+            older = self._messages(
+                "SELECT data FROM messages WHERE log = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (self.key, seq, below),
+            )
+            newer = self._messages(
+                "SELECT data FROM messages WHERE log = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (self.key, seq, above + 1),
+            )
+            older.reverse()
+            start = target - len(older)
+            return older + newer, start, start + len(older) + len(newer)
+
+    def _seq_at(self, timestamp: float) -> int:
+        """Return a sequence number splitting messages sent before ``timestamp`` (below
+        it) from those sent at or after it, by binary search over the seq index."""
+        lo, hi = 0, self.head_seq + 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            rows = self._query(
+                "SELECT seq, id, data FROM messages WHERE log = ? AND seq >= ? AND seq < ? ORDER BY seq LIMIT 1",
+                (self.key, mid, hi),
+            )
+            if not rows:
+                hi = mid
+                continue
+            seq, message_id, data = rows[0]
+            sent = snowflake.timestamp_of(message_id)
+            if sent is None:
+                sent = json.loads(data).get("timestamp")
+            if (sent if isinstance(sent, (int, float)) else 0) < timestamp:
+                lo = seq + 1
+            else:
+                hi = seq
+        return lo
+
+    def before(self, timestamp: float, limit: int) -> List[dict]:
+        """Return up to ``limit`` of the newest messages sent before ``timestamp``."""
+        if limit <= 0:
+            return []
+        rows = self._messages(
+            "SELECT data FROM messages WHERE log = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (self.key, self._seq_at(timestamp), limit),
+        )
+        rows.reverse()
+        return rows
+
+    def after(self, timestamp: float, limit: int) -> List[dict]:
+        """Return up to ``limit`` of the oldest messages sent at or after ``timestamp``."""
+        if limit <= 0:
+            return []
+        return self._messages(
+            "SELECT data FROM messages WHERE log = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (self.key, self._seq_at(timestamp), limit),
+        )
+
+    def get(self, message_id) -> Optional[dict]:
+        rows = self._messages("SELECT data FROM messages WHERE log = ? AND id = ?", (self.key, message_id))
+        return rows[0] if rows else None
+
+    def iter_messages(self, reverse: bool = False, after_seq: int = 0) -> Iterator[dict]:
+        if reverse:
+            sql = "SELECT seq, data FROM messages WHERE log = ? AND seq < ? AND seq > ? ORDER BY seq DESC LIMIT ?"
+            cursor = float("inf")
+        else:
+            sql = "SELECT seq, data FROM messages WHERE log = ? AND seq > ? AND seq > ? ORDER BY seq LIMIT ?"
+            cursor = 0
+        while True:
+            rows = self._query(sql, (self.key, cursor, after_seq, _ITER_BATCH))
+            for _, data in rows:
+                yield json.loads(data)
+            if len(rows) < _ITER_BATCH:
+                return
+            cursor = rows[-1][0]
+
+    def search(self, query: str, limit: int = 50, before=None) -> List[dict]:
+        """Return up to ``limit`` messages matching ``query``, newest first."""
+        expression = _match_expression(query)
+        if expression is None or limit <= 0:
+            return []
+        cursor = float("inf")
+        if before is not None:
+            cursor = self.seq_of(before)
+            if cursor is None:
+                return []
+        return self._messages(
+            "SELECT m.data FROM messages_fts JOIN messages m ON m.pk = messages_fts.rowid "
+            "WHERE messages_fts MATCH ? AND m.log = ? AND m.seq < ? ORDER BY m.seq DESC LIMIT ?",
+            (expression, self.key, cursor, limit),
+        )
+
+    def replies(self, message_id, limit: int = 50, after=None) -> List[dict]:
+        """Return up to ``limit`` messages replying to ``message_id``, oldest first."""
+        if limit <= 0:
+            return []
+        cursor = 0
+        if after is not None:
+            cursor = self.seq_of(after)
+            if cursor is None:
+                return []
+        return self._messages(
+            "SELECT data FROM messages WHERE log = ? AND reply_to = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (self.key, message_id, cursor, limit),
+        )
+
+    def pinned_messages(self) -> List[dict]:
+        """Return the pinned messages, newest first."""
+        return self._messages(
+            "SELECT data FROM messages WHERE log = ? AND pinned ORDER BY seq DESC", (self.key,)
+        )
+
+    # -- writes ----------------------------------------------------------
+
+    def append(self, message: dict, sync: Union[bool, str, None] = None) -> Future:
+        """Append a message. It is committed before this returns, so the returned future
+        is already resolved; ``sync`` is accepted for compatibility with ``MessageLog``."""
+        with self.lock, _db_lock, self.conn:
+            message["seq"] = self.head_seq + 1
+            self.conn.execute(
+                "INSERT INTO messages (log, seq, id, user, reply_to, pinned, content, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.key, message["seq"]) + _columns(message),
+            )
+            self.conn.execute(
+                "UPDATE logs SET head_seq = ?, count = count + 1 WHERE log = ?", (message["seq"], self.key)
+            )
+            self.last_write = time.monotonic()
+        return group_commit.done(True)
+
+    def load(self, messages: Iterable[dict], head_seq: int = 0) -> int:
+        """Bulk-insert messages keeping their sequence numbers; used by storage migration.
+
+        Messages without a sequence number are numbered after the current head.
+        ``head_seq`` carries over the source's head, which is past the newest message
+        when that was deleted.
+        """
+        loaded = 0
+        with self.lock, _db_lock, self.conn:
+            head = max(self.head_seq, head_seq)
+            for message in messages:
+                if message.get("seq") is None:
+                    message["seq"] = head + 1
+                head = max(head, message["seq"])
+                self.conn.execute(
+                    "INSERT INTO messages (log, seq, id, user, reply_to, pinned, content, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.key, message["seq"]) + _columns(message),
+                )
+                loaded += 1
+            self.conn.execute(
+                "UPDATE logs SET head_seq = ?, count = count + ? WHERE log = ?", (head, loaded, self.key)
+            )
+        return loaded
+
+    def update(self, message_id, mutate: Callable[[dict], bool]) -> bool:
+        """Apply ``mutate`` to a copy of a message and persist it, with its ``rev``
+        bumped, if it returns True."""
+        with self.lock, _db_lock, self.conn:
+            msg = self.get(message_id)
+            if msg is None or not mutate(msg):
+                return False
+            msg["rev"] = msg.get("rev", 0) + 1
+            self.conn.execute(
+                "UPDATE messages SET id = ?, user = ?, reply_to = ?, pinned = ?, content = ?, data = ? "
+                "WHERE log = ? AND id = ?",
+                _columns(msg) + (self.key, message_id),
+            )
+            return True
+
+    def delete(self, message_id) -> bool:
+        with self.lock, _db_lock, self.conn:
+            deleted = self.conn.execute(
+                "DELETE FROM messages WHERE log = ? AND id = ?", (self.key, message_id)
+            ).rowcount
+            if deleted:
+                self.conn.execute("UPDATE logs SET count = count - ? WHERE log = ?", (deleted, self.key))
+            return bool(deleted)
+
+    def purge(self, count: Optional[int] = None) -> None:
+        """Delete the oldest ``count`` messages, or every message when count is None."""
+        with self.lock, _db_lock, self.conn:
+            if count is None:
+                self.conn.execute("DELETE FROM messages WHERE log = ?", (self.key,))
+                self.conn.execute("UPDATE logs SET count = 0 WHERE log = ?", (self.key,))
+                return
+            deleted = self.conn.execute(
+                "DELETE FROM messages WHERE pk IN "
+                "(SELECT pk FROM messages WHERE log = ? ORDER BY seq LIMIT ?)",
+                (self.key, max(0, count)),
+            ).rowcount
+            self.conn.execute("UPDATE logs SET count = count - ? WHERE log = ?", (deleted, self.key))
+
+    def destroy(self) -> None:
+        with self.lock, _db_lock, self.conn:
+            self.conn.execute("DELETE FROM messages WHERE log = ?", (self.key,))
+            self.conn.execute("UPDATE logs SET head_seq = 0, count = 0 WHERE log = ?", (self.key,))
+
+    # -- maintenance -----------------------------------------------------
+    # Nothing is cached in memory and SQLite reuses freed pages itself, so the cache
+    # manager's trimming, index saving and compaction have nothing to do here.
+
+    def resident(self) -> Tuple[int, int]:
+        return 0, 0
+
+    def recover(self) -> bool:
+        # Appends commit in the caller's transaction, so none can fail after the fact.
+        return False
+
+    def trim(self) -> None:
+        pass
+
+    def save_search(self) -> int:
+        return 0
+
+    def garbage(self) -> int:
+        return 0
+
+    def compact(self, min_garbage: int = 0, garbage_ratio: float = 0.0) -> int:
+        return 0
+
+    def archive(self, keep_messages: int = 0, max_age: float = 0, codec: str = "zlib",
+                block_bytes: int = 65536) -> int:
+        return 0
@@ -0,0 +1,88 @@
+import os
+from typing import Callable, Iterator, List, Optional, Protocol, Tuple
+
+from config_store import get_config_value
+
+from . import message_log
+from .message_log import DEFAULT_SEGMENT_SIZE, MessageLog
+from .sqlite_log import SqliteMessageLog
+
+BACKEND_JSONL = "jsonl"
+BACKEND_SQLITE = "sqlite"
+BACKENDS = (BACKEND_JSONL, BACKEND_SQLITE)
+
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+SQLITE_PATH = os.path.join(_MODULE_DIR, "messages.db")
+
+
+class MessageStore(Protocol):
+    """Interface shared by the message storage backends.
+
+    ``MessageLog`` keeps each channel and thread in its own JSONL files;
+    ``SqliteMessageLog`` keeps them all in one SQLite database. ``channels`` and
+    ``threads`` only use the methods below, so either can be selected with
+    ``storage.backend``.
+    """
+
+    lock: object
+    head_seq: int
+    last_write: float
+    on_grow: Optional[Callable[[], None]]
+
+    def count(self) -> int: ...
+    def seq_of(self, message_id) -> Optional[int]: ...
+    def count_after(self, seq: int) -> int: ...
+    def position(self, message_id) -> Optional[int]: ...
+    def page(self, start, limit: int) -> List[dict]: ...
+    def around(self, message_id, above: int = 50, below: int = 50) -> Tuple[Optional[List[dict]], Optional[int], Optional[int]]: ...
+    def before(self, timestamp: float, limit: int) -> List[dict]: ...
+    def after(self, timestamp: float, limit: int) -> List[dict]: ...
+    def get(self, message_id) -> Optional[dict]: ...
+    def iter_messages(self, reverse: bool = False, after_seq: int = 0) -> Iterator[dict]: ...
+    def search(self, query: str, limit: int = 50, before=None) -> List[dict]: ...
+    def replies(self, message_id, limit: int = 50, after=None) -> List[dict]: ...
+    def pinned_messages(self) -> List[dict]: ...
+    def append(self, message: dict, sync=None): ...
+    def update(self, message_id, mutate: Callable[[dict], bool]) -> bool: ...
+    def delete(self, message_id) -> bool: ...
+    def purge(self, count: Optional[int] = None) -> None: ...
+    def recover(self) -> bool: ...
+    def destroy(self) -> None: ...
+    def resident(self) -> Tuple[int, int]: ...
+    def trim(self) -> None: ...
+    def save_search(self) -> int: ...
+    def compact(self, min_garbage: int = 0, garbage_ratio: float = 0.0) -> int: ...
+    def archive(self, keep_messages: int = 0, max_age: float = 0, codec: str = "zlib",
+                block_bytes: int = 65536) -> int: ...
+
+
+def backend_name() -> str:
+    backend = get_config_value("storage", "backend", default=BACKEND_JSONL)
+    return backend if backend in BACKENDS else BACKEND_JSONL
+
+
+def log_key(kind: str, name: str) -> str:
+    """Name of a channel's or thread's history in the SQLite database."""
+    return f"{kind}/{name}"
+
+
+def open_log(kind: str, name: str, path: str, lock=None, backend: Optional[str] = None) -> MessageStore:
+    """Open the history of a channel or thread with the configured backend.
+
+    ``path`` is the JSONL tail file used by the jsonl backend; ``kind`` and ``name``
+    ("channel"/"thread" and its name or id) identify the history in SQLite.
+    """
+    if (backend or backend_name()) == BACKEND_SQLITE:
+        return SqliteMessageLog(SQLITE_PATH, log_key(kind, name), lock=lock)
+    return MessageLog(
+        path,
+        lock=lock,
+        segment_size=get_config_value("storage", "segment_size", default=DEFAULT_SEGMENT_SIZE),
+    )
+
+
+def read_around(kind: str, name: str, path: str, message_id, above: int = 50, below: int = 50) -> Tuple[Optional[List[dict]], Optional[int], Optional[int]]:
+    """Serve ``around`` for a history that is not open, without caching it."""
+    if backend_name() == BACKEND_SQLITE:
+        return open_log(kind, name, path).around(message_id, above, below)
+    return message_log.read_around(path, message_id, above, below)
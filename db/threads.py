@@ -1,34 +1,22 @@
 import copy
 import json
 import os
-import platform
-import subprocess
 import threading
 import time
 import uuid
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from . import users
+from . import cache_manager, io_executor, storage, users
 from .shared import convert_messages_to_user_format
-from .storage_utils import (
-    find_line_number_grep,
-    count_lines_wc,
-    read_lines_range,
-    get_messages_around_from_file,
-    build_id_index,
-)
-
-_IS_WINDOWS = platform.system() == "Windows"
+
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 threads_db_dir = os.path.join(_MODULE_DIR, "threads")
 thread_messages_dir = os.path.join(_MODULE_DIR, "threadMessages")
 
-MESSAGE_PADDING_SIZE = 512
-
 _lock = threading.RLock()
 _thread_locks: Dict[str, threading.RLock] = {}
 _threads_cache: Dict[str, dict] = {}
-_messages_cache: Dict[str, dict] = {}
+_messages_cache: Dict[str, storage.MessageStore] = {}
 
 
 def _get_thread_lock(thread_id: str) -> threading.RLock:
@@ -69,130 +57,32 @@ def _load_thread_metadata(thread_id: str) -> Optional[dict]:
 
 
 def _save_thread_metadata(thread_id: str, metadata: dict) -> None:
-    thread_file = _get_thread_file_path(thread_id)
-    tmp = thread_file + ".tmp"
-    with open(tmp, 'w') as f:
-        json.dump(metadata, f, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, thread_file)
-
-
-def _load_thread_messages(thread_id: str) -> dict:
-    messages_file = _get_messages_file_path(thread_id)
-    messages = []
-    offsets = []
-    lengths = []
-
-    try:
-        with open(messages_file, 'rb') as f:
-            raw = f.read()
-    except FileNotFoundError:
-        return {
-            "messages": [],
-            "id_to_idx": {},
-            "offsets": [],
-            "lengths": [],
-        }
-
-    if not raw.strip():
-        return {
-            "messages": [],
-            "id_to_idx": {},
-            "offsets": [],
-            "lengths": [],
-        }
-
-    pos = 0
-    for line_bytes in raw.split(b'\n'):
-        content_bytes = line_bytes.rstrip(b'\r')
-        line_str = content_bytes.decode('utf-8').strip()
-        if line_str:
-            try:
-                msg = json.loads(line_str)
-                messages.append(msg)
-                offsets.append(pos)
-                lengths.append(len(content_bytes))
-            except json.JSONDecodeError:
-                pass
-        pos += len(line_bytes) + 1
-
-    return {
-        "messages": messages,
-        "id_to_idx": build_id_index(messages),
-        "offsets": offsets,
-        "lengths": lengths,
-    }
-
-
-def _get_thread_messages_cache(thread_id: str) -> dict:
-    if thread_id not in _messages_cache:
-        _messages_cache[thread_id] = _load_thread_messages(thread_id)
-    return _messages_cache[thread_id]
-
+    # The cached dict is handed out to callers, so the writer gets its own copy.
+    io_executor.write_json(_get_thread_file_path(thread_id), copy.deepcopy(metadata), op="threads")
 
-def _full_rewrite_messages(thread_id: str):
-    cache = _messages_cache.get(thread_id)
-    if cache is None:
-        return
 
-    messages = cache["messages"]
-    messages_file = _get_messages_file_path(thread_id)
-    tmp = messages_file + ".tmp"
-
-    lines = [json.dumps(msg, separators=(',', ':'), ensure_ascii=False) for msg in messages]
-    encoded_lines = [line.encode('utf-8') for line in lines]
-    content_bytes = b'\n'.join(encoded_lines)
-
-    with open(tmp, 'wb') as f:
-        f.write(content_bytes)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, messages_file)
-
-    offsets = []
-    lengths = []
-    pos = 0
-    for lb in encoded_lines:
-        offsets.append(pos)
-        lengths.append(len(lb))
-        pos += len(lb) + 1
-
-    cache["offsets"] = offsets
-    cache["lengths"] = lengths
-
-
-def _patch_line_in_place(thread_id: str, idx: int, new_serialised: str) -> bool:
-    cache = _messages_cache.get(thread_id)
-    if cache is None or cache.get("offsets") is None:
-        return False
-
-    offsets = cache["offsets"]
-    lengths = cache["lengths"]
-
-    if idx >= len(offsets):
-        return False
+def _load_thread_messages(thread_id: str) -> storage.MessageStore:
+    log = storage.open_log("thread", thread_id, _get_messages_file_path(thread_id), lock=_get_thread_lock(thread_id))
+    _messages_cache[thread_id] = log
+    cache_manager.register("thread", thread_id, log, lambda: _evict_thread_messages(thread_id, log))
+    return log
 
-    new_bytes = new_serialised.encode("utf-8")
-    orig_len = lengths[idx]
 
-    if len(new_bytes) > orig_len:
-        return False
+def _evict_thread_messages(thread_id: str, log: storage.MessageStore) -> None:
+    if _messages_cache.get(thread_id) is log:
+        del _messages_cache[thread_id]
 
-    padding = orig_len - len(new_bytes)
-    if padding > 0:
-        new_bytes = new_bytes + b" " * padding
 
-    messages_file = _get_messages_file_path(thread_id)
-    try:
-        with open(messages_file, "r+b") as f:
-            f.seek(offsets[idx])
-            f.write(new_bytes)
-            f.flush()
-            os.fsync(f.fileno())
-        return True
-    except OSError:
-        return False
+def _get_thread_messages_cache(thread_id: str) -> storage.MessageStore:
+    log = _messages_cache.get(thread_id)
+    if log is None:
+        with _get_thread_lock(thread_id):
+            log = _messages_cache.get(thread_id)
+            if log is None:
+                return _load_thread_messages(thread_id)
+    log.recover()
+    cache_manager.touch("thread", thread_id)
+    return log
 
 
 def create_thread(parent_channel: str, name: str, creator: str) -> dict:
@@ -212,13 +102,6 @@ def create_thread(parent_channel: str, name: str, creator: str) -> dict:
     _save_thread_metadata(thread_id, metadata)
     _threads_cache[thread_id] = metadata
 
-    _messages_cache[thread_id] = {
-        "messages": [],
-        "id_to_idx": {},
-        "offsets": [],
-        "lengths": [],
-    }
-
     return copy.deepcopy(metadata)
 
 
@@ -236,198 +119,117 @@ def get_thread(thread_id: str) -> Optional[dict]:
 
 def get_channel_threads(channel_name: str) -> List[dict]:
     result = []
-    for filename in os.listdir(threads_db_dir):
-        if filename.endswith('.json'):
-            thread_id = filename[:-5]
-            metadata = get_thread(thread_id)
-            if metadata and metadata.get("parent_channel") == channel_name:
-                result.append(metadata)
+    # A new thread is cached before its queued metadata write reaches the directory.
+    thread_ids = [filename[:-5] for filename in os.listdir(threads_db_dir) if filename.endswith('.json')]
+    for thread_id in dict.fromkeys(thread_ids + list(_threads_cache)):
+        metadata = get_thread(thread_id)
+        if metadata and metadata.get("parent_channel") == channel_name:
+            result.append(metadata)
     return result
 
 
 def get_thread_messages(thread_id: str, start=0, limit=100) -> List[dict]:
-    cache = _get_thread_messages_cache(thread_id)
-    messages = cache["messages"]
+    with _get_thread_lock(thread_id):
+        if not limit:
+            limit = 100
+        if limit > 200:
+            limit = 200
+        return _get_thread_messages_cache(thread_id).page(start, limit)
 
-    if not messages:
-        return []
 
-    if not limit:
-        limit = 100
-    if limit > 200:
-        limit = 200
+def get_thread_message_count(thread_id: str) -> int:
+    return _get_thread_messages_cache(thread_id).count()
 
-    if isinstance(start, int):
-        if start < 0:
-            start = 0
-        end = len(messages) - start
-        begin = max(0, end - limit)
-    else:
-        idx = cache["id_to_idx"].get(start)
-        if idx is None:
-            return []
-        end = idx
-        begin = max(0, end - limit)
 
-    begin = max(begin, 0)
-    end = min(end, len(messages))
+def get_thread_message_seq(thread_id: str, message_id: str) -> Optional[int]:
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).seq_of(message_id)
 
-    return list(messages[begin:end])
+
+def count_thread_messages_after(thread_id: str, seq: int) -> int:
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).count_after(seq)
 
 
 def get_all_thread_messages(thread_id: str) -> List[dict]:
     """Return all messages for a thread without the 200-message limit cap."""
-    cache = _get_thread_messages_cache(thread_id)
-    messages = cache["messages"]
-    if not messages:
-        return []
-    return [msg.copy() for msg in messages]
+    return list(_get_thread_messages_cache(thread_id).iter_messages())
+
 
+def iter_thread_messages(thread_id: str, after_seq: int = 0) -> Iterator[dict]:
+    """Yield a thread's messages oldest first (see iter_channel_messages)."""
+    return _get_thread_messages_cache(thread_id).iter_messages(after_seq=after_seq)
 
-def save_thread_message(thread_id: str, message: dict, sync: bool = True) -> bool:
+
+def save_thread_message(thread_id: str, message: dict, sync=None):
     """Save a message to a thread.
 
     Args:
         thread_id: ID of the thread
         message: Message dict to save
-        sync: If True, fsync to disk (slower but safer). If False, rely on OS buffering (faster).
-    """
-    messages_file = _get_messages_file_path(thread_id)
-    cache = _get_thread_messages_cache(thread_id)
-    messages = cache["messages"]
+        sync: Durability policy. "fsync" (or True) syncs this write before returning,
+            "group" batches it with other writes into one fsync a few milliseconds later,
+            "buffered" (or False) relies on OS buffering. None uses storage.durability.
 
-    serialised = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
-    serialised_bytes = serialised.encode("utf-8")
-    padded_bytes = serialised_bytes + b" " * MESSAGE_PADDING_SIZE
-
-    try:
-        with open(messages_file, "rb") as f:
-            first_byte = f.read(1)
-    except FileNotFoundError:
-        first_byte = None
-
-    if first_byte is not None:
-        new_offset = cache["offsets"][-1] + cache["lengths"][-1] + 1 if messages else 0
-        prefix = b"\n" if messages else b""
-
-        with open(messages_file, "ab") as f:
-            f.write(prefix + padded_bytes)
-            if sync:
-                f.flush()
-                os.fsync(f.fileno())
-
-        idx = len(messages)
-        messages.append(message)
-        cache["id_to_idx"][message["id"]] = idx
-        cache["offsets"].append(new_offset)
-        cache["lengths"].append(len(padded_bytes))
-    else:
-        with open(messages_file, "wb") as f:
-            f.write(padded_bytes)
-            if sync:
-                f.flush()
-                os.fsync(f.fileno())
-
-        messages.append(message)
-        cache["id_to_idx"][message["id"]] = 0
-        cache["offsets"] = [0]
-        cache["lengths"] = [len(padded_bytes)]
-
-    return True
+    Returns:
+        A concurrent.futures.Future that resolves to True once the message is durable
+        under that policy. Async callers can await it with asyncio.wrap_future.
+    """
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).append(message, sync=sync)
 
 
 def edit_thread_message(thread_id: str, message_id: str, new_content: str, embeds=None) -> bool:
-    cache = _get_thread_messages_cache(thread_id)
-    messages = cache["messages"]
-    idx = cache["id_to_idx"].get(message_id)
-
-    if idx is None:
-        return False
-
-    messages[idx] = messages[idx].copy()
-    messages[idx]["content"] = new_content
-    messages[idx]["edited"] = True
-    if embeds is not None:
-        messages[idx]["embeds"] = embeds
+    def mutate(msg):
+        msg["content"] = new_content
+        msg["edited"] = True
+        if embeds is not None:
+            msg["embeds"] = embeds
+        return True
 
-    _full_rewrite_messages(thread_id)
-    return True
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).update(message_id, mutate)
 
 
 def delete_thread_message(thread_id: str, message_id: str) -> bool:
-    cache = _get_thread_messages_cache(thread_id)
-    messages = cache["messages"]
-    idx = cache["id_to_idx"].get(message_id)
-
-    if idx is None:
-        return False
-
-    messages.pop(idx)
-    cache["id_to_idx"] = build_id_index(messages)
-    _full_rewrite_messages(thread_id)
-    return True
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).delete(message_id)
 
 
 def get_thread_message_by_id(thread_id: str, message_id: str) -> Optional[dict]:
-    cache = _get_thread_messages_cache(thread_id)
-    idx = cache["id_to_idx"].get(message_id)
-    if idx is None:
-        return None
-    return cache["messages"][idx].copy()
-
-
-def add_reaction_to_thread_message(thread_id: str, message_id: str, emoji: str, user_id: str) -> bool:
     with _get_thread_lock(thread_id):
-        cache = _get_thread_messages_cache(thread_id)
-        messages = cache["messages"]
-        idx = cache["id_to_idx"].get(message_id)
-
-        if idx is None:
-            return False
+        return _get_thread_messages_cache(thread_id).get(message_id)
 
-        msg = messages[idx] = messages[idx].copy()
-        if "reactions" not in msg:
-            msg["reactions"] = {}
 
-        if emoji not in msg["reactions"]:
-            msg["reactions"][emoji] = []
-
-        if user_id in msg["reactions"][emoji]:
+def add_reaction_to_thread_message(thread_id: str, message_id: str, emoji: str, user_id: str) -> bool:
+    def mutate(msg):
+        reactions = {k: list(v) for k, v in msg.get("reactions", {}).items()}
+        if user_id in reactions.get(emoji, []):
             return False
-
-        msg["reactions"][emoji].append(user_id)
-        serialised = json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
-        if not _patch_line_in_place(thread_id, idx, serialised):
-            _full_rewrite_messages(thread_id)
+        reactions.setdefault(emoji, []).append(user_id)
+        msg["reactions"] = reactions
         return True
 
-
-def remove_reaction_from_thread_message(thread_id: str, message_id: str, emoji: str, user_id: str) -> bool:
     with _get_thread_lock(thread_id):
-        cache = _get_thread_messages_cache(thread_id)
-        messages = cache["messages"]
-        idx = cache["id_to_idx"].get(message_id)
+        return _get_thread_messages_cache(thread_id).update(message_id, mutate)
 
-        if idx is None:
-            return False
 
-        msg = messages[idx] = messages[idx].copy()
-        if "reactions" not in msg or emoji not in msg["reactions"]:
+def remove_reaction_from_thread_message(thread_id: str, message_id: str, emoji: str, user_id: str) -> bool:
+    def mutate(msg):
+        reactions = {k: list(v) for k, v in msg.get("reactions", {}).items()}
+        if user_id not in reactions.get(emoji, []):
             return False
+        reactions[emoji].remove(user_id)
+        if not reactions[emoji]:
+            del reactions[emoji]
+        if reactions:
+            msg["reactions"] = reactions
+        else:
+            del msg["reactions"]
+        return True
 
-        if user_id in msg["reactions"][emoji]:
-            msg["reactions"][emoji].remove(user_id)
-            if not msg["reactions"][emoji]:
-                del msg["reactions"][emoji]
-            if not msg["reactions"]:
-                del msg["reactions"]
-
-            serialised = json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
-            if not _patch_line_in_place(thread_id, idx, serialised):
-                _full_rewrite_messages(thread_id)
-            return True
-
-        return False
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).update(message_id, mutate)
 
 
 def archive_thread(thread_id: str) -> bool:
@@ -481,20 +283,20 @@ def unlock_thread(thread_id: str) -> bool:
 def delete_thread(thread_id: str) -> bool:
     with _lock:
         thread_file = _get_thread_file_path(thread_id)
-        messages_file = _get_messages_file_path(thread_id)
+        # A queued metadata write would bring the file back.
+        io_executor.flush(thread_file)
 
         if os.path.exists(thread_file):
             os.remove(thread_file)
 
-        if os.path.exists(messages_file):
-            os.remove(messages_file)
+        with _get_thread_lock(thread_id):
+            _get_thread_messages_cache(thread_id).destroy()
+            _messages_cache.pop(thread_id, None)
+            cache_manager.forget("thread", thread_id)
 
         if thread_id in _threads_cache:
             del _threads_cache[thread_id]
 
-        if thread_id in _messages_cache:
-            del _messages_cache[thread_id]
-
         return True
 
 
@@ -540,8 +342,10 @@ def remove_thread_participant(thread_id: str, user_id: str) -> bool:
 
 def reload_threads():
     global _threads_cache, _messages_cache
+    io_executor.flush()
     _threads_cache = {}
     _messages_cache = {}
+    cache_manager.forget_kind("thread")
 
 
 def is_thread_locked(thread_id: str) -> bool:
@@ -571,11 +375,7 @@ def update_thread(thread_id: str, updates: dict) -> bool:
 
 
 def get_thread_message(thread_id: str, message_id: str) -> Optional[dict]:
-    cache = _get_thread_messages_cache(thread_id)
-    idx = cache["id_to_idx"].get(message_id)
-    if idx is None:
-        return None
-    return cache["messages"][idx].copy()
+    return get_thread_message_by_id(thread_id, message_id)
 
 
 def join_thread(thread_id: str, user_id: str) -> bool:
@@ -587,8 +387,36 @@ def leave_thread(thread_id: str, user_id: str) -> bool:
 
 
 def get_thread_messages_around(thread_id: str, message_id: str, above: int = 50, below: int = 50) -> Tuple[Optional[List[dict]], Optional[int], Optional[int]]:
-    messages_file = _get_messages_file_path(thread_id)
-    return get_messages_around_from_file(messages_file, message_id, above, below)
+    with _get_thread_lock(thread_id):
+        log = _messages_cache.get(thread_id)
+        if log is None:
+            return storage.read_around("thread", thread_id, _get_messages_file_path(thread_id), message_id, above, below)
+        cache_manager.touch("thread", thread_id)
+        return log.around(message_id, above, below)
+
+
+def get_thread_messages_before(thread_id: str, timestamp: float, limit: int = 50) -> List[dict]:
+    """Return up to ``limit`` thread messages sent before ``timestamp``, oldest first."""
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).before(timestamp, max(1, min(limit, 200)))
+
+
+def get_thread_messages_after(thread_id: str, timestamp: float, limit: int = 50) -> List[dict]:
+    """Return up to ``limit`` thread messages sent at or after ``timestamp``, oldest first."""
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).after(timestamp, max(1, min(limit, 200)))
+
+
+def search_thread_messages(thread_id: str, query: str, limit: int = 50, before=None) -> List[dict]:
+    """Return thread messages matching ``query``, newest first (see search_channel_messages)."""
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).search(query, limit, before)
+
+
+def get_thread_message_replies(thread_id: str, message_id: str, limit: int = 50, after=None) -> List[dict]:
+    """Return replies to a thread message, oldest first (see get_message_replies)."""
+    with _get_thread_lock(thread_id):
+        return _get_thread_messages_cache(thread_id).replies(message_id, limit, after)
 
 
 def add_thread_reaction(thread_id: str, message_id: str, emoji: str, user_id: str) -> bool:
@@ -1,7 +1,9 @@
 import json
 import os
 import threading
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple
+
+from . import channels, io_executor, threads
 
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 _UNREADS_FILE = os.path.join(_MODULE_DIR, "unreads.json")
@@ -24,12 +26,7 @@ def _load() -> Dict[str, Dict[str, str]]:
 
 def _save(data: Dict[str, Dict[str, str]]) -> None:
     global _cache, _loaded
-    tmp = _UNREADS_FILE + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(data, f, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, _UNREADS_FILE)
+    io_executor.write_json(_UNREADS_FILE, data, lock=_lock, op="unreads")
     _cache = data
     _loaded = True
 
@@ -54,16 +51,33 @@ def _ensure_storage():
 _ensure_storage()
 
 
-def get_last_read(user_id: str, channel: Optional[str] = None, thread_id: Optional[str] = None) -> Optional[str]:
-    key = f"thread/{thread_id}" if thread_id else channel
+def _entry_id(entry) -> Optional[str]:
+    # Entries written before sequence numbers were tracked are bare message ids.
+    if isinstance(entry, dict):
+        return entry.get("id")
+    return entry
+
+
+def _entry_seq(entry) -> Optional[int]:
+    if isinstance(entry, dict):
+        return entry.get("seq")
+    return None
+
+
+def _get_entry(user_id: str, key: Optional[str]):
     if not key:
         return None
     with _lock:
-        user_unreads = _get_cache().get(user_id, {})
-        return user_unreads.get(key)
+        return _get_cache().get(user_id, {}).get(key)
 
 
-def set_last_read(user_id: str, message_id: str, channel: Optional[str] = None, thread_id: Optional[str] = None) -> bool:
+def set_last_read(user_id: str, message_id: str, channel: Optional[str] = None, thread_id: Optional[str] = None,
+                  seq: Optional[int] = None) -> bool:
+    """Record the last message a user has read in a channel or thread.
+
+    ``seq`` is the message's sequence number; storing it lets unread counts be taken
+    without looking the message up again.
+    """
     key = f"thread/{thread_id}" if thread_id else channel
     if not key or not message_id:
         return False
@@ -71,36 +85,49 @@ def set_last_read(user_id: str, message_id: str, channel: Optional[str] = None,
         data = _get_cache()
         if user_id not in data:
             data[user_id] = {}
-        data[user_id][key] = message_id
+        data[user_id][key] = {"id": message_id, "seq": seq} if seq is not None else message_id
         _save(data)
     return True
 
 
-def get_all_last_reads(user_id: str) -> Dict[str, str]:
-    with _lock:
-        return dict(_get_cache().get(user_id, {}))
-
-
-def get_unread_count_for_channel(user_id: str, channel: str, messages: list) -> Tuple[int, Optional[str]]:
-    last_read = get_last_read(user_id, channel=channel)
+def _count_unread(entry, total: int, seq_of: Callable[[str], Optional[int]],
+                  count_after: Callable[[int], int]) -> int:
+    last_read = _entry_id(entry)
     if not last_read:
-        return len(messages), None
-
-    for i, msg in enumerate(messages):
-        if msg.get("id") == last_read:
-            return len(messages) - i - 1, last_read
-    return len(messages), last_read
-
-
-def get_unread_count_for_thread(user_id: str, thread_id: str, messages: list) -> Tuple[int, Optional[str]]:
-    last_read = get_last_read(user_id, thread_id=thread_id)
-    if not last_read:
-        return len(messages), None
-
-    for i, msg in enumerate(messages):
-        if msg.get("id") == last_read:
-            return len(messages) - i - 1, last_read
-    return len(messages), last_read
+        return total
+    seq = _entry_seq(entry)
+    if seq is None:
+        seq = seq_of(last_read)
+    if seq is None:
+        return total
+    return count_after(seq)
+
+
+def get_unread_count_for_channel(user_id: str, channel: str) -> Tuple[int, Optional[str]]:
+    """Return (unread count, last read message id) for a channel.
+
+    The count is the number of messages with a higher sequence number than the last
+    read one, so it still works after that message has been deleted.
+    """
+    entry = _get_entry(user_id, channel)
+    count = _count_unread(
+        entry,
+        channels.get_channel_message_count(channel),
+        lambda message_id: channels.get_channel_message_seq(channel, message_id),
+        lambda seq: channels.count_channel_messages_after(channel, seq),
+    )
+    return count, _entry_id(entry)
+
+
+def get_unread_count_for_thread(user_id: str, thread_id: str) -> Tuple[int, Optional[str]]:
+    entry = _get_entry(user_id, f"thread/{thread_id}")
+    count = _count_unread(
+        entry,
+        threads.get_thread_message_count(thread_id),
+        lambda message_id: threads.get_thread_message_seq(thread_id, message_id),
+        lambda seq: threads.count_thread_messages_after(thread_id, seq),
+    )
+    return count, _entry_id(entry)
 
 
 def delete_user_unreads(user_id: str) -> bool:
@@ -1,57 +1,244 @@
-import copy
 import json
 import os
-import secrets
+import shutil
 import threading
 import sys
 import bcrypt
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
 
-from . import roles
-from constants import ALLOWED_STATUSES
+from . import group_commit, io_executor, presence, roles
 
 from logger import Logger
 from config_store import get_config_value
 
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 users_index = os.path.join(_MODULE_DIR, "users.json")
+# Changes since the users.json snapshot, one JSON line per changed user holding
+# its whole new record (null once removed). While a snapshot is being written the
+# log is moved aside to users.log.1, which is deleted once the snapshot is on disk.
+users_log = os.path.join(_MODULE_DIR, "users.log")
+users_log_compacting = users_log + ".1"
+
+DEFAULT_COMPACT_AFTER = 1000
 
 DEFAULT_USERS: Dict[str, dict] = {}
 
 _lock = threading.RLock()
+# Records in the cache are never changed in place: writers build a new dict and
+# swap it in with _put_user, so get_user can hand out read-only views of them.
 _users_cache: Dict[str, dict] = {}
 _users_loaded: bool = False
 
-DEFAULT_STATUS = {"status": "online", "text": ""}
+# Secondary indexes over _users_cache, kept in step by _index_user on every mutation
+# and rebuilt whenever the cache is (re)loaded. Usernames are keyed lower-cased; a
+# name shared by several records maps to all of them, the first indexed winning lookups.
+_ids_by_username: Dict[str, Dict[str, None]] = {}
+_ids_by_role: Dict[str, Dict[str, None]] = {}
+_indexed: Dict[str, tuple] = {}
+# user id -> username as shown to clients. _names_version goes up whenever an entry
+# changes, so anything derived from usernames can tell it is stale.
+_usernames: Dict[str, str] = {}
+_names_version = 0
+
+_logged_changes = 0
+_compacting = False
+# (inode, size, mtime) of users.json as last loaded or written by this process; a
+# different one means the file was edited by hand (see reload_users).
+_snapshot_signature = None
+
+DEFAULT_STATUS = presence.DEFAULT_STATUS
+
+
+def _file_signature(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
 
 
 def _load_users() -> Dict[str, dict]:
-    global _users_cache, _users_loaded
+    global _users_cache, _users_loaded, _logged_changes, _snapshot_signature
+    group_commit.flush(users_log)
+    _snapshot_signature = _file_signature(users_index)
     try:
         with open(users_index, "r") as f:
             _users_cache = json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
         _users_cache = {}
+    # Entries carry whole records, so replaying one the snapshot already holds is harmless.
+    _logged_changes = _replay_log(users_log_compacting, _users_cache) + _replay_log(users_log, _users_cache)
     _users_loaded = True
+    _rebuild_indexes()
     return _users_cache
 
 
+def _replay_log(path: str, users: Dict[str, dict]) -> int:
+    try:
+        with open(path, "rb") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return 0
+    for line in lines:
+        try:
+            entry = json.loads(line)
+            user_id, user_data = entry["id"], entry["user"]
+        except (ValueError, KeyError, TypeError):
+            continue  # a line torn by a crash
+        if user_data is None:
+            users.pop(user_id, None)
+        else:
+            users[user_id] = user_data
+    return len(lines)
+
+
+def _index_keys(user_data: dict) -> tuple:
+    username = user_data.get("username")
+    return (
+        username.lower() if isinstance(username, str) else None,
+        tuple(dict.fromkeys(user_data.get("roles") or ())),
+    )
+
+
+def _index_user(user_id: str) -> None:
+    """Bring the secondary indexes in line with the cached record of ``user_id``.
+
+    Call after any change to a user's username or roles, and after
+    removing a user. Only the keys that changed are touched.
+    """
+    global _names_version
+    user_data = _users_cache.get(user_id)
+    username = user_data.get("username") if user_data is not None else None
+    if _usernames.get(user_id) != username:
+        if username:
+            _usernames[user_id] = username
+        else:
+            _usernames.pop(user_id, None)
+        _names_version += 1
+    old = _indexed.pop(user_id, (None, ()))
+    new = _index_keys(user_data) if user_data is not None else (None, ())
+    if user_data is not None:
+        _indexed[user_id] = new
+
+    old_name, old_roles = old
+    new_name, new_roles = new
+    if old_name != new_name:
+        if old_name is not None:
+            owners = _ids_by_username.get(old_name)
+            if owners is not None:
+                owners.pop(user_id, None)
+                if not owners:
+                    del _ids_by_username[old_name]
+        if new_name is not None:
+            _ids_by_username.setdefault(new_name, {})[user_id] = None
+    if old_roles != new_roles:
+        for role in old_roles:
+            if role not in new_roles:
+                members = _ids_by_role.get(role)
+                if members is not None:
+                    members.pop(user_id, None)
+                    if not members:
+                        del _ids_by_role[role]
+        for role in new_roles:
+            _ids_by_role.setdefault(role, {})[user_id] = None
+
+
+def _rebuild_indexes() -> None:
+    global _names_version
+    _ids_by_username.clear()
+    _usernames.clear()
+    _names_version += 1
+    _ids_by_role.clear()
+    _indexed.clear()
+    for user_id in _users_cache:
+        _index_user(user_id)
+
+
 def reload_users() -> Dict[str, dict]:
+    """Reload the users from disk, as the file watcher does when users.json changes.
+
+    A users.json this process did not write was edited by hand, and becomes the new
+    snapshot: the change log is discarded rather than replayed over the edit.
+    """
     global _users_loaded
-    _users_loaded = False
-    return _load_users()
-
-
-def _save_users(users_dict: Dict[str, dict]) -> None:
-    global _users_cache, _users_loaded
-    tmp = users_index + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(users_dict, f, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, users_index)
-    _users_cache = users_dict
-    _users_loaded = True
+    # The cache is ahead of the file until queued writes land; once the flush
+    # returns, _snapshot_written has run for every snapshot written so far.
+    io_executor.flush(users_index)
+    with _lock:
+        if _file_signature(users_index) != _snapshot_signature:
+            _discard_log()
+        _users_loaded = False
+        return _load_users()
+
+
+def _discard_log() -> None:
+    global _logged_changes
+    group_commit.flush(users_log)
+    for path in (users_log, users_log_compacting):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        Logger.warning(f"users.json was changed outside the server; discarded {os.path.basename(path)}")
+    _logged_changes = 0
+
+
+def _log_change(user_id: str) -> None:
+    """Append the current record of ``user_id``, or its removal, to the change log."""
+    global _logged_changes
+    entry = {"id": user_id, "user": _users_cache.get(user_id)}
+    group_commit.submit(users_log, json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n")
+    _logged_changes += 1
+    if _logged_changes >= get_config_value("storage", "users", "compact_after", default=DEFAULT_COMPACT_AFTER):
+        compact()
+
+
+def _rotate_log() -> None:
+    group_commit.flush(users_log)
+    if not os.path.exists(users_log):
+        return
+    if not os.path.exists(users_log_compacting):
+        os.replace(users_log, users_log_compacting)
+        return
+    # An earlier snapshot never made it to disk; its changes go first.
+    with open(users_log, "rb") as src, open(users_log_compacting, "ab") as dst:
+        shutil.copyfileobj(src, dst)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.remove(users_log)
+
+
+def compact() -> bool:
+    """Fold the change log into a new users.json snapshot.
+
+    Runs by itself every ``storage.users.compact_after`` changes; the server also
+    calls it periodically and at shutdown. The snapshot is written by the storage
+    writer thread. Returns False when there was nothing to fold or a snapshot is
+    already being written.
+    """
+    global _logged_changes, _compacting
+    with _lock:
+        if _compacting or not _logged_changes:
+            return False
+        _rotate_log()
+        _compacting = True
+        _logged_changes = 0
+        future = io_executor.write_json(users_index, _get_users_cache(), lock=_lock, op="users")
+    future.add_done_callback(_snapshot_written)
+    return True
+
+
+def _snapshot_written(future) -> None:
+    global _compacting, _snapshot_signature
+    with _lock:
+        if future.exception() is None:
+            _snapshot_signature = _file_signature(users_index)
+            try:
+                os.remove(users_log_compacting)
+            except FileNotFoundError:
+                pass
+        _compacting = False
 
 
 def _get_users_cache() -> Dict[str, dict]:
@@ -60,6 +247,12 @@ def _get_users_cache() -> Dict[str, dict]:
     return _users_cache
 
 
+def _put_user(user_id: str, user_data: dict) -> None:
+    _get_users_cache()[user_id] = user_data
+    _index_user(user_id)
+    _log_change(user_id)
+
+
 def _ensure_storage():
     os.makedirs(_MODULE_DIR, exist_ok=True)
     if not os.path.exists(users_index):
@@ -79,10 +272,16 @@ def user_exists(user_id):
         return user_id in _get_users_cache()
 
 
-def get_user(user_id):
+def get_user(user_id) -> Optional[Mapping]:
+    """Return a read-only view of a user's record, or None.
+
+    The view is not copied and stays valid after later writes, which replace the
+    record rather than change it. Nested values such as ``roles`` are shared with
+    the cache and must not be modified; use ``dict(user)`` to get an editable copy.
+    """
     with _lock:
         user = _get_users_cache().get(user_id)
-        return copy.deepcopy(user) if user is not None else None
+        return MappingProxyType(user) if user is not None else None
 
 
 def add_user(user_id, username=None, default_roles=None):
@@ -101,12 +300,8 @@ def add_user(user_id, username=None, default_roles=None):
             user_data["roles"] = default_roles
         elif "roles" not in user_data:
             user_data["roles"] = []
-        if "status" not in user_data:
-            user_data["status"] = DEFAULT_STATUS
 
-        users = _get_users_cache()
-        users[user_id] = user_data
-        _save_users(users)
+        _put_user(user_id, user_data)
         return True
 
 
@@ -129,7 +324,7 @@ def get_users():
             user_roles = user_data.get("roles", [])
             color = roles.get_user_color(user_roles)
 
-            user_status = user_data.get("status", DEFAULT_STATUS)
+            user_status = presence.get_status(user_id) or user_data.get("status", DEFAULT_STATUS)
             username = user_data.get("username", user_id)
             nickname = user_data.get("nickname")
             pfp_url = user_data.get("pfp_url")
@@ -157,22 +352,14 @@ def count_users() -> int:
 
 def save_user(user_id, user_data):
     with _lock:
-        users = _get_users_cache()
-        if user_id not in users:
+        if user_id not in _get_users_cache():
             return False
-        users[user_id] = user_data
-        _save_users(users)
+        _put_user(user_id, dict(user_data))
         return True
 
 
 def get_banned_users():
-    with _lock:
-        users = _get_users_cache()
-        banned = []
-        for user_id, user_data in users.items():
-            if "banned" in user_data.get("roles", []):
-                banned.append(user_data.get("username", user_id))
-        return banned
+    return get_usernames_by_role("banned")
 
 
 def is_user_banned(user_id):
@@ -184,8 +371,8 @@ def ban_user(user_id):
     with _lock:
         users = _get_users_cache()
         if user_id in users and "banned" not in users[user_id].get("roles", []):
-            users[user_id].setdefault("roles", []).insert(0, "banned")
-            _save_users(users)
+            user_data = users[user_id]
+            _put_user(user_id, {**user_data, "roles": ["banned", *user_data.get("roles", [])]})
             return True
         return False
 
@@ -194,8 +381,7 @@ def unban_user(user_id):
     with _lock:
         users = _get_users_cache()
         if user_id in users and "banned" in users[user_id].get("roles", []):
-            users[user_id]["roles"].remove("banned")
-            _save_users(users)
+            _put_user(user_id, _without_role(users[user_id], "banned"))
             return True
         return False
 
@@ -204,8 +390,8 @@ def give_role(user_id, role):
     with _lock:
         users = _get_users_cache()
         if user_id in users:
-            users[user_id].setdefault("roles", []).append(role)
-            _save_users(users)
+            user_data = users[user_id]
+            _put_user(user_id, {**user_data, "roles": [*user_data.get("roles", []), role]})
             return True
         return False
 
@@ -214,8 +400,7 @@ def set_user_roles(user_id, roles_list):
     with _lock:
         users = _get_users_cache()
         if user_id in users:
-            users[user_id]["roles"] = roles_list
-            _save_users(users)
+            _put_user(user_id, {**users[user_id], "roles": list(roles_list)})
             return True
         return False
 
@@ -224,22 +409,25 @@ def remove_role(user_id, role):
     with _lock:
         users = _get_users_cache()
         if user_id in users and role in users[user_id].get("roles", []):
-            users[user_id]["roles"].remove(role)
-            _save_users(users)
+            _put_user(user_id, _without_role(users[user_id], role))
             return True
         return False
 
 
+def _without_role(user_data: dict, role) -> dict:
+    roles_list = list(user_data.get("roles", []))
+    roles_list.remove(role)
+    return {**user_data, "roles": roles_list}
+
+
 def remove_role_from_all_users(role):
     with _lock:
         users = _get_users_cache()
-        changed = False
-        for user_id, user_data in users.items():
-            if role in user_data.get("roles", []):
-                users[user_id]["roles"].remove(role)
-                changed = True
-        if changed:
-            _save_users(users)
+        members = list(_ids_by_role.get(role, ()))
+        for user_id in members:
+            users[user_id] = _without_role(users[user_id], role)
+            _index_user(user_id)
+            _log_change(user_id)
 
 
 def remove_user_roles(user_id, roles_to_remove):
@@ -248,7 +436,7 @@ def remove_user_roles(user_id, roles_to_remove):
         if user_id not in users:
             return False
 
-        current_roles = users[user_id].get("roles", [])
+        current_roles = list(users[user_id].get("roles", []))
         removed_any = False
 
         for role in roles_to_remove:
@@ -257,8 +445,7 @@ def remove_user_roles(user_id, roles_to_remove):
                 removed_any = True
 
         if removed_any:
-            users[user_id]["roles"] = current_roles
-            _save_users(users)
+            _put_user(user_id, {**users[user_id], "roles": current_roles})
             return True
 
         return False
@@ -269,73 +456,64 @@ def remove_user(user_id):
         users = _get_users_cache()
         if user_id in users:
             del users[user_id]
-            _save_users(users)
+            _index_user(user_id)
+            _log_change(user_id)
+            presence.forget(user_id)
             return True
         return False
 
 
+def _id_for_username(key: str) -> Optional[str]:
+    owners = _ids_by_username.get(key)
+    return next(iter(owners)) if owners else None
+
+
 def get_id_by_username(username):
     with _lock:
-        users = _get_users_cache()
-        for user_id, user_data in users.items():
-            if user_data.get("username", "").lower() == username.lower():
-                return user_id
-        return None
+        _get_users_cache()
+        return _id_for_username(username.lower())
 
 
 def get_username_by_id(user_id):
-    user = get_user(user_id)
-    if user:
-        return user.get("username") or user_id
-    return user_id
+    with _lock:
+        _get_users_cache()
+        return _usernames.get(user_id) or user_id
+
+
+def names_version() -> int:
+    """Return a number that changes whenever any user id's username does."""
+    with _lock:
+        _get_users_cache()
+        return _names_version
 
 
 def update_user_username(user_id, new_username):
     with _lock:
         users = _get_users_cache()
         if user_id in users:
-            users[user_id]["username"] = new_username
-            _save_users(users)
+            _put_user(user_id, {**users[user_id], "username": new_username})
             return True
         return False
 
 
 def generate_validator(user_id):
-    with _lock:
-        users = _get_users_cache()
-        if user_id not in users:
-            return None
-
-        validator = secrets.token_urlsafe(32)
-        users[user_id]["validator"] = validator
-        _save_users(users)
-        return validator
+    if not user_exists(user_id):
+        return None
+    return presence.generate_validator(user_id)
 
 
 def get_validator(user_id):
-    user = get_user(user_id)
-    return user.get("validator") if user else None
+    return presence.get_validator(user_id)
 
 
 def get_user_id_by_validator(validator_token):
-    if not validator_token:
-        return None
-    with _lock:
-        users = _get_users_cache()
-        for user_id, user_data in users.items():
-            if user_data.get("validator") == validator_token:
-                return user_id
-        return None
+    return presence.get_user_id_by_validator(validator_token)
 
 
 def get_usernames_by_role(role_name):
     with _lock:
         users = _get_users_cache()
-        usernames = []
-        for user_id, user_data in users.items():
-            if role_name in user_data.get("roles", []):
-                usernames.append(user_data.get("username", user_id))
-        return usernames
+        return [users[user_id].get("username", user_id) for user_id in _ids_by_role.get(role_name, ())]
 
 
 def set_nickname(user_id, nickname):
@@ -343,8 +521,7 @@ def set_nickname(user_id, nickname):
         users = _get_users_cache()
         if user_id not in users:
             return False
-        users[user_id]["nickname"] = nickname
-        _save_users(users)
+        _put_user(user_id, {**users[user_id], "nickname": nickname})
         return True
 
 
@@ -359,12 +536,17 @@ def clear_nickname(user_id):
         if user_id not in users:
             return False
         if "nickname" in users[user_id]:
-            del users[user_id]["nickname"]
-            _save_users(users)
+            user_data = dict(users[user_id])
+            del user_data["nickname"]
+            _put_user(user_id, user_data)
         return True
 
 
 def get_status(user_id) -> dict:
+    status = presence.get_status(user_id)
+    if status is not None:
+        return status
+    # Statuses set before they moved to the presence store live in the user record.
     user = get_user(user_id)
     if user:
         return user.get("status", DEFAULT_STATUS)
@@ -405,13 +587,9 @@ def register_cracked_user(
 
     with _lock:
         users = _get_users_cache()
-        if user_id in users:
+        if user_id in users or full_username.lower() in _ids_by_username:
             return False, None, "Username already taken"
 
-        for existing_id, existing_data in users.items():
-            if existing_data.get("username", "").lower() == full_username.lower():
-                return False, None, "Username already taken"
-
         password_hash = _hash_password(password)
 
         user_data = {
@@ -419,11 +597,9 @@ def register_cracked_user(
             "nickname": username,
             "password_hash": password_hash,
             "roles": default_roles or ["user"],
-            "status": DEFAULT_STATUS,
             "pfp_url": None,
         }
-        users[user_id] = user_data
-        _save_users(users)
+        _put_user(user_id, user_data)
         return True, user_id, None
 
 
@@ -435,14 +611,14 @@ def authenticate_cracked_user(
 
     with _lock:
         users = _get_users_cache()
-        for user_id, user_data in users.items():
-            if user_data.get("username", "").lower() == full_username.lower():
-                if user_id.startswith(CRACKED_USER_PREFIX):
-                    if _verify_password(password, user_data.get("password_hash", "")):
-                        return True, user_id, None
-                    return False, None, "Invalid password"
-                return False, None, "This account uses Rotur authentication"
-        return False, None, "User not found"
+        user_id = _id_for_username(full_username.lower())
+        if user_id is None:
+            return False, None, "User not found"
+        if user_id.startswith(CRACKED_USER_PREFIX):
+            if _verify_password(password, users[user_id].get("password_hash", "")):
+                return True, user_id, None
+            return False, None, "Invalid password"
+        return False, None, "This account uses Rotur authentication"
 
 
 def set_pfp(user_id: str, pfp_url: str) -> bool:
@@ -450,8 +626,7 @@ def set_pfp(user_id: str, pfp_url: str) -> bool:
         users = _get_users_cache()
         if user_id not in users:
             return False
-        users[user_id]["pfp_url"] = pfp_url
-        _save_users(users)
+        _put_user(user_id, {**users[user_id], "pfp_url": pfp_url})
         return True
 
 
@@ -465,18 +640,6 @@ def is_cracked_user(user_id: str) -> bool:
 
 
 def set_status(user_id, status, text=None):
-    if status not in ALLOWED_STATUSES:
-        return False
-
-    if text is not None and len(text) > 100:
+    if not user_exists(user_id):
         return False
-
-    with _lock:
-        users = _get_users_cache()
-        if user_id not in users:
-            return False
-
-        status_data = {"status": status, "text": text[:100] if text else ""}
-        users[user_id]["status"] = status_data
-        _save_users(users)
-        return True
+    return presence.set_status(user_id, status, text)
@@ -0,0 +1,95 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
+from config_store import get_config_value
+from logger import Logger
+
+from . import channels, threads
+
+DEFAULT_WORKERS = 4
+DEFAULT_PAGE_SIZE = 100
+_PROGRESS_SECONDS = 2.0
+
+_lock = threading.Lock()
+_status = {"running": False, "total": 0, "done": 0, "failed": 0, "seconds": 0.0}
+
+
+def status() -> Dict[str, object]:
+    with _lock:
+        return dict(_status)
+
+
+def targets() -> List[Tuple[str, str]]:
+    """Return the (kind, name) of every history ``storage.warmup`` asks to pre-load.
+
+    ``channels`` lists text and forum channel names, or ``"*"`` for all of them;
+    with ``threads`` the threads of the listed forum channels are included.
+    """
+    wanted = get_config_value("storage", "warmup", "channels", default=[]) or []
+    with_threads = get_config_value("storage", "warmup", "threads", default=False)
+    everything = wanted == "*" or "*" in wanted
+
+    found = []
+    for channel in channels.get_all_channels():
+        name = channel.get("name")
+        if not name or not (everything or name in wanted):
+            continue
+        if channel.get("type") == "text":
+            found.append(("channel", name))
+        elif channel.get("type") == "forum" and with_threads:
+            found.extend(("thread", thread["id"]) for thread in threads.get_channel_threads(name) if thread.get("id"))
+    return found
+
+
+def _warm(kind: str, name: str, page_size: int) -> None:
+    # Opening the log loads its tail's line table; reading the newest page parses the
+    # lines the first messages_get and channels_get of a client will ask for.
+    if kind == "thread":
+        threads.get_thread_messages(name, 0, page_size)
+    else:
+        channels.get_channel_messages(name, 0, page_size)
+
+
+def run() -> Dict[str, object]:
+    """Load the configured channel and thread histories into the message cache.
+
+    Histories are opened by ``storage.warmup.workers`` threads at once, sharing the
+    same caches the request handlers use, and progress is logged every couple of
+    seconds. Returns the final ``status()``.
+    """
+    work = targets()
+    if not work:
+        return status()
+    workers = max(1, int(get_config_value("storage", "warmup", "workers", default=DEFAULT_WORKERS)))
+    page_size = max(1, min(200, int(get_config_value("storage", "warmup", "page_size", default=DEFAULT_PAGE_SIZE))))
+
+    started = time.monotonic()
+    with _lock:
+        _status.update(running=True, total=len(work), done=0, failed=0, seconds=0.0)
+    Logger.info(f"Warm-up: loading {len(work)} histories with {workers} workers")
+
+    last_report = started
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warmup") as pool:
+        futures = {pool.submit(_warm, kind, name, page_size): (kind, name) for kind, name in work}
+        for future in as_completed(futures):
+            kind, name = futures[future]
+            error = future.exception()
+            now = time.monotonic()
+            with _lock:
+                _status["done"] += 1
+                _status["failed"] += error is not None
+                _status["seconds"] = round(now - started, 3)
+                done = _status["done"]
+            if error is not None:
+                Logger.error(f"Warm-up: failed to load {kind} {name}: {error}")
+            if now - last_report >= _PROGRESS_SECONDS and done < len(work):
+                Logger.info(f"Warm-up: {done}/{len(work)} histories loaded")
+                last_report = now
+
+    with _lock:
+        _status["running"] = False
+        result = dict(_status)
+    Logger.success(f"Warm-up: loaded {result['done'] - result['failed']}/{result['total']} histories in {result['seconds']}s")
+    return result
@@ -6,6 +6,8 @@ import time
 import uuid
 from typing import Dict, List, Optional
 
+from . import io_executor
+
 _MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 webhooks_file = os.path.join(_MODULE_DIR, "webhooks.json")
 
@@ -29,12 +31,7 @@ def _load_webhooks() -> Dict[str, dict]:
 
 def _save_webhooks(webhooks_dict: Dict[str, dict]) -> None:
     global _webhooks_cache, _webhooks_loaded
-    tmp = webhooks_file + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(webhooks_dict, f, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, webhooks_file)
+    io_executor.write_json(webhooks_file, webhooks_dict, lock=_lock, op="webhooks")
     _webhooks_cache = webhooks_dict
     _webhooks_loaded = True
 
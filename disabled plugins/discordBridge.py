@@ -5,7 +5,6 @@
 import os
 import json
 import time
-import uuid
 import asyncio
 import aiohttp
 import websockets
@@ -22,7 +21,7 @@ try:
 except ImportError:
     Logger.warning("python-dotenv not available, reading environment directly")
 
-from db import channels, users
+from db import channels, snowflake, users
 
 # Configuration
 DISCORD_BOT_TOKEN = os.getenv('DISCORD_BOT_TOKEN')
@@ -353,7 +352,7 @@ class DiscordGateway:
             "content": content,
             "timestamp": time.time(),
             "pinned": False,
-            "id": str(uuid.uuid4()),
+            "id": snowflake.new_id(),
             "source": "discord",
             "discord_user_id": discord_user_id,
             "discord_username": author['username'],
@@ -371,7 +370,7 @@ class DiscordGateway:
                 del discord_message_map[key]
         
         # Save to OriginChats
-        channels.save_channel_message(channel_name, out_msg)
+        await asyncio.wrap_future(channels.save_channel_message(channel_name, out_msg))
         
         # Broadcast to OriginChats clients
         if server_data_global and "connected_clients" in server_data_global:
@@ -1,5 +1,5 @@
 import requests
-from db import users, roles, push as push_db
+from db import users, roles, presence, push as push_db
 from handlers.websocket_utils import (
     send_to_client,
     broadcast_to_all,
@@ -30,11 +30,12 @@ async def _send_auth_success(
         websocket, {"cmd": "auth_success", "val": "Authentication successful"}
     )
 
-    user["username"] = username
+    user = {**user, "username": username}
     validator_token = users.generate_validator(user_id)
     user_for_client = {
         k: v for k, v in user.items() if k != "validator" and k != "password_hash"
     }
+    user_for_client["status"] = users.get_status(user_id)
     user_for_client["cracked"] = is_cracked
 
     ready_payload = {"cmd": "ready", "user": user_for_client}
@@ -74,15 +75,7 @@ async def _send_auth_success(
             server_data,
         )
 
-    connected_usernames = (
-        server_data.get("connected_usernames", {}) if server_data else {}
-    )
-    was_online = (
-        username in connected_usernames and connected_usernames.get(username, 0) > 0
-    )
-    if username not in connected_usernames:
-        connected_usernames[username] = 0
-    connected_usernames[username] += 1
+    was_online = presence.connect(user_id, username) > 1
 
     if not was_online:
         await broadcast_to_all(
@@ -1,7 +1,7 @@
+import asyncio
 import json
 import time
-import uuid
-from db import channels
+from db import channels, snowflake
 from db import shared
 from logger import Logger
 
@@ -64,7 +64,7 @@ async def handle_github_webhook(payload: dict, event_type: str, channel_name: st
     if event_type == "push":
         embed = format_github_push_message(payload)
 
-        message_id = str(uuid.uuid4())
+        message_id = snowflake.new_id()
         out_msg = {
             "user": "originChats",
             "content": "",
@@ -81,7 +81,11 @@ async def handle_github_webhook(payload: dict, event_type: str, channel_name: st
         if not channels.channel_exists(channel_name):
             return None, "Channel not found"
 
-        channels.save_channel_message(channel_name, out_msg)
+        try:
+            await asyncio.wrap_future(channels.save_channel_message(channel_name, out_msg))
+        except OSError as e:
+            Logger.error(f"[GitHub Webhook] Failed to persist message {message_id}: {e}")
+            return None, "Failed to save message"
 
         out_msg_for_client = shared.convert_messages_to_user_format([out_msg])
         out_msg_for_client = out_msg_for_client[0]
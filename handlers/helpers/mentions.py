@@ -1,5 +1,6 @@
 import re
-from db import users, roles
+import threading
+from db import users, roles, channels, threads, pings as pings_db
 
 
 def extract_user_mentions(content, exclude_username=None):
@@ -14,41 +15,6 @@ def extract_role_mentions(content):
     return set(re.findall(r'@&([a-zA-Z0-9_]+)', content))
 
 
-def get_ping_patterns_for_user(username, user_roles):
-    escaped = re.escape(username)
-    patterns = [re.compile(rf'@{escaped}(?![a-zA-Z0-9_])')]
-    for role in user_roles:
-        escaped_role = re.escape(role)
-        patterns.append(re.compile(rf'@&{escaped_role}(?![a-zA-Z0-9_])'))
-    return patterns
-
-
-def check_ping_in_content(content, ping_patterns):
-    return any(pattern.search(content) for pattern in ping_patterns)
-
-
-def is_message_pinged_for_user(msg, user_id, username, user_roles, ping_patterns):
-    stored_pings = msg.get("pings")
-    if stored_pings:
-        if username in (stored_pings.get("users") or []):
-            return True
-        if any(role in (stored_pings.get("roles") or []) for role in user_roles):
-            return True
-        if user_id in (stored_pings.get("replies") or []):
-            return True
-
-    content = msg.get("content", "")
-    if content and check_ping_in_content(content, ping_patterns):
-        return True
-
-    reply_to = msg.get("reply_to")
-    is_replied = reply_to and reply_to.get("user") == user_id
-    if is_replied and msg.get("ping", True):
-        return True
-
-    return False
-
-
 def validate_role_mentions_permissions(content, sender_user_roles):
     mentioned_roles = extract_role_mentions(content)
     for mentioned_role in mentioned_roles:
@@ -79,3 +45,87 @@ def get_message_pings(content, sender_user_roles):
             valid_roles.add(role)
 
     return {"users": list(valid_users), "roles": list(valid_roles), "replies": []}
+
+
+def _mentioned_user_ids(usernames):
+    user_ids = set()
+    for username in usernames or []:
+        user_id = users.get_id_by_username(username)
+        if user_id:
+            user_ids.add(user_id)
+    return user_ids
+
+
+def record_message_pings(msg, channel_name, thread_id, pings, reply_author_id=None):
+    """Add a freshly sent message to the mention inboxes of everyone it pings."""
+    user_ids = _mentioned_user_ids(pings.get("users"))
+    if reply_author_id:
+        user_ids.add(reply_author_id)
+    role_names = pings.get("roles") or []
+    if not user_ids and not role_names:
+        return
+    pings_db.record(msg["id"], msg.get("timestamp"), channel_name, thread_id, user_ids, role_names)
+
+
+def record_edit_pings(old_msg, channel_name, thread_id, pings):
+    """Add an edited message to the inboxes of users and roles the edit newly pings."""
+    old_content = old_msg.get("content") or ""
+    old_pings = old_msg.get("pings") or {}
+    old_user_ids = _mentioned_user_ids(set(old_pings.get("users") or []) | extract_user_mentions(old_content))
+    old_roles = set(old_pings.get("roles") or []) | extract_role_mentions(old_content)
+    user_ids = _mentioned_user_ids(pings.get("users")) - old_user_ids
+    role_names = set(pings.get("roles") or []) - old_roles
+    if not user_ids and not role_names:
+        return
+    pings_db.record(old_msg["id"], old_msg.get("timestamp"), channel_name, thread_id, user_ids, role_names)
+
+
+def _history_ping_entries(msg, channel_name, thread_id):
+    content = msg.get("content") or ""
+    stored_pings = msg.get("pings") or {}
+    usernames = set(stored_pings.get("users") or []) | extract_user_mentions(content)
+    role_names = set(stored_pings.get("roles") or []) | extract_role_mentions(content)
+    user_ids = _mentioned_user_ids(usernames)
+    reply_to = msg.get("reply_to")
+    if isinstance(reply_to, dict) and reply_to.get("user") and msg.get("ping", True):
+        user_ids.add(reply_to["user"])
+    if not msg.get("id") or (not user_ids and not role_names):
+        return None
+    return pings_db.make_ref(msg["id"], msg.get("timestamp"), channel_name, thread_id), user_ids, role_names
+
+
+_backfill_lock = threading.Lock()
+
+
+def backfill_ping_inboxes():
+    """Seed the mention inboxes from the existing history of every text and forum channel.
+
+    Runs once, the first time pings are requested after upgrading; new messages are
+    recorded as they are sent. Requests arriving during the scan wait for it rather
+    than starting their own.
+    """
+    def entries():
+        for channel_data in channels.get_channels():
+            if channel_data.get("type") not in ("text", "forum"):
+                continue
+            channel_name = channel_data.get("name")
+            if not channel_name:
+                continue
+            for msg in channels.iter_channel_messages(channel_name):
+                entry = _history_ping_entries(msg, channel_name, None)
+                if entry:
+                    yield entry
+            if channel_data.get("type") != "forum":
+                continue
+            for thread_meta in threads.get_channel_threads(channel_name):
+                thread_id = thread_meta.get("id")
+                if not thread_id:
+                    continue
+                for msg in threads.iter_thread_messages(thread_id):
+                    entry = _history_ping_entries(msg, channel_name, thread_id)
+                    if entry:
+                        yield entry
+
+    with _backfill_lock:
+        if not pings_db.is_backfilled():
+            pings_db.backfill(entries())
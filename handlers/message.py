@@ -12,16 +12,16 @@ from handlers.messages.status import handle_status_set, handle_status_get
 from handlers.messages.reaction import handle_react_add, handle_react_remove
 from handlers.messages.user import handle_user_update, handle_pfp_set, handle_pfp_get
 from handlers.messages.modlog import handle_modlog_get, handle_modlog_summary
-from handlers.messages.server import handle_server_update, handle_server_info
+from handlers.messages.server import handle_server_update, handle_server_info, handle_storage_stats, handle_history_export, handle_history_import
 from handlers.messages.poll import handle_poll_create, handle_poll_vote, handle_poll_end, handle_poll_results, handle_poll_get
 from handlers.messages.helpers import _require_permission
 from handlers.messages.message import handle_message_new, handle_typing
 from handlers.messages.message_edit import handle_message_edit
 from handlers.messages.message_delete import handle_message_delete
 from handlers.messages.message_pin import handle_message_pin, handle_message_unpin, handle_messages_pinned
-from handlers.messages.messages import handle_messages_get, handle_messages_around, handle_messages_search, handle_message_get, handle_message_replies
+from handlers.messages.messages import handle_messages_get, handle_messages_around, handle_messages_before, handle_messages_after, handle_messages_search, handle_message_get, handle_message_replies
 from handlers.messages.unreads import handle_unreads_ack, handle_unreads_get, handle_unreads_count
-from db import modlog
+from db import modlog, pings as pings_db
 from handlers.messages.audit import record
 from logger import Logger
 from handlers.websocket_utils import broadcast_to_voice_channel_with_viewers, broadcast_to_all, _get_ws_attr, _set_ws_attr
@@ -41,10 +41,7 @@ from handlers.helpers.thread import (
     validate_thread_modification,
     format_thread_for_response,
 )
-from handlers.helpers.mentions import (
-    get_ping_patterns_for_user,
-    is_message_pinged_for_user,
-)
+from handlers.helpers.mentions import backfill_ping_inboxes
 
 async def _broadcast_voice_event(connected_clients, voice_channels, channel_name, event_type, user_data_with_peer, user_data_without_peer=None):
     if user_data_without_peer is None:
@@ -87,6 +84,10 @@ async def handle(ws, message, server_data: dict) -> dict | None:
             return await handle_messages_get(ws, message, server_data)
         case "messages_around":
             return await handle_messages_around(ws, message, server_data)
+        case "messages_before":
+            return await handle_messages_before(ws, message, server_data)
+        case "messages_after":
+            return await handle_messages_after(ws, message, server_data)
         case "message_get":
             return await handle_message_get(ws, message, server_data)
         case "message_replies":
@@ -124,7 +125,7 @@ async def handle(ws, message, server_data: dict) -> dict | None:
         case "slash_call":
             return await handle_slash_call(ws, message, match_cmd, server_data)
         case "slash_response":
-            return handle_slash_response(ws, message, match_cmd, server_data)
+            return await handle_slash_response(ws, message, match_cmd, server_data)
         case "voice_join":
             return await _handle_voice_join(ws, message, match_cmd, server_data)
         case "voice_leave":
@@ -169,6 +170,12 @@ async def handle(ws, message, server_data: dict) -> dict | None:
             return await handle_server_update(ws, message, match_cmd, server_data)
         case "server_info":
             return await handle_server_info(ws, message, match_cmd)
+        case "storage_stats":
+            return await handle_storage_stats(ws, message, match_cmd, server_data)
+        case "history_export":
+            return await handle_history_export(ws, message, match_cmd, server_data)
+        case "history_import":
+            return await handle_history_import(ws, message, match_cmd, server_data)
         case "user_roles_set":
             return await _handle_user_roles_set(ws, message, match_cmd, server_data)
         case "user_roles_get":
@@ -617,43 +624,68 @@ async def _handle_pings_get(ws, message, match_cmd):
         return _error("Offset must be a non-negative number", match_cmd)
 
     user_roles = user_data.get("roles", [])
-    username = user_data.get("username")
-    ping_patterns = get_ping_patterns_for_user(username, user_roles)
+    if not pings_db.is_backfilled():
+        await asyncio.to_thread(backfill_ping_inboxes)
 
-    all_channels = channels.get_channels()
-    pinged_messages = []
-    for channel_data in all_channels:
-        if channel_data.get("type") not in ("text", "forum"):
-            continue
-        channel_name = channel_data.get("name")
-        if not channels.does_user_have_permission(channel_name, user_roles, "view"):
-            continue
-        channel_messages = channels.get_all_channel_messages(channel_name)
-        for msg in channel_messages:
-            if is_message_pinged_for_user(msg, user_id, username, user_roles, ping_patterns):
-                pinged_messages.append((msg, channel_name, None))
-        if channel_data.get("type") == "forum" and channel_name:
-            channel_threads = threads.get_channel_threads(channel_name)
-            for thread_meta in channel_threads:
-                thread_id = thread_meta.get("id")
-                if not thread_id:
-                    continue
-                thread_messages = threads.get_all_thread_messages(thread_id)
-                for msg in thread_messages:
-                    if is_message_pinged_for_user(msg, user_id, username, user_roles, ping_patterns):
-                        pinged_messages.append((msg, channel_name, thread_id))
-    pinged_messages.sort(key=lambda x: x[0].get("timestamp", 0), reverse=True)
-    paginated = pinged_messages[offset:offset + limit]
+    page, total = await asyncio.to_thread(_collect_pings, user_id, user_roles, offset, limit)
     result = []
-    for msg, ch_name, th_id in paginated:
+    for ref in page:
+        ch_name = ref.get("channel")
+        th_id = ref.get("thread_id")
         if th_id:
+            msg = threads.get_thread_message(th_id, ref.get("id"))
+            if not msg:
+                continue
             converted = threads.convert_messages_to_user_format([msg])[0]
             converted["thread_id"] = th_id
         else:
+            msg = channels.get_channel_message(ch_name, ref.get("id"))
+            if not msg:
+                continue
             converted = channels.convert_messages_to_user_format([msg])[0]
         converted["channel"] = ch_name
         result.append(converted)
-    return {"cmd": "pings_get", "messages": result, "offset": offset, "limit": limit, "total": len(pinged_messages)}
+    return {"cmd": "pings_get", "messages": result, "offset": offset, "limit": limit, "total": total}
+
+
+def _collect_pings(user_id, user_roles, offset, limit):
+    """Return the refs on the requested page and how many pings the user can see.
+
+    Refs in channels the user cannot view, and to messages since deleted, are
+    dropped before paging and counting. Only their sequence numbers are looked up,
+    so messages are read just for the page.
+    """
+    viewable = {}
+
+    def can_view(channel_name):
+        if channel_name not in viewable:
+            viewable[channel_name] = channels.channel_exists(channel_name) and channels.does_user_have_permission(channel_name, user_roles, "view")
+        return viewable[channel_name]
+
+    live_threads = {}
+
+    def thread_exists(thread_id):
+        if thread_id not in live_threads:
+            live_threads[thread_id] = threads.get_thread(thread_id) is not None
+        return live_threads[thread_id]
+
+    page = []
+    total = 0
+    for ref in pings_db.iter_refs(user_id, user_roles):
+        if not can_view(ref.get("channel")):
+            continue
+        if ref.get("thread_id"):
+            if not thread_exists(ref["thread_id"]):
+                continue
+            seq = threads.get_thread_message_seq(ref["thread_id"], ref.get("id"))
+        else:
+            seq = channels.get_channel_message_seq(ref.get("channel"), ref.get("id"))
+        if seq is None:
+            continue
+        if offset <= total < offset + limit:
+            page.append(ref)
+        total += 1
+    return page, total
 
 
 def _handle_thread_create(ws, message, match_cmd):
@@ -1,6 +1,6 @@
 """Message and typing handlers extracted from the monolithic handle() function."""
 
-from db import channels, users, threads
+from db import channels, snowflake, users, threads
 from handlers.helpers.validation import (
     make_error as _error,
     config_value as _config_value,
@@ -10,13 +10,14 @@ from handlers.helpers.validation import (
 )
 from handlers.helpers.mentions import (
     get_message_pings,
+    record_message_pings,
     validate_role_mentions_permissions,
 )
 from handlers.websocket_utils import broadcast_to_all, _get_ws_attr, _set_ws_attr
 from handlers import push as push_handler
 from logger import Logger
+import asyncio
 import time
-import uuid
 
 
 async def handle_message_new(ws, message, server_data):
@@ -127,7 +128,7 @@ async def handle_message_new(ws, message, server_data):
         "user": user_id,
         "content": content,
         "timestamp": time.time(),
-        "id": str(uuid.uuid4())
+        "id": snowflake.new_id()
     }
     if embeds:
         out_msg["embeds"] = embeds
@@ -145,12 +146,16 @@ async def handle_message_new(ws, message, server_data):
 
     effective_channel = channel_name if not thread_id else (channel_name or parent_channel)
 
-    if thread_id:
-        threads.save_thread_message(thread_id, out_msg)
-        out_msg_for_client = threads.convert_messages_to_user_format([out_msg])[0]
-    else:
-        channels.save_channel_message(channel_name, out_msg)
-        out_msg_for_client = channels.convert_messages_to_user_format([out_msg])[0]
+    try:
+        if thread_id:
+            await asyncio.wrap_future(threads.save_thread_message(thread_id, out_msg))
+            out_msg_for_client = threads.convert_messages_to_user_format([out_msg])[0]
+        else:
+            await asyncio.wrap_future(channels.save_channel_message(channel_name, out_msg))
+            out_msg_for_client = channels.convert_messages_to_user_format([out_msg])[0]
+    except OSError as e:
+        Logger.error(f"Failed to persist message {out_msg['id']}: {e}")
+        return _error("Failed to save message", match_cmd)
 
     if not out_msg_for_client:
         return _error("Failed to save message", match_cmd)
@@ -182,6 +187,8 @@ async def handle_message_new(ws, message, server_data):
     if pings.get("users") or pings.get("roles") or "replies" in pings:
         out_msg_for_client["pings"] = pings
 
+    record_message_pings(out_msg, effective_channel, thread_id, pings, reply_author_id)
+
     if server_data and "plugin_manager" in server_data:
         try:
             server_data["plugin_manager"].trigger_event("new_message", ws, {
@@ -9,6 +9,7 @@ from handlers.helpers.validation import (
 )
 from handlers.helpers.mentions import (
     get_message_pings,
+    record_edit_pings,
     validate_role_mentions_permissions,
 )
 
@@ -74,6 +75,7 @@ async def handle_message_edit(ws, message, server_data):
     if is_thread and thread_id:
         if not threads.edit_thread_message(thread_id, message_id, new_content, embeds):
             return _error("Failed to edit message", match_cmd)
+        record_edit_pings(msg_obj, parent_channel, thread_id, get_message_pings(new_content, user_roles))
         if server_data:
             username = users.get_username_by_id(user_id)
             server_data["plugin_manager"].trigger_event("message_edit", ws, {
@@ -96,6 +98,7 @@ async def handle_message_edit(ws, message, server_data):
     else:
         if not channels.edit_channel_message(channel_name, message_id, new_content, embeds):
             return _error("Failed to edit message", match_cmd)
+        record_edit_pings(msg_obj, channel_name, None, get_message_pings(new_content, user_roles))
         if server_data:
             username = users.get_username_by_id(user_id)
             server_data["plugin_manager"].trigger_event("message_edit", ws, {
@@ -104,22 +104,85 @@ async def handle_messages_around(ws, message, server_data):
     return {"cmd": "messages_around", "channel": parent_channel if is_thread else channel_name, "thread_id": thread_id if is_thread else None, "messages": messages, "range": {"start": start_idx, "end": end_idx}}
 
 
+async def _handle_messages_by_time(ws, message, match_cmd, newer):
+    channel_name = message.get("channel")
+    thread_id = message.get("thread_id")
+    timestamp = message.get("timestamp")
+    limit = message.get("limit", 50)
+
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+        return _error("timestamp must be a Unix timestamp", match_cmd)
+    if isinstance(limit, bool) or not isinstance(limit, int):
+        return _error("limit must be an integer", match_cmd)
+
+    user_id = _get_ws_attr(ws, "user_id")
+    if not user_id:
+        return _error("Authentication required", match_cmd)
+
+    user_roles = users.get_user_roles(user_id)
+    if not user_roles:
+        return _error("User roles not found", match_cmd)
+
+    ctx, err = await _get_channel_or_thread_context(channel_name, thread_id, user_id, user_roles)
+    if err:
+        msg, key = err
+        return _error(msg, match_cmd)
+
+    if not ctx:
+        return _error("Channel or thread not found", match_cmd)
+
+    is_thread = ctx["is_thread"]
+    parent_channel = ctx.get("parent_channel") or ctx.get("channel")
+
+    if is_thread and thread_id:
+        fetch = threads.get_thread_messages_after if newer else threads.get_thread_messages_before
+        messages = threads.convert_messages_to_user_format(fetch(thread_id, timestamp, limit))
+        return {"cmd": match_cmd, "channel": parent_channel, "thread_id": thread_id, "timestamp": timestamp, "messages": messages}
+
+    _, error = _require_text_channel_access(user_id, channel_name)
+    if error:
+        return error
+    fetch = channels.get_channel_messages_after if newer else channels.get_channel_messages_before
+    messages = channels.convert_messages_to_user_format(fetch(channel_name, timestamp, limit))
+    return {"cmd": match_cmd, "channel": channel_name, "timestamp": timestamp, "messages": messages}
+
+
+async def handle_messages_before(ws, message, server_data):
+    return await _handle_messages_by_time(ws, message, "messages_before", newer=False)
+
+
+async def handle_messages_after(ws, message, server_data):
+    return await _handle_messages_by_time(ws, message, "messages_after", newer=True)
+
+
 async def handle_messages_search(ws, message, server_data):
     match_cmd = "messages_search"
     channel_name = message.get("channel")
+    thread_id = message.get("thread_id")
     query = message.get("query")
-    if not channel_name or not query:
+    before = message.get("before")
+    if not (channel_name or thread_id) or not query:
         return _error("Channel name and query are required", match_cmd)
     
     user_id = _get_ws_attr(ws, "user_id")
     if not user_id:
         return _error("Authentication required", match_cmd)
-    
-    _, error = _require_text_channel_access(user_id, channel_name)
-    if error:
-        return error
 
-    search_results = channels.search_channel_messages(channel_name, query)
+    user_roles = users.get_user_roles(user_id)
+    if not user_roles:
+        return _error("User roles not found", match_cmd)
+
+    ctx, err = await _get_channel_or_thread_context(channel_name, thread_id, user_id, user_roles)
+    if err:
+        msg, key = err
+        return _error(msg, match_cmd)
+
+    if not ctx:
+        return _error("Channel or thread not found", match_cmd)
+
+    is_thread = ctx["is_thread"]
+    parent_channel = ctx.get("parent_channel") or ctx.get("channel")
+
     search_limit = _config_value(server_data, "limits", "search_results", default=30)
     try:
         search_limit = int(search_limit)
@@ -127,7 +190,17 @@ async def handle_messages_search(ws, message, server_data):
         search_limit = 30
     if search_limit < 1:
         search_limit = 1
-    search_results = search_results[:search_limit]
+
+    if is_thread and thread_id:
+        search_results = threads.search_thread_messages(thread_id, query, search_limit, before)
+        search_results = threads.convert_messages_to_user_format(search_results)
+        return {"cmd": "messages_search", "channel": parent_channel, "thread_id": thread_id, "query": query, "results": search_results}
+
+    _, error = _require_text_channel_access(user_id, channel_name)
+    if error:
+        return error
+
+    search_results = channels.search_channel_messages(channel_name, query, search_limit, before)
     search_results = channels.convert_messages_to_user_format(search_results)
     return {"cmd": "messages_search", "channel": channel_name, "query": query, "results": search_results}
 
@@ -180,20 +253,42 @@ async def handle_message_get(ws, message, server_data):
 async def handle_message_replies(ws, message, server_data):
     match_cmd = "message_replies"
     channel_name = message.get("channel")
+    thread_id = message.get("thread_id")
     message_id = message.get("id")
     limit = message.get("limit", 50)
+    after = message.get("after")
 
-    if not channel_name or not message_id:
+    if not (channel_name or thread_id) or not message_id:
         return _error("Channel name and message ID are required", match_cmd)
 
     user_id = _get_ws_attr(ws, "user_id")
     if not user_id:
         return _error("Authentication required", match_cmd)
-    
+
+    user_roles = users.get_user_roles(user_id)
+    if not user_roles:
+        return _error("User roles not found", match_cmd)
+
+    ctx, err = await _get_channel_or_thread_context(channel_name, thread_id, user_id, user_roles)
+    if err:
+        msg, key = err
+        return _error(msg, match_cmd)
+
+    if not ctx:
+        return _error("Channel or thread not found", match_cmd)
+
+    is_thread = ctx["is_thread"]
+    parent_channel = ctx.get("parent_channel") or ctx.get("channel")
+
+    if is_thread and thread_id:
+        replies = threads.get_thread_message_replies(thread_id, message_id, limit, after)
+        replies = threads.convert_messages_to_user_format(replies)
+        return {"cmd": "message_replies", "channel": parent_channel, "thread_id": thread_id, "message_id": message_id, "replies": replies}
+
     _, error = _require_text_channel_access(user_id, channel_name)
     if error:
         return error
 
-    replies = channels.get_message_replies(channel_name, message_id, limit)
+    replies = channels.get_message_replies(channel_name, message_id, limit, after)
     replies = channels.convert_messages_to_user_format(replies)
     return {"cmd": "message_replies", "channel": channel_name, "message_id": message_id, "replies": replies}
@@ -1,7 +1,7 @@
+import asyncio
 import time
-import uuid
 
-from db import polls, channels, threads, users
+from db import polls, channels, snowflake, threads, users
 from handlers.messages.helpers import _error, _require_user_id, _require_permission
 from handlers.websocket_utils import broadcast_to_channel
 from handlers.helpers.validation import validate_embeds
@@ -69,7 +69,7 @@ async def handle_poll_create(ws, message, match_cmd, server_data):
             return _error("You do not have permission to send messages in this channel", match_cmd)
         channel_name = channel
 
-    message_id = str(uuid.uuid4())
+    message_id = snowflake.new_id()
     now = time.time()
 
     poll_id = polls.create_poll(
@@ -105,9 +105,9 @@ async def handle_poll_create(ws, message, match_cmd, server_data):
     }
 
     if thread_id:
-        threads.save_thread_message(thread_id, msg_data)
+        await asyncio.wrap_future(threads.save_thread_message(thread_id, msg_data))
     else:
-        channels.save_channel_message(channel, msg_data)
+        await asyncio.wrap_future(channels.save_channel_message(channel, msg_data))
 
     broadcast_data = {
         "cmd": "message_new",
@@ -1,4 +1,6 @@
-from db import server_config
+import asyncio
+
+from db import cache_manager, history_export, io_executor, server_config, storage, warmup
 from handlers.messages.helpers import _error, _require_user_id, _require_permission
 from handlers.messages.audit import record
 from handlers.websocket_utils import broadcast_to_all
@@ -70,3 +72,101 @@ async def handle_server_info(ws, message, match_cmd):
         "icon": info["icon"],
         "banner": info["banner"]
     }
+
+
+async def handle_storage_stats(ws, message, match_cmd, server_data):
+    user_id, error = _require_user_id(ws, "Authentication required")
+    if error:
+        return error
+
+    error = _require_permission(user_id, "manage_server", match_cmd)
+    if error:
+        return error
+
+    return {
+        "cmd": "storage_stats",
+        "backend": storage.backend_name(),
+        "writes": io_executor.stats(),
+        "pending_writes": io_executor.pending(),
+        "cache": cache_manager.stats(),
+        "warmup": warmup.status(),
+    }
+
+
+def _history_target(message, match_cmd):
+    channel_name = message.get("channel")
+    thread_id = message.get("thread_id")
+    if thread_id:
+        kind, name = "thread", thread_id
+    elif channel_name:
+        kind, name = "channel", channel_name
+    else:
+        return None, _error("channel or thread_id is required", match_cmd)
+    if not history_export.history_exists(kind, name):
+        return None, _error("Thread not found" if kind == "thread" else "Channel not found", match_cmd)
+    return (kind, name), None
+
+
+async def handle_history_export(ws, message, match_cmd, server_data):
+    user_id, error = _require_user_id(ws, "Authentication required")
+    if error:
+        return error
+
+    error = _require_permission(user_id, "manage_server", match_cmd)
+    if error:
+        return error
+
+    target, error = _history_target(message, match_cmd)
+    if error:
+        return error
+
+    after_seq = message.get("cursor", 0)
+    limit = message.get("limit", history_export.DEFAULT_BATCH_SIZE)
+    if isinstance(after_seq, bool) or not isinstance(after_seq, int) or after_seq < 0:
+        return _error("cursor must be a non-negative integer", match_cmd)
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= 1000:
+        return _error("limit must be an integer between 1 and 1000", match_cmd)
+
+    messages, cursor, done = await asyncio.to_thread(history_export.read_page, *target, after_seq, limit)
+    return {
+        "cmd": "history_export",
+        target[0]: target[1],
+        "messages": messages,
+        "cursor": cursor,
+        "done": done,
+    }
+
+
+async def handle_history_import(ws, message, match_cmd, server_data):
+    user_id, error = _require_user_id(ws, "Authentication required")
+    if error:
+        return error
+
+    error = _require_permission(user_id, "manage_server", match_cmd)
+    if error:
+        return error
+
+    target, error = _history_target(message, match_cmd)
+    if error:
+        return error
+
+    messages = message.get("messages")
+    after_seq = message.get("cursor", 0)
+    if not isinstance(messages, list) or not 1 <= len(messages) <= 1000:
+        return _error("messages must be a list of 1 to 1000 messages", match_cmd)
+    if not all(isinstance(msg, dict) and isinstance(msg.get("id"), str) for msg in messages):
+        return _error("Every message must be an object with a string id", match_cmd)
+    if isinstance(after_seq, bool) or not isinstance(after_seq, int) or after_seq < 0:
+        return _error("cursor must be a non-negative integer", match_cmd)
+
+    imported, cursor = await asyncio.to_thread(
+        history_export.import_history, *target, messages, after_seq, len(messages)
+    )
+    record("history_import", ws, target_id=target[1], target_name=target[1],
+           details={"kind": target[0], "imported": imported})
+    return {
+        "cmd": "history_import",
+        target[0]: target[1],
+        "imported": imported,
+        "cursor": cursor,
+    }
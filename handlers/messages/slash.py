@@ -1,4 +1,4 @@
-from db import channels, users
+from db import channels, snowflake, users
 from handlers.messages.helpers import _error, _require_user_id, _require_user_roles
 from handlers.websocket_utils import broadcast_to_all, _get_ws_attr
 from logger import Logger
@@ -6,7 +6,6 @@ from pydantic import ValidationError
 from schemas.slash_command_schema import SlashCommand
 from handlers.helpers.validation import validate_embeds
 import time
-import uuid
 import asyncio
 
 
@@ -163,14 +162,14 @@ async def handle_slash_call(ws, message, match_cmd, server_data):
                     "user": "originChats",
                     "content": response_text,
                     "timestamp": time.time(),
-                    "id": str(uuid.uuid4()),
+                    "id": snowflake.new_id(),
                     "interaction": {
                         "command": cmd_name,
                         "username": invoker_username
                     }
                 }
 
-                channels.save_channel_message(channel, out_msg)
+                await asyncio.wrap_future(channels.save_channel_message(channel, out_msg))
                 out_msg_for_client = channels.convert_messages_to_user_format([out_msg])
                 out_msg_for_client = out_msg_for_client[0]
                 out_msg_for_client["interaction"] = out_msg["interaction"]
@@ -268,7 +267,7 @@ async def handle_slash_call(ws, message, match_cmd, server_data):
     return slash_call_message
 
 
-def handle_slash_response(ws, message, match_cmd, server_data):
+async def handle_slash_response(ws, message, match_cmd, server_data):
     user_id, error = _require_user_id(ws, "Authentication required")
     if error:
         return error
@@ -309,7 +308,7 @@ def handle_slash_response(ws, message, match_cmd, server_data):
         "user": user_id,
         "content": response or "",
         "timestamp": time.time(),
-        "id": str(uuid.uuid4()),
+        "id": snowflake.new_id(),
         "interaction": {
             "command": command,
             "username": invoker_username
@@ -319,7 +318,11 @@ def handle_slash_response(ws, message, match_cmd, server_data):
     if embeds:
         out_msg["embeds"] = embeds
 
-    channels.save_channel_message(channel, out_msg)
+    try:
+        await asyncio.wrap_future(channels.save_channel_message(channel, out_msg))
+    except OSError as e:
+        Logger.error(f"Failed to persist slash response {out_msg['id']}: {e}")
+        return {"cmd": "error", "val": "Failed to save message"}
     out_msg_for_client = channels.convert_messages_to_user_format([out_msg])
     out_msg_for_client = out_msg_for_client[0]
     out_msg_for_client["interaction"] = out_msg["interaction"]
@@ -1,7 +1,7 @@
-from db import users, roles
+from db import presence, users, roles
 from handlers.messages.helpers import _error, _require_user_id
 from handlers.helpers.validation import get_ws_username as _get_ws_username
-from handlers.websocket_utils import broadcast_to_all, _get_ws_attr, _set_ws_attr
+from handlers.websocket_utils import broadcast_to_all
 
 
 async def handle_status_set(ws, message, match_cmd, server_data):
@@ -14,6 +14,7 @@ async def handle_status_set(ws, message, match_cmd, server_data):
         return _error("Status is required", match_cmd)
 
     text = message.get("text")
+    previous_status = users.get_status(user_id).get("status", "online")
 
     if not users.set_status(user_id, status, text):
         return _error("Invalid status. Must be one of: online, idle, dnd, offline, invisible", match_cmd)
@@ -21,7 +22,6 @@ async def handle_status_set(ws, message, match_cmd, server_data):
     username = _get_ws_username(ws)
     status_data = {"status": status, "text": text or ""}
 
-    previous_status = _get_ws_attr(ws, "status", {}).get("status", "online")
     is_becoming_invisible = status == "invisible" and previous_status != "invisible"
     is_leaving_invisible = previous_status == "invisible" and status != "invisible"
     broadcast_status_get = None
@@ -57,8 +57,6 @@ async def handle_status_set(ws, message, match_cmd, server_data):
             "global": True
         }
 
-    _set_ws_attr(ws, "status", status_data)
-
     if broadcast_status_get:
         return broadcast_status_get
     return {"cmd": "status_set", "status": status_data, "global": True}
@@ -79,6 +77,8 @@ async def handle_status_get(ws, message, match_cmd, server_data):
 
     target_status = users.get_status(target_id)
     target_username = users.get_username_by_id(target_id)
+    # An invisible user's connections must not show through.
+    last_seen = presence.last_seen(target_id) if target_status.get("status") != "invisible" else None
 
-    return {"cmd": "status", "username": target_username, "status": target_status}
+    return {"cmd": "status", "username": target_username, "status": target_status, "last_seen": last_seen}
 
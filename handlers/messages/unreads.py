@@ -39,29 +39,35 @@ async def handle_unreads_ack(ws, message, server_data):
 
     if is_thread and thread_id:
         last_read: Optional[str] = None
+        seq: Optional[int] = None
         if message_id:
             last_read = message_id
+            seq = threads.get_thread_message_seq(thread_id, message_id)
         else:
             all_messages = threads.get_thread_messages(thread_id, 0, 1)
             if all_messages:
                 last_read = all_messages[0].get("id")
+                seq = all_messages[0].get("seq")
 
         if last_read:
-            unreads.set_last_read(user_id, last_read, thread_id=thread_id)
+            unreads.set_last_read(user_id, last_read, thread_id=thread_id, seq=seq)
             await _broadcast_unreads_update(ws, server_data, user_id, None, thread_id, last_read)
 
         return {"cmd": "unreads_ack", "thread_id": thread_id, "last_read": last_read}
     else:
         last_read = None
+        seq = None
         if message_id:
             last_read = message_id
+            seq = channels.get_channel_message_seq(channel, message_id)
         else:
             all_messages = channels.get_channel_messages(channel, 0, 1)
             if all_messages:
                 last_read = all_messages[0].get("id")
+                seq = all_messages[0].get("seq")
 
         if last_read:
-            unreads.set_last_read(user_id, last_read, channel=channel)
+            unreads.set_last_read(user_id, last_read, channel=channel, seq=seq)
             await _broadcast_unreads_update(ws, server_data, user_id, channel, None, last_read)
 
         return {"cmd": "unreads_ack", "channel": channel, "last_read": last_read}
@@ -77,8 +83,6 @@ async def handle_unreads_get(ws, message, server_data):
     if not user_roles:
         return _error("User roles not found", match_cmd)
 
-    all_unreads = unreads.get_all_last_reads(user_id)
-
     result = {}
 
     all_channels = channels.get_all_channels_for_roles(user_roles)
@@ -88,59 +92,25 @@ async def handle_unreads_get(ws, message, server_data):
         if channel_data.get("type") != "text":
             continue
 
-        last_read = all_unreads.get(channel_name)
-        msg_count = channels.get_channel_message_count(channel_name)
-
-        if last_read:
-            messages = channels.get_channel_messages(channel_name, 0, 10000)
-            unread_count = len(messages)
-            for i, msg in enumerate(messages):
-                if msg.get("id") == last_read:
-                    unread_count = len(messages) - i - 1
-                    break
-
-            result[channel_name] = {
-                "last_read": last_read,
-                "unread_count": unread_count,
-                "total_messages": msg_count
-            }
-        else:
-            result[channel_name] = {
-                "last_read": None,
-                "unread_count": msg_count,
-                "total_messages": msg_count
-            }
+        unread_count, last_read = unreads.get_unread_count_for_channel(user_id, channel_name)
+        result[channel_name] = {
+            "last_read": last_read,
+            "unread_count": unread_count,
+            "total_messages": channels.get_channel_message_count(channel_name)
+        }
 
         channel_threads = threads.get_channel_threads(channel_name)
         for thread_data in channel_threads:
             thread_id = thread_data.get("id")
             if not thread_id:
                 continue
-            thread_key = f"thread/{thread_id}"
-            thread_last_read = all_unreads.get(thread_key)
-            thread_messages = threads.get_thread_messages(thread_id, 0, 10000)
-            thread_msg_count = len(thread_messages)
-
-            if thread_last_read:
-                thread_unread_count = thread_msg_count
-                for i, msg in enumerate(thread_messages):
-                    if msg.get("id") == thread_last_read:
-                        thread_unread_count = len(thread_messages) - i - 1
-                        break
-
-                result[thread_key] = {
-                    "last_read": thread_last_read,
-                    "unread_count": thread_unread_count,
-                    "total_messages": thread_msg_count,
-                    "parent_channel": channel_name
-                }
-            else:
-                result[thread_key] = {
-                    "last_read": None,
-                    "unread_count": thread_msg_count,
-                    "total_messages": thread_msg_count,
-                    "parent_channel": channel_name
-                }
+            thread_unread_count, thread_last_read = unreads.get_unread_count_for_thread(user_id, thread_id)
+            result[f"thread/{thread_id}"] = {
+                "last_read": thread_last_read,
+                "unread_count": thread_unread_count,
+                "total_messages": threads.get_thread_message_count(thread_id),
+                "parent_channel": channel_name
+            }
 
     return {"cmd": "unreads_get", "unreads": result}
 
@@ -167,11 +137,12 @@ async def auto_ack_on_messages_get(ws, channel: Optional[str], thread_id: Option
 
     if all_messages:
         latest_id = all_messages[0].get("id")
+        seq = all_messages[0].get("seq")
         if latest_id:
             if thread_id:
-                unreads.set_last_read(user_id, latest_id, thread_id=thread_id)
+                unreads.set_last_read(user_id, latest_id, thread_id=thread_id, seq=seq)
             elif channel:
-                unreads.set_last_read(user_id, latest_id, channel=channel)
+                unreads.set_last_read(user_id, latest_id, channel=channel, seq=seq)
             await _broadcast_unreads_update(ws, server_data, user_id, channel, thread_id, latest_id)
 
 
@@ -219,26 +190,24 @@ async def handle_unreads_count(ws, message, server_data):
         if not ctx:
             return _error("Thread not found", match_cmd)
 
-        messages = threads.get_thread_messages(thread_id, 0, 10000)
-        unread_count, last_read = unreads.get_unread_count_for_thread(user_id, thread_id, messages)
+        unread_count, last_read = unreads.get_unread_count_for_thread(user_id, thread_id)
         return {
             "cmd": "unreads_count",
             "thread_id": thread_id,
             "unread_count": unread_count,
             "last_read": last_read,
-            "total_messages": len(messages)
+            "total_messages": threads.get_thread_message_count(thread_id)
         }
     else:
         _, error = _require_text_channel_access(user_id, channel)
         if error:
             return error
 
-        messages = channels.get_channel_messages(channel, 0, 10000)
-        unread_count, last_read = unreads.get_unread_count_for_channel(user_id, channel, messages)
+        unread_count, last_read = unreads.get_unread_count_for_channel(user_id, channel)
         return {
             "cmd": "unreads_count",
             "channel": channel,
             "unread_count": unread_count,
             "last_read": last_read,
-            "total_messages": len(messages)
+            "total_messages": channels.get_channel_message_count(channel)
         }
@@ -3,7 +3,7 @@ import sys
 import time
 import json
 
-from db import channels, users, roles
+from db import channels, snowflake, users, roles
 from handlers.websocket_utils import broadcast_to_all, send_to_client, _get_ws_attr
 from logger import Logger
 from plugins.plugin_utils import load_plugin_config, save_plugin_config
@@ -339,8 +339,6 @@ def contains_blocked_words(content):
 
 def send_mod_message(channel, content, server_data):
     """Send a moderation message to the channel"""
-    import uuid
-    
     from handlers.websocket_utils import broadcast_to_all
     import asyncio
     
@@ -348,11 +346,15 @@ def send_mod_message(channel, content, server_data):
         "user": "AutoMod",
         "content": content,
         "timestamp": time.time(),
-        "id": str(uuid.uuid4())
+        "id": snowflake.new_id()
     }
     
     # Save message to channel
-    channels.save_channel_message(channel, message)
+    try:
+        channels.save_channel_message(channel, message).result()
+    except OSError as e:
+        Logger.error(f"AutoMod: Failed to save message in #{channel}: {e}")
+        return
     
     # Broadcast to all users
     broadcast_msg = {
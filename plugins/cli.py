@@ -1,9 +1,8 @@
 import os
 import asyncio
 import time
-import uuid
 
-from db import channels, users, roles
+from db import channels, snowflake, users, roles
 from handlers.websocket_utils import broadcast_to_all, _get_ws_data, _get_ws_attr
 from logger import Logger
 
@@ -447,10 +446,14 @@ def send_message_to_channel(channel, content, server_data):
         "user": "OriginChats",
         "content": content.strip(),
         "timestamp": time.time(),
-        "id": str(uuid.uuid4())
+        "id": snowflake.new_id()
     }
     
-    channels.save_channel_message(channel, message)
+    try:
+        channels.save_channel_message(channel, message).result()
+    except OSError as e:
+        Logger.error(f"CLI: Failed to save message in #{channel}: {e}")
+        return
     
     if server_data and "connected_clients" in server_data:
         broadcast_msg = {
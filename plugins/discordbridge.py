@@ -7,7 +7,6 @@
 
 import os
 import sys
-import uuid
 import asyncio
 import time
 from pathlib import Path
@@ -26,7 +25,7 @@ from dotenv import load_dotenv
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from db import channels
+from db import channels, snowflake
 from logger import Logger
 from handlers.websocket_utils import broadcast_to_all
 import server
@@ -103,7 +102,7 @@ async def on_message(message):
         "user": message.author.name,
         "content": "https://github.com/fries-git/saltychatsserver/blob/main/plugins/bridgeicons/discord.png?raw=true" + " " + message.content,
         "timestamp": time.time(),
-        "id": str(uuid.uuid4())
+        "id": snowflake.new_id()
     }
     
     broadcast_message = {
@@ -114,9 +113,10 @@ async def on_message(message):
         }
     
     try:
-        saved = channels.save_channel_message(message.channel.name, sendmessage)
-        if not saved:
-            Logger.error(f"Failed to save message in shared channel '{message.channel.name}'")
+        try:
+            await asyncio.wrap_future(channels.save_channel_message(message.channel.name, sendmessage))
+        except OSError as e:
+            Logger.error(f"Failed to save message in shared channel '{message.channel.name}': {e}")
             return
 
         Logger.info(
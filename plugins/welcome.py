@@ -1,9 +1,10 @@
+import asyncio
 import os
 import sys
 import json
 import time
 
-from db import channels, users
+from db import channels, snowflake, users
 from logger import Logger
 from plugins.plugin_utils import load_plugin_config
 
@@ -88,16 +89,15 @@ async def on_user_join(ws, message_data, server_data=None):
         welcome_content = welcome_template.replace("{username}", username)
 
         # Create the welcome message
-        import uuid
         welcome_message = {
             "user": "originChats",
             "content": welcome_content,
             "timestamp": time.time(),
-            "id": str(uuid.uuid4())
+            "id": snowflake.new_id()
         }
 
         # Save to channel
-        channels.save_channel_message(welcome_channel, welcome_message)
+        await asyncio.wrap_future(channels.save_channel_message(welcome_channel, welcome_message))
 
         # Broadcast to all clients in the channel
         from handlers.websocket_utils import broadcast_to_all
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark the memory held by cached messages: plain dicts versus MessageRecord.
+
+Builds a synthetic channel history, serialises it to JSONL the way it is stored
+on disk, then measures (with tracemalloc) the memory taken by the parsed messages
+as plain dicts, as the cache used to hold them, and as MessageRecord objects.
+
+Usage:
+    python scripts/bench_message_memory.py [--messages N] [--users N]
+"""
+
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db.message_record import compact  # noqa: E402
+
+WORDS = "the a to and of is in it you that for on with this be are have just not what was".split()
+
+
+def build_lines(count: int, user_count: int) -> list:
+    rng = random.Random(42)
+    user_ids = [f"USR:{uuid.UUID(int=rng.getrandbits(128))}" for _ in range(user_count)]
+    lines = []
+    ids = []
+    now = time.time()
+    for i in range(count):
+        msg = {
+            "user": rng.choice(user_ids),
+            "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 25))),
+            "timestamp": now + i,
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        }
+        if ids and rng.random() < 0.1:
+            msg["reply_to"] = {"id": rng.choice(ids), "user": rng.choice(user_ids)}
+        if rng.random() < 0.05:
+            msg["reactions"] = {"👍": rng.sample(user_ids, rng.randint(1, 5))}
+        ids.append(msg["id"])
+        lines.append(json.dumps(msg, separators=(",", ":"), ensure_ascii=False))
+    return lines
+
+
+def measure(lines: list, convert) -> int:
+    gc.collect()
+    tracemalloc.start()
+    held = [convert(json.loads(line)) for line in lines]
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cached message memory")
+    parser.add_argument("--messages", type=int, default=200000, help="Number of messages")
+    parser.add_argument("--users", type=int, default=500, help="Number of distinct authors")
+    args = parser.parse_args()
+
+    lines = build_lines(args.messages, args.users)
+    as_dicts = measure(lines, lambda msg: msg)
+    as_records = measure(lines, compact)
+
+    print(f"messages:        {args.messages}")
+    print(f"dicts:           {as_dicts / 1024 / 1024:8.1f} MiB ({as_dicts / args.messages:6.0f} B/msg)")
+    print(f"MessageRecord:   {as_records / 1024 / 1024:8.1f} MiB ({as_records / args.messages:6.0f} B/msg)")
+    print(f"reduction:       {100 * (1 - as_records / as_dicts):8.1f} %")
+
+
+if __name__ == "__main__":
+    main()
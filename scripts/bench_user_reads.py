@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark user record reads: deepcopy per call versus read-only views.
+
+Builds a synthetic user table shaped like users.json, then times the read pattern
+of a channel broadcast (one user lookup per recipient to check their roles) with
+get_user copying each record, as it used to, and handing out MappingProxyType
+views of copy-on-write records, as it does now. Memory allocated per read is
+measured with tracemalloc.
+
+Usage:
+    python scripts/bench_user_reads.py [--users N] [--reads N]
+"""
+
+import argparse
+import copy
+import gc
+import random
+import time
+import tracemalloc
+import uuid
+from types import MappingProxyType
+
+ROLES = ["owner", "admin", "moderator", "member", "user", "verified", "artist", "bot"]
+
+
+def build_users(count: int) -> dict:
+    rng = random.Random(42)
+    users = {}
+    for i in range(count):
+        user_id = f"USR:{uuid.UUID(int=rng.getrandbits(128))}"
+        users[user_id] = {
+            "username": f"user{i}",
+            "nickname": f"Nick {i}" if rng.random() < 0.3 else None,
+            "roles": rng.sample(ROLES, rng.randint(1, 4)),
+            "status": {"status": rng.choice(["online", "idle", "dnd"]), "text": "working on it"},
+            "pfp_url": f"https://avatars.example/{i}.png",
+            "validator": uuid.UUID(int=rng.getrandbits(128)).hex,
+        }
+    return users
+
+
+def fan_out(users: dict, ids: list, get) -> int:
+    # What broadcast_to_channel_except does for recipients without cached roles.
+    allowed = 0
+    for user_id in ids:
+        user = get(users, user_id)
+        if "member" in user.get("roles", []):
+            allowed += 1
+    return allowed
+
+
+def get_copy(users: dict, user_id: str):
+    return copy.deepcopy(users[user_id])
+
+
+def get_view(users: dict, user_id: str):
+    return MappingProxyType(users[user_id])
+
+
+def measure(users: dict, ids: list, get) -> tuple:
+    gc.collect()
+    started = time.perf_counter()
+    fan_out(users, ids, get)
+    seconds = time.perf_counter() - started
+
+    sample = ids[:10000]
+    gc.collect()
+    tracemalloc.start()
+    held = [get(users, user_id) for user_id in sample]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return seconds, size / len(sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure get_user read cost")
+    parser.add_argument("--users", type=int, default=100000, help="Number of users")
+    parser.add_argument("--reads", type=int, default=500000, help="Number of get_user calls")
+    args = parser.parse_args()
+
+    users = build_users(args.users)
+    rng = random.Random(7)
+    user_ids = list(users)
+    ids = [rng.choice(user_ids) for _ in range(args.reads)]
+
+    copy_seconds, copy_bytes = measure(users, ids, get_copy)
+    view_seconds, view_bytes = measure(users, ids, get_view)
+
+    print(f"reads:           {args.reads}")
+    print(f"deepcopy:        {copy_seconds:8.3f} s ({1e6 * copy_seconds / args.reads:6.2f} us/read, {copy_bytes:6.0f} B/read)")
+    print(f"read-only view:  {view_seconds:8.3f} s ({1e6 * view_seconds / args.reads:6.2f} us/read, {view_bytes:6.0f} B/read)")
+    print(f"speed-up:        {copy_seconds / view_seconds:8.1f} x")
+
+
+if __name__ == "__main__":
+    main()
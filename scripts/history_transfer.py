@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Export and import channel or thread history as NDJSON.
+
+Export streams a history to a file, one JSON message per line after a header line,
+gzip- or xz-compressed when the file name ends in .gz or .xz. Import appends such a
+file to a channel or thread, keeping message ids and contents. Both read and write
+in batches, so memory use does not grow with the history.
+
+Progress is saved to <file>.export.cursor (or .import.cursor) after every batch; rerun with --resume to pick
+up where an interrupted run stopped. --rate caps messages per second.
+
+Export only reads, so it can run next to the server. Import writes history files,
+so stop the server first, or use the history_import command on a running server.
+
+Usage:
+    python scripts/history_transfer.py export --channel general -f general.ndjson.gz [--resume] [--rate 5000]
+    python scripts/history_transfer.py export --thread <thread_id> -f thread.ndjson
+    python scripts/history_transfer.py import --channel archive -f general.ndjson.gz [--resume] [--rate 5000]
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db import history_export  # noqa: E402
+from db import group_commit  # noqa: E402
+
+
+def cursor_path(path: str, action: str) -> str:
+    return f"{path}.{action}.cursor"
+
+
+def load_cursor(path: str, action: str) -> int:
+    try:
+        with open(cursor_path(path, action), "r") as f:
+            return int(json.load(f).get("seq", 0))
+    except (FileNotFoundError, ValueError, AttributeError):
+        return 0
+
+
+def save_cursor(path: str, action: str, seq: int) -> None:
+    tmp = cursor_path(path, action) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"seq": seq}, f)
+    os.replace(tmp, cursor_path(path, action))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import channel and thread history as NDJSON")
+    parser.add_argument("action", choices=("export", "import"))
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--channel", help="Channel name")
+    target.add_argument("--thread", help="Thread id")
+    parser.add_argument("-f", "--file", required=True, help="NDJSON file (.gz or .xz for compressed)")
+    parser.add_argument("--compression", choices=history_export.COMPRESSIONS, help="Override the compression picked from the file name")
+    parser.add_argument("--resume", action="store_true", help="Continue from the cursor saved by an interrupted run")
+    parser.add_argument("--rate", type=float, default=0, help="Maximum messages per second (0 for no limit)")
+    parser.add_argument("--batch", type=int, default=history_export.DEFAULT_BATCH_SIZE, help="Messages per batch")
+    args = parser.parse_args()
+
+    kind, name = ("thread", args.thread) if args.thread else ("channel", args.channel)
+    if not history_export.history_exists(kind, name):
+        print(f"{kind.capitalize()} {name} not found.")
+        sys.exit(1)
+
+    after_seq = load_cursor(args.file, args.action) if args.resume else 0
+
+    def progress(count: int, seq: int) -> None:
+        save_cursor(args.file, args.action, seq)
+        print(f"  {count} messages (cursor {seq})", end="\r", flush=True)
+
+    if args.action == "export":
+        if after_seq:
+            print(f"Resuming export of {kind} {name} after sequence number {after_seq}")
+        mode = "ab" if after_seq else "wb"
+        with history_export.open_export(args.file, mode, args.compression) as out:
+            count, seq = history_export.export_history(
+                kind, name, out, after_seq=after_seq, batch_size=args.batch, max_rate=args.rate, on_batch=progress,
+            )
+        print()
+        print(f"Exported {count} messages from {kind} {name} to {args.file}.")
+    else:
+        if not os.path.exists(args.file):
+            print(f"{args.file} not found.")
+            sys.exit(1)
+        if after_seq:
+            print(f"Resuming import into {kind} {name} after source sequence number {after_seq}")
+        with history_export.open_export(args.file, "rb", args.compression) as stream:
+            try:
+                count, seq = history_export.import_history(
+                    kind, name, history_export.read_export(stream),
+                    after_seq=after_seq, batch_size=args.batch, max_rate=args.rate, on_batch=progress,
+                )
+            except ValueError as e:
+                print(f"\nImport stopped: {e}")
+                sys.exit(1)
+        group_commit.flush()
+        print()
+        print(f"Imported {count} messages into {kind} {name}.")
+    save_cursor(args.file, args.action, seq)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Move channel and thread message history between storage backends.
+
+This script copies every channel and thread history from one backend to the
+other, keeping message sequence numbers so stored unread positions stay valid:
+
+    jsonl   db/channels/<name>.json and db/threadMessages/<id>.jsonl (+ segments)
+    sqlite  db/messages.db
+
+The source is left untouched, and histories that already hold messages in the
+target are skipped. Set storage.backend in config.json to the target afterwards.
+
+Usage:
+    python scripts/migrate_storage.py --to sqlite [--dry-run]
+    python scripts/migrate_storage.py --to jsonl [--dry-run]
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from db import storage  # noqa: E402
+from db.channels import channels_db_dir  # noqa: E402
+from db.threads import thread_messages_dir  # noqa: E402
+from db import message_log, sqlite_log  # noqa: E402
+from db.storage_utils import atomic_write_json  # noqa: E402
+
+KIND_DIRS = {
+    "channel": (channels_db_dir, ".json"),
+    "thread": (thread_messages_dir, ".jsonl"),
+}
+
+
+def history_path(kind: str, name: str) -> str:
+    directory, suffix = KIND_DIRS[kind]
+    return os.path.join(directory, name + suffix)
+
+
+def jsonl_histories() -> list:
+    found = []
+    for kind, (directory, suffix) in KIND_DIRS.items():
+        if not os.path.isdir(directory):
+            continue
+        for entry in sorted(os.listdir(directory)):
+            if entry.endswith(suffix) and os.path.isfile(os.path.join(directory, entry)):
+                found.append((kind, entry[: -len(suffix)]))
+    return found
+
+
+def sqlite_histories() -> list:
+    if not os.path.exists(storage.SQLITE_PATH):
+        return []
+    found = []
+    for key in sqlite_log.list_logs(storage.SQLITE_PATH):
+        kind, _, name = key.partition("/")
+        if kind in KIND_DIRS and name:
+            found.append((kind, name))
+    return found
+
+
+def write_jsonl(kind: str, name: str, messages, head_seq: int = 0) -> int:
+    """Write ``messages`` as the history's active file, then let MessageLog split it into segments.
+
+    ``head_seq`` is written to the manifest first, so sequence numbers of messages
+    deleted from the end of the source are not handed out again.
+    """
+    path = history_path(kind, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    store_dir = message_log.store_dir_for(path)
+    os.makedirs(store_dir, exist_ok=True)
+    atomic_write_json(os.path.join(store_dir, message_log.MANIFEST_NAME), {"version": 1, "head_seq": head_seq})
+    count = 0
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for message in messages:
+            f.write(json.dumps(message, separators=(",", ":"), ensure_ascii=False) + "\n")
+            count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    storage.open_log(kind, name, path, backend=storage.BACKEND_JSONL)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move message history between storage backends")
+    parser.add_argument("--to", required=True, choices=storage.BACKENDS, help="Backend to copy history into")
+    parser.add_argument("--dry-run", action="store_true", help="Show what would be migrated without doing it")
+    args = parser.parse_args()
+
+    source = storage.BACKEND_JSONL if args.to == storage.BACKEND_SQLITE else storage.BACKEND_SQLITE
+    histories = jsonl_histories() if source == storage.BACKEND_JSONL else sqlite_histories()
+
+    print("=" * 60)
+    print(f"Storage migration: {source} -> {args.to}")
+    print("=" * 60)
+    print()
+
+    if not histories:
+        print(f"No {source} message history found - nothing to migrate.")
+        return
+
+    total = 0
+    for kind, name in histories:
+        path = history_path(kind, name)
+        src = storage.open_log(kind, name, path, backend=source)
+        count = src.count()
+        if args.dry_run:
+            print(f"  Would migrate {kind} {name}: {count} messages")
+            continue
+
+        dst = storage.open_log(kind, name, path, backend=args.to)
+        if dst.count():
+            print(f"  Skipped {kind} {name}: target already has {dst.count()} messages")
+            continue
+        if args.to == storage.BACKEND_SQLITE:
+            migrated = dst.load(src.iter_messages(), head_seq=src.head_seq)
+        else:
+            migrated = write_jsonl(kind, name, src.iter_messages(), head_seq=src.head_seq)
+        total += migrated
+        print(f"  Migrated {kind} {name}: {migrated} messages")
+
+    print()
+    if args.dry_run:
+        print("DRY RUN - nothing was written")
+        return
+    sqlite_log.close_all()
+    print(f"Migrated {total} messages.")
+    print(f'Set "storage": {{"backend": "{args.to}"}} in config.json to use the new storage.')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import asyncio, json, os, secrets, uuid, time
+import asyncio, json, os, secrets, time
 from urllib.parse import unquote
 from aiohttp import web
 import aiohttp
@@ -7,7 +7,7 @@ from handlers.auth import handle_authentication, handle_cracked_auth, handle_cra
 from handlers import message as message_handler
 from handlers.rate_limiter import RateLimiter
 from handlers import github_webhook
-from db import serverEmojis, push as push_db, webhooks as webhooks_db, channels, users, roles, attachments as attachments_db, permissions as permissions_db, modlog as modlog_db
+from db import serverEmojis, push as push_db, webhooks as webhooks_db, channels, users, roles, attachments as attachments_db, permissions as permissions_db, modlog as modlog_db, cache_manager, group_commit, io_executor, presence, snowflake, warmup
 import watchers
 from plugin_manager import PluginManager
 from logger import Logger
@@ -24,7 +24,7 @@ class OriginChatsServer:
             self.config = json.load(f)
 
         self.connected_clients = set()
-        self.connected_usernames = {}
+        self.connected_usernames = presence.connected_usernames
         self._ws_data = {} # Store custom websocket data by ws id
         set_ws_data(self._ws_data)
         self.version = self.config["service"]["version"]
@@ -584,7 +584,7 @@ class OriginChatsServer:
                 text=json.dumps({"error": "No content provided"})
             ))
 
-        message_id = str(uuid.uuid4())
+        message_id = snowflake.new_id()
         out_msg = {
             "user": "originChats",
             "content": content,
@@ -600,7 +600,7 @@ class OriginChatsServer:
         if embeds:
             out_msg["embeds"] = embeds
 
-        channels.save_channel_message(channel_name, out_msg)
+        await asyncio.wrap_future(channels.save_channel_message(channel_name, out_msg))
 
         out_msg_for_client = channels.convert_messages_to_user_format([out_msg])[0]
 
@@ -795,16 +795,15 @@ class OriginChatsServer:
                     del self.slash_commands[ws_id]
 
                 if username in self.connected_usernames:
-                    self.connected_usernames[username] -= 1
-                    if self.connected_usernames[username] <= 0:
-                        del self.connected_usernames[username]
+                    remaining = presence.disconnect(user_id, username)
+                    if remaining == 0:
                         await broadcast_to_all(self.connected_clients, {
                             "cmd": "user_disconnect",
                             "username": username
                         }, {"_ws_data": self._ws_data})
                         Logger.success(f"Broadcast user_disconnect: {username}")
                     else:
-                        Logger.info(f"User {username} still has {self.connected_usernames[username]} active connection(s)")
+                        Logger.info(f"User {username} still has {remaining} active connection(s)")
 
         return ws
 
@@ -844,6 +843,7 @@ class OriginChatsServer:
 
         # Start the daily cleanup task
         self._cleanup_task = asyncio.create_task(self._daily_cleanup_task())
+        self._compaction_task = asyncio.create_task(self._periodic_compaction_task())
 
         max_upload_size = self.config.get("attachments", {}).get("max_size", 100 * 1024 * 1024)
         app = web.Application(client_max_size=max_upload_size)
@@ -869,6 +869,14 @@ class OriginChatsServer:
         # 404 handler for unknown HTTP routes
         app.router.add_get("/{path_info:.*}", self._route_404)
 
+        # Pre-load message history so the first clients don't pay for opening it
+        warmup_config = self.config.get("storage", {}).get("warmup", {})
+        if warmup_config.get("wait", False):
+            await asyncio.to_thread(warmup.run)
+            self._warmup_task = None
+        else:
+            self._warmup_task = asyncio.create_task(asyncio.to_thread(warmup.run))
+
         runner = web.AppRunner(app)
         await runner.setup()
         site = web.TCPSite(runner, host, port)
@@ -880,6 +888,12 @@ class OriginChatsServer:
             await asyncio.Future()  # run forever
         finally:
             self._cleanup_task.cancel()
+            self._compaction_task.cancel()
+            users.compact()
+            presence.save()
+            group_commit.flush()
+            io_executor.flush()
+            cache_manager.save_search_indexes()
             if self.file_observer:
                 self.file_observer.stop()
                 self.file_observer.join()
@@ -897,4 +911,26 @@ class OriginChatsServer:
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                Logger.error(f"Error in daily cleanup task: {e}")
\ No newline at end of file
+                Logger.error(f"Error in daily cleanup task: {e}")
+
+    async def _periodic_compaction_task(self):
+        """Reclaim space left by deleted and edited messages, archive cold history,
+        persist changed search indexes, fold the users change log and snapshot
+        presence, off the event loop."""
+        while True:
+            try:
+                interval = self.config.get("storage", {}).get("compaction", {}).get("interval_seconds", 60)
+                await asyncio.sleep(interval)
+                compacted = await asyncio.to_thread(cache_manager.compact_logs)
+                if compacted:
+                    Logger.info(f"Compaction: rewrote {compacted} message files")
+                archived = await asyncio.to_thread(cache_manager.archive_logs)
+                if archived:
+                    Logger.info(f"Archive: compressed {archived} message segments")
+                await asyncio.to_thread(cache_manager.save_search_indexes)
+                await asyncio.to_thread(users.compact)
+                presence.save()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                Logger.error(f"Error in compaction task: {e}")
\ No newline at end of file